@@ -54,7 +54,8 @@ setup(
     packages=['vc3client'],
     scripts=scripts,
     data_files=data_files,
-    install_requires=['requests', 'pyopenssl', 'cherrypy', 'pyyaml', 'vc3-infoservice']
+    install_requires=['requests', 'pyopenssl', 'cherrypy', 'pyyaml', 'vc3-infoservice'],
+    extras_require={'async' : ['trollius', 'futures']}
 )
 
 
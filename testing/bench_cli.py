@@ -0,0 +1,94 @@
+#!/bin/env python
+#
+#  Measures start-up time of the vc3-client command line for common invocations.
+#
+#  Each command is run --runs times as a separate process, against the in-process
+#  infoservice stand-in (a temporary SQLite store holding one user and one request),
+#  so the times are interpreter start-up, imports, argument parsing and client
+#  construction, without network. Prints one JSON object per command with the median
+#  and best wall time in ms and its exit code, and the interpreter's own start-up for
+#  reference, e.g.
+#
+#    python testing/bench_cli.py --runs 20 --target-ms 100
+#
+#  Exits 1 if a command's median is above --target-ms.
+#
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from optparse import OptionParser
+
+from vc3client.client import VC3ClientAPI
+
+from localclient import make_config
+
+# The installed entry point, which imports vc3client.clientcli (from its .pyc).
+CLI = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts', 'vc3-client')
+
+COMMANDS = [ [ '--help' ],
+             [ 'request-state', '--requestname', 'request1' ],
+             [ 'request-list', '--requestname', 'request1' ],
+             [ 'user-list', '--username', 'user1' ],
+             [ 'user-list' ],
+             ]
+
+
+def populate(confpath, storepath):
+    c = make_config(local={ 'path' : storepath })
+    with open(confpath, 'w') as f:
+        c.write(f)
+
+    capi = VC3ClientAPI(c)
+    capi.storeUser(capi.defineUser('user1', 'First', 'Last', 'test@test.edu', 'Computation Institute'))
+    capi.storeRequest(capi.defineRequest('request1', 'user1', 'cluster1', [], [], 'static-balanced', None, 'project1'))
+    capi.ic.close()
+
+
+def timeit(argv, runs):
+    '''
+    Returns (median ms, best ms, exit code of the last run).
+    '''
+    times = []
+    with open(os.devnull, 'w') as null:
+        for i in range(runs):
+            start = time.time()
+            code = subprocess.call(argv, stdout=null, stderr=null)
+            times.append((time.time() - start) * 1000)
+    times.sort()
+    return (round(times[len(times) // 2], 1), round(times[0], 1), code)
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage='%prog [OPTIONS]')
+    parser.add_option('--runs', dest='runs', type='int', default=10,
+                      help='invocations per command')
+    parser.add_option('--target-ms', dest='target', type='float', default=None,
+                      help='fail if the median of any command is above this')
+    (options, args) = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        confpath = os.path.join(tmpdir, 'vc3-client.conf')
+        populate(confpath, os.path.join(tmpdir, 'store.sqlite'))
+
+        (median, best, code) = timeit([ sys.executable, '-c', 'pass' ], options.runs)
+        print(json.dumps({ 'command' : 'python -c pass', 'median_ms' : median, 'best_ms' : best }, sort_keys=True))
+
+        over = []
+        for command in COMMANDS:
+            (median, best, code) = timeit([ sys.executable, CLI, '-c', confpath ] + command, options.runs)
+            print(json.dumps({ 'command' : ' '.join(command), 'median_ms' : median, 'best_ms' : best, 'exit' : code }, sort_keys=True))
+            if options.target is not None and median > options.target:
+                over.append(command)
+    finally:
+        shutil.rmtree(tmpdir)
+
+    if over:
+        sys.stderr.write("above %s ms: %s\n" % (options.target, ', '.join([ ' '.join(c) for c in over ])))
+        sys.exit(1)
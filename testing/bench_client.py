@@ -0,0 +1,190 @@
+#!/bin/env python
+#
+#  Benchmarks VC3ClientAPI calls at registry scale against the in-process
+#  infoservice stand-in (vc3client.localinfo).
+#
+#  For each size N the registry holds N users, 5N allocations, N/10 projects,
+#  N/10 clusters and 10N requests. Each operation is timed over --iterations calls
+#  and reported as one JSON object per line (size, latency, op, calls, ops_per_sec,
+#  p50_ms, p95_ms, max_ms, infoservice_calls), e.g.
+#
+#    python testing/bench_client.py --sizes 1000,10000 --latency-ms 0,5 > results.ndjson
+#
+#  Compare two such files between releases to catch regressions.
+#
+
+import itertools
+import json
+import logging
+import random
+import sys
+import time
+
+from optparse import OptionParser
+
+from localclient import make_client
+
+# Suffix of names of entities created while timing, unique across sizes and latencies.
+serial = itertools.count()
+
+
+def populate(capi, size):
+    '''
+    Fills the registry for size N. Returns dict of the names created, by kind.
+    '''
+    names = { 'users' : [], 'allocations' : [], 'projects' : [], 'clusters' : [], 'requests' : [] }
+    latency = capi.ic.latency
+    capi.ic.latency = 0
+    entities = []
+    for i in xrange(size):
+        u = capi.defineUser('user%d' % i, 'First', 'Last', 'user%d@example.org' % i, 'Organization')
+        entities.append(u)
+        names['users'].append(u.name)
+        for j in xrange(5):
+            a = capi.defineAllocation('alloc%d.%d' % (i, j), u.name, 'resource%d' % j, 'account%d' % i)
+            a.state = 'validated' if j == 0 else 'new'
+            entities.append(a)
+            names['allocations'].append(a.name)
+
+    for p in xrange(max(size / 10, 1)):
+        owner = 'user%d' % (p * 10 % size)
+        members = [ 'user%d' % ((p * 10 + k) % size) for k in xrange(10) ]
+        po = capi.defineProject('project%d' % p, owner, members)
+        po.allocations = [ 'alloc%d.0' % (p * 10 % size) ]
+        entities.append(po)
+        names['projects'].append(po.name)
+
+        ns = capi.defineNodeset('nodeset%d' % p, owner, 4, 'htcondor', 'worker-nodes')
+        entities.append(ns)
+        co = capi.defineCluster('cluster%d' % p, owner, [ ns.name ])
+        entities.append(co)
+        names['clusters'].append(co.name)
+
+    for r in xrange(size * 10):
+        p = r % len(names['projects'])
+        owner = 'user%d' % (p * 10 % size)
+        ro = capi.defineRequest('request%d' % r, owner, 'cluster%d' % p, [ 'alloc%d.0' % (p * 10 % size) ],
+                                [], 'static-balanced', None, 'project%d' % p)
+        entities.append(ro)
+        names['requests'].append(ro.name)
+
+    capi.ic.storeentities(entities)
+    capi.ic.latency = latency
+    return names
+
+
+def teardown_request(capi, i):
+    '''
+    Creates a request with a cloned cluster of 10 nodesets, ready for deleteRequest.
+    '''
+    latency = capi.ic.latency
+    capi.ic.latency = 0
+    nodesets = [ capi.defineNodeset('teardown%d.%d' % (i, k), 'user0', 1, 'htcondor', 'worker-nodes') for k in xrange(10) ]
+    cluster = capi.defineCluster('teardown%d' % i, 'user0', [ n.name for n in nodesets ])
+    request = capi.defineRequest('teardown%d' % i, 'user0', cluster.name, [ 'alloc0.0' ], [],
+                                 'static-balanced', None, 'project0')
+    capi.ic.storeentities(nodesets + [ cluster, request ])
+    capi.ic.latency = latency
+    return request.name
+
+
+def operations(capi, names, size):
+    '''
+    Returns list of (label, function of iteration number) to time.
+    '''
+    rnd = random.Random(size)
+    pick = lambda kind: rnd.choice(names[kind])
+    owner = lambda p: 'user%d' % (int(p[len('project'):]) * 10 % size)
+
+    def store_cluster_policy(i):
+        p = pick('projects')
+        co = capi.defineCluster('bench-cluster%d' % serial.next(), owner(p), [])
+        capi.storeCluster(co, policy_user=owner(p))
+
+    def store_request_policy(i):
+        p = pick('projects')
+        ro = capi.defineRequest('bench-request%d' % serial.next(), owner(p), 'cluster0', [ 'alloc%d.0' % (int(p[len('project'):]) * 10 % size) ],
+                                [], 'static-balanced', None, p)
+        capi.storeRequest(ro, policy_user=owner(p))
+
+    def update_request(i):
+        ro = capi.getRequest(pick('requests'))
+        ro.description = 'updated %d' % i
+        capi.storeRequest(ro)
+
+    def delete_request(i):
+        capi.deleteRequest(teardown_request(capi, serial.next()))
+
+    return [ ('listUsers', lambda i: capi.listUsers()),
+             ('listAllocations', lambda i: capi.listAllocations()),
+             ('listRequests', lambda i: capi.listRequests()),
+             ('listRequests(fields)', lambda i: capi.listRequests(fields=[ 'state', 'owner' ])),
+             ('getUser', lambda i: capi.getUser(pick('users'))),
+             ('getRequest', lambda i: capi.getRequest(pick('requests'))),
+             ('getRequests(20)', lambda i: capi.getRequests([ pick('requests') for k in xrange(20) ])),
+             ('storeUser', lambda i: capi.storeUser(capi.defineUser('bench-user%d' % serial.next(), 'F', 'L', 'e@example.org', 'O'))),
+             ('storeRequest(update)', update_request),
+             ('storeCluster(policy_user)', store_cluster_policy),
+             ('listClusters(policy_user)', lambda i: capi.listClusters(policy_user=owner(pick('projects')))),
+             ('storeRequest(policy_user)', store_request_policy),
+             ('deleteRequest(cascade)', delete_request),
+             ]
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    k = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[k]
+
+
+def measure(capi, label, op, iterations):
+    timings = []
+    calls = capi.ic.calls
+    start = time.time()
+    for i in xrange(iterations):
+        t = time.time()
+        op(i)
+        timings.append(time.time() - t)
+    total = time.time() - start
+    timings.sort()
+    return { 'op' : label,
+             'calls' : iterations,
+             'ops_per_sec' : round(iterations / total, 2) if total > 0 else None,
+             'p50_ms' : round(percentile(timings, 0.5) * 1000, 3),
+             'p95_ms' : round(percentile(timings, 0.95) * 1000, 3),
+             'max_ms' : round(timings[-1] * 1000, 3),
+             'infoservice_calls' : capi.ic.calls - calls,
+             }
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage='%prog [OPTIONS]')
+    parser.add_option('--sizes', dest='sizes', default='100,1000',
+                      help='comma-separated registry sizes N (N users, 5N allocations, 10N requests)')
+    parser.add_option('--latency-ms', dest='latencies', default='0',
+                      help='comma-separated injected infoservice latencies, in milliseconds')
+    parser.add_option('--iterations', dest='iterations', type='int', default=20,
+                      help='calls timed per operation')
+    parser.add_option('--ops', dest='ops', default=None,
+                      help='comma-separated subset of operations to run')
+    (options, args) = parser.parse_args()
+    logging.basicConfig(level=logging.ERROR)
+
+    capi = make_client()
+    for size in [ int(s) for s in options.sizes.split(',') ]:
+        capi.ic.clear()
+        capi.eligibility.invalidate()
+        start = time.time()
+        names = populate(capi, size)
+        sys.stderr.write("size %d: populated in %.1fs\n" % (size, time.time() - start))
+
+        for latency in [ float(l) for l in options.latencies.split(',') ]:
+            capi.ic.latency = latency / 1000.0
+            for (label, op) in operations(capi, names, size):
+                if options.ops is not None and label not in options.ops.split(','):
+                    continue
+                result = measure(capi, label, op, options.iterations)
+                result.update({ 'size' : size, 'latency_ms' : latency })
+                print(json.dumps(result, sort_keys=True))
+                sys.stdout.flush()
@@ -0,0 +1,95 @@
+#!/bin/env python
+#
+#  Micro-benchmark of entity decoding/encoding: generated codecs (vc3client.codec)
+#  versus the generic InfoEntity.objectFromDict/makeDictObject.
+#
+#    python testing/bench_codec.py -n 100000
+#
+#  Also checks both paths produce the same attributes.
+#
+
+import gc
+import json
+import logging
+import time
+
+from optparse import OptionParser
+
+from vc3infoservice.core import InfoEntity
+
+from vc3client import entities
+
+
+def documents(count):
+    '''
+    Returns (entityclass, list of {name : attributes}) as read from an infoservice listing.
+    '''
+    docs = {}
+    docs[entities.User] = [ { 'user%d' % i : { 'name' : 'user%d' % i, 'state' : 'new', 'first' : 'First',
+                                               'last' : 'Last', 'email' : 'user@example.org',
+                                               'organization' : 'Organization', 'identity_id' : 'id-%d' % i,
+                                               'description' : None, 'displayname' : 'User %d' % i,
+                                               'sshpubstring' : None, 'url' : None, 'docurl' : None } }
+                            for i in xrange(count) ]
+    docs[entities.Nodeset] = [ { 'nodeset%d' % i : { 'name' : 'nodeset%d' % i, 'state' : 'running', 'owner' : 'user%d' % i,
+                                                     'node_number' : '4', 'app_type' : 'htcondor', 'app_role' : 'worker-nodes',
+                                                     'app_peaceful' : True, 'app_lingertime' : '600', 'app_killorder' : 'newest',
+                                                     'environment' : None, 'description' : None, 'displayname' : None,
+                                                     'url' : None, 'docurl' : None, 'nodeinfo' : 'small',
+                                                     'app_host' : None, 'app_port' : None, 'app_sectoken' : None,
+                                                     'state_reason' : 'new' } }
+                               for i in xrange(count) ]
+    docs[entities.Request] = [ { 'request%d' % i : { 'name' : 'request%d' % i, 'state' : 'running', 'owner' : 'user%d' % i,
+                                                     'action' : 'run', 'state_reason' : None, 'expiration' : None,
+                                                     'cluster' : 'cluster%d' % i, 'project' : 'project%d' % i,
+                                                     'allocations' : [ 'alloc%d' % i ], 'environments' : [],
+                                                     'policy' : 'static-balanced', 'statusraw' : None, 'statusinfo' : None,
+                                                     'displayname' : None, 'description' : None, 'url' : None,
+                                                     'docurl' : None, 'queuesconf' : None, 'authconf' : None,
+                                                     'headnode' : None, 'cluster_state' : 'new',
+                                                     'cluster_state_reason' : None } }
+                               for i in xrange(count) ]
+    return docs
+
+
+def timeit(func, items):
+    # As the timeit module does, keep the garbage collector out of the measurement.
+    gc.collect()
+    gc.disable()
+    try:
+        start = time.time()
+        out = [ func(item) for item in items ]
+        return (time.time() - start, out)
+    finally:
+        gc.enable()
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage='%prog [OPTIONS]')
+    parser.add_option('-n', dest='count', type='int', default=100000,
+                      help='number of documents decoded per class')
+    (options, args) = parser.parse_args()
+    logging.basicConfig(level=logging.WARN)
+
+    for (entityclass, docs) in documents(options.count).items():
+        # Keep only the attributes this version of the class declares.
+        docs = [ dict([ (n, dict([ (a, d[n].get(a)) for a in entityclass.infoattributes ])) ]) for d in docs for n in d ]
+
+        generic = lambda doc: InfoEntity.objectFromDict.im_func(entityclass, doc)
+        (tgeneric, objs) = timeit(generic, docs)
+        (tgenerated, genobjs) = timeit(entityclass.objectFromDict, docs)
+        (tgenericenc, gdicts) = timeit(lambda o: InfoEntity.makeDictObject(o), objs)
+        (tgeneratedenc, dicts) = timeit(lambda o: o.makeDictObject(), genobjs)
+
+        if gdicts != dicts:
+            raise Exception("%s: generated codec output differs from objectFromDict" % entityclass.__name__)
+
+        print(json.dumps({ 'class' : entityclass.__name__,
+                           'count' : len(docs),
+                           'decode_generic_per_second' : int(len(docs) / tgeneric),
+                           'decode_generated_per_second' : int(len(docs) / tgenerated),
+                           'decode_speedup' : round(tgeneric / tgenerated, 2),
+                           'encode_generic_per_second' : int(len(docs) / tgenericenc),
+                           'encode_generated_per_second' : int(len(docs) / tgeneratedenc),
+                           'encode_speedup' : round(tgenericenc / tgeneratedenc, 2),
+                           }))
@@ -0,0 +1,88 @@
+#!/bin/env python
+#
+#  Measures entity construction throughput and memory.
+#
+#  Builds N entities of each class (as a listing of that size would) and reports
+#  entities/second and the growth of the resident set size. To compare with an older
+#  entities.py, extract it and pass it with --entities, e.g.
+#
+#    git show <rev>:vc3client/entities.py > /tmp/entities_old.py
+#    python testing/bench_entities.py -n 100000 --entities /tmp/entities_old.py
+#    python testing/bench_entities.py -n 100000
+#
+#  Each run should be a separate process, so that RSS figures are not mixed.
+#
+
+import gc
+import imp
+import json
+import logging
+import os
+import time
+
+from optparse import OptionParser
+
+
+def rss_kb():
+    '''
+    Current resident set size in KB (Linux), falling back to the peak RSS.
+    '''
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / 1024
+    except (IOError, ValueError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def builders(entities):
+    '''
+    One constructor call per class, with the attributes a typical stored entity has.
+    '''
+    return [
+        ('User', lambda i: entities.User('user%d' % i, 'new', 'First', 'Last', 'user@example.org',
+                                         'Organization', identity_id='id-%d' % i, displayname='User %d' % i)),
+        ('Project', lambda i: entities.Project('project%d' % i, 'new', 'user%d' % i, ['user%d' % i, 'other'],
+                                               allocations=['alloc%d' % i], blueprints=[])),
+        ('Allocation', lambda i: entities.Allocation('alloc%d' % i, 'validated', 'user%d' % i, 'resource', 'account')),
+        ('Nodeset', lambda i: entities.Nodeset('nodeset%d' % i, 'running', 'user%d' % i, 4, 'htcondor', 'worker-nodes')),
+        ('Cluster', lambda i: entities.Cluster('cluster%d' % i, 'new', 'user%d' % i, ['nodeset%d' % i])),
+        ('Request', lambda i: entities.Request('request%d' % i, 'running', 'user%d' % i, action='run',
+                                               cluster='cluster%d' % i, project='project%d' % i,
+                                               allocations=['alloc%d' % i], environments=[])),
+        ]
+
+
+if __name__ == '__main__':
+    parser = OptionParser(usage='%prog [OPTIONS]')
+    parser.add_option('-n', dest='count', type='int', default=100000,
+                      help='number of entities built per class')
+    parser.add_option('--entities', dest='entities', default=None,
+                      help='path of an alternative entities.py to measure')
+    parser.add_option('--debug', dest='debug', action='store_true', default=False,
+                      help='measure with debug logging enabled')
+    (options, args) = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if options.debug else logging.WARN)
+    if options.entities:
+        entities = imp.load_source('bench_entities_module', options.entities)
+    else:
+        from vc3client import entities
+
+    for (name, build) in builders(entities):
+        gc.collect()
+        before = rss_kb()
+        start = time.time()
+        objs = [ build(i) for i in xrange(options.count) ]
+        elapsed = time.time() - start
+        after = rss_kb()
+        print(json.dumps({ 'class' : name,
+                           'count' : options.count,
+                           'seconds' : round(elapsed, 3),
+                           'per_second' : int(options.count / elapsed),
+                           'rss_kb' : after - before,
+                           'bytes_per_entity' : int((after - before) * 1024.0 / options.count),
+                           'module' : options.entities or 'vc3client.entities',
+                           }))
+        del objs
@@ -0,0 +1,33 @@
+"""
+Clients for the tests and benchmarks, on the in-process infoservice stand-in
+(vc3client.localinfo).
+"""
+
+import ConfigParser
+
+from vc3client.client import VC3ClientAPI
+
+
+def make_config(**sections):
+    '''
+    Returns configuration selecting the local backend, with the options given for each
+    section added to it, e.g.
+
+        make_config(local={ 'path' : '/tmp/store.sqlite' }, instrument={ 'enabled' : 'true' })
+    '''
+    c = ConfigParser.SafeConfigParser()
+    c.add_section('netcomm')
+    c.set('netcomm', 'backend', 'local')
+    for (section, options) in sections.items():
+        if not c.has_section(section):
+            c.add_section(section)
+        for (option, value) in options.items():
+            c.set(section, option, str(value))
+    return c
+
+
+def make_client(**sections):
+    '''
+    Returns VC3ClientAPI configured by make_config(**sections).
+    '''
+    return VC3ClientAPI(make_config(**sections))
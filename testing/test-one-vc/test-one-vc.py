@@ -85,12 +85,10 @@ class VCTester(object):
 
         request = self.client.defineRequest(name=self.name, owner=self.owner, cluster=self.name, project=self.project, allocations=[self.allocation], environments=None, policy=None, expiration=expiration, displayname=self.name)
 
-        try:
-            self.client.storeRequest(request)
-            self.client.storeCluster(cluster)
-            self.client.storeNodeset(nodeset)
-        except Exception as E:
-            raise E
+        with self.client.batch() as b:
+            b.store(nodeset)
+            b.store(cluster)
+            b.store(request)
 
     def _execute_stop(self, *args):
         if self.request is None:
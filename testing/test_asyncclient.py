@@ -0,0 +1,123 @@
+"""
+asyncio front-end (vc3client.asyncclient), run on the trollius backport
+"""
+
+import unittest
+import threading
+
+import trollius as asyncio
+from trollius import From, Return
+
+from vc3client.asyncclient import AsyncVC3ClientAPI, AsyncWriteBatch, RequestEvents
+from vc3client.batch import BatchError
+from vc3client.entities import User
+
+from localclient import make_client
+
+
+class TestAsyncClient(unittest.TestCase):
+
+    def setUp(self):
+        capi = make_client()
+        capi.ic.clear()
+        entities = [ capi.defineUser('user%d' % i, 'First', 'Last', 'test@test.edu', 'Computation Institute')
+                     for i in range(5) ]
+        entities.append(capi.defineRequest('request', 'user0', 'cluster', [], [], 'static-balanced', None, 'project'))
+        capi.ic.storeentities(entities)
+        self.loop = asyncio.new_event_loop()
+        self.capi = AsyncVC3ClientAPI(capi.config, loop=self.loop, capi=capi, workers=4)
+
+    def tearDown(self):
+        self.capi.close()
+        self.loop.close()
+
+    def complete(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def testCalls(self):
+        capi = self.capi
+
+        @asyncio.coroutine
+        def work():
+            users = yield From(asyncio.gather(*[ capi.getUser('user%d' % i) for i in range(5) ], loop=self.loop))
+            names = yield From(capi.query(User, state='new', fields=[ 'name' ]))
+            requests = yield From(capi.iterRequests())
+            u = capi.defineUser('new', 'First', 'Last', 'test@test.edu', 'Computation Institute')
+            yield From(capi.storeUser(u))
+            raise Return((users, names, requests))
+
+        (users, names, requests) = self.complete(work())
+        self.assertEqual([ u.name for u in users ], [ 'user%d' % i for i in range(5) ])
+        self.assertEqual(len(names), 5)
+        self.assertEqual([ r.name for r in requests ], [ 'request' ])
+        self.assertEqual(self.capi.capi.getUser('new').first, 'First')
+
+    def testBatch(self):
+        capi = self.capi
+        threads = []
+        storeentities = capi.capi._storeentities
+
+        def storing(entities):
+            threads.append(threading.current_thread())
+            return storeentities(entities)
+
+        capi.capi._storeentities = storing
+
+        @asyncio.coroutine
+        def work():
+            b = capi.batch()
+            self.assertTrue(isinstance(b, AsyncWriteBatch))
+            b.store(capi.defineUser('new1', 'First', 'Last', 'test@test.edu', 'Computation Institute'))
+            b.delete(User, 'user1')
+            results = yield From(b.flush())
+            raise Return(results)
+
+        try:
+            results = self.complete(work())
+        finally:
+            del capi.capi._storeentities
+        self.assertEqual([ (r.operation, r.status) for r in results ], [ ('store', 'done'), ('delete', 'done') ])
+        # The stores ran on the thread pool, not on the event loop's thread.
+        self.assertFalse(threading.current_thread() in threads)
+        self.assertEqual(capi.capi.getUser('new1').first, 'First')
+
+        b = capi.batch()
+        b.delete(User, 'nosuchuser')
+        self.assertRaises(BatchError, self.complete, b.flush())
+
+    def testSnapshot(self):
+        capi = self.capi
+
+        @asyncio.coroutine
+        def work():
+            view = yield From(capi.withSnapshot())
+            self.assertTrue(view.executor is capi.executor)
+            yield From(capi.deleteUser('user4'))
+            user = yield From(view.getUser('user4'))
+            raise Return(user)
+
+        self.assertEqual(self.complete(work()).name, 'user4')
+
+    def testWatch(self):
+        capi = self.capi
+        r = capi.capi.getRequest('request')
+        r.state = 'terminated'
+        capi.capi.storeRequest(r)
+
+        @asyncio.coroutine
+        def work():
+            events = capi.watchRequests([ 'request' ], mininterval=0.01, untilfinal=True)
+            self.assertTrue(isinstance(events, RequestEvents))
+            seen = []
+            while True:
+                event = yield From(events.next())
+                if event is None:
+                    break
+                seen.append(event)
+            raise Return(seen)
+
+        self.assertEqual([ (e['request'], e['state']) for e in self.complete(work()) ], [ ('request', 'terminated') ])
+
+
+if __name__ == '__main__':
+    unittest.main()
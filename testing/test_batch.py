@@ -0,0 +1,117 @@
+"""
+Dependency-ordered writes with rollback (vc3client.batch.WriteBatch)
+"""
+
+import unittest
+
+from vc3client.batch import BatchError
+from vc3client.entities import Cluster, Nodeinfo, Nodeset, Request, User
+
+from localclient import make_client
+
+
+class TestWriteBatch(unittest.TestCase):
+
+    def setUp(self):
+        capi = make_client()
+        capi.ic.clear()
+        capi.ic.storeentities([ capi.defineUser('owner', 'First', 'Last', 'test@test.edu', 'Computation Institute'),
+                                capi.defineProject('project', 'owner', [ 'owner' ]),
+                                capi.defineNodeset('oldnodeset', 'owner', 1, 'htcondor', 'worker-nodes'),
+                                capi.defineCluster('oldcluster', 'owner', [ 'oldnodeset' ]),
+                                capi.defineRequest('oldrequest', 'owner', 'oldcluster', [], [],
+                                                   'static-balanced', None, 'project') ])
+        self.capi = capi
+
+        # Records the order operations reach the client, one entry per rank.
+        self.calls = []
+        storeentities = capi._storeentities
+        deleteentity = capi._deleteentity
+
+        def store(entities):
+            self.calls.append(('store', sorted([ e.__class__.__name__ for e in entities ])))
+            return storeentities(entities)
+
+        def delete(entityclass, name):
+            self.calls.append(('delete', [ entityclass.__name__ ]))
+            return deleteentity(entityclass, name)
+
+        capi._storeentities = store
+        capi._deleteentity = delete
+
+    def define(self, suffix):
+        capi = self.capi
+        return [ capi.defineRequest('request' + suffix, 'owner', 'cluster' + suffix, [], [],
+                                    'static-balanced', None, 'project'),
+                 capi.defineCluster('cluster' + suffix, 'owner', [ 'nodeset' + suffix ]),
+                 capi.defineNodeset('nodeset' + suffix, 'owner', 1, 'htcondor', 'worker-nodes'),
+                 capi.defineNodeinfo('nodeinfo' + suffix, 'owner') ]
+
+    def testOrder(self):
+        with self.capi.batch() as b:
+            for entity in self.define('1'):
+                b.store(entity)
+            b.delete(Nodeset, 'oldnodeset')
+            b.delete(Request, 'oldrequest')
+            b.delete(Cluster, 'oldcluster')
+        self.assertEqual(self.calls, [ ('delete', [ 'Request' ]),
+                                       ('delete', [ 'Cluster' ]),
+                                       ('delete', [ 'Nodeset' ]),
+                                       ('store', [ 'Nodeinfo' ]),
+                                       ('store', [ 'Nodeset' ]),
+                                       ('store', [ 'Cluster' ]),
+                                       ('store', [ 'Request' ]) ])
+        self.assertTrue(all([ r.ok for r in b.results ]))
+        self.assertEqual(self.capi.getRequest('request1').cluster, 'cluster1')
+        self.assertEqual(self.capi.ic.listentities(Request)[0].name, 'request1')
+
+    def testRollback(self):
+        project = self.capi.getProject('project')
+        project.addUser('member')
+        entities = self.define('2')
+        # Already exists: the store of the request rank fails.
+        entities[0].name = 'oldrequest'
+        try:
+            with self.capi.batch() as b:
+                b.store(project)
+                results = [ b.store(e) for e in entities ]
+            self.fail('BatchError not raised')
+        except BatchError, e:
+            self.assertEqual(e.results, b.results)
+        self.assertEqual([ r.status for r in results ], [ 'failed', 'rolledback', 'rolledback', 'rolledback' ])
+
+        # Entities created by the batch are deleted again, most dependent first,
+        # while updates of existing ones stay.
+        self.assertEqual(self.calls[-3:], [ ('delete', [ 'Cluster' ]),
+                                            ('delete', [ 'Nodeset' ]),
+                                            ('delete', [ 'Nodeinfo' ]) ])
+        for (entityclass, name) in [ (Cluster, 'cluster2'), (Nodeset, 'nodeset2'), (Nodeinfo, 'nodeinfo2') ]:
+            self.assertEqual([ e.name for e in self.capi.ic.listentities(entityclass) if e.name == name ], [])
+        self.assertEqual(b.results[0].status, 'done')
+        self.assertTrue('member' in self.capi.getProject('project').members)
+        self.assertEqual(self.capi.getRequest('oldrequest').cluster, 'oldcluster')
+
+    def testFailedDelete(self):
+        try:
+            with self.capi.batch() as b:
+                delete = b.delete(User, 'nosuchuser')
+                store = b.store(self.define('3')[3])
+            self.fail('BatchError not raised')
+        except BatchError:
+            pass
+        self.assertEqual((delete.status, store.status), ('failed', 'skipped'))
+        self.assertEqual([ c for c in self.calls if c[0] == 'store' ], [])
+
+    def testDiscardOnException(self):
+        try:
+            with self.capi.batch() as b:
+                b.store(self.define('4')[3])
+                raise KeyError('x')
+        except KeyError:
+            pass
+        self.assertEqual(self.calls, [])
+        self.assertEqual(b.results[0].status, 'skipped')
+
+
+if __name__ == '__main__':
+    unittest.main()
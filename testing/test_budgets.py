@@ -0,0 +1,177 @@
+"""
+Infoservice round-trip budgets of the VC3ClientAPI methods
+
+Each public method may make at most the number of infoservice calls declared in
+BUDGETS, with and without policy_user. A change that adds a call to one of these
+paths (a repeated fetch, a listing inside a loop, ...) fails here and must either
+be fixed or come with a raised budget.
+
+Runs against the in-process infoservice stand-in (vc3client.localinfo), counting
+calls with vc3client.instrument.
+"""
+
+import unittest
+
+from vc3client.client import PermissionDenied
+
+from localclient import make_client
+
+
+# (method, called with policy_user) -> maximum infoservice calls. Callables get the
+# call's (args, kwargs). Policy checks assume the eligibility index is enabled and
+# loaded, as it is after the first check (see testColdPolicyCheck).
+BUDGETS = {
+    ('getUser', False) : 1,
+    ('getProject', False) : 1,
+    ('getCluster', False) : 1,
+    ('getRequest', False) : 1,
+    ('getRequest', True) : 1,
+    ('getRequests', False) : lambda args, kwargs: len(set(args[0])),
+    ('getRequests', True) : lambda args, kwargs: len(set(args[0])),
+    ('listUsers', False) : 1,
+    ('listRequests', False) : 1,
+    ('listClusters', True) : 2,              # getUser, listing
+    ('listProjects', True) : 2,
+    ('storeUser', False) : 1,
+    ('storeProject', True) : 1,
+    ('storeCluster', False) : 1,
+    ('storeCluster', True) : 2,              # getUser, store
+    ('storeRequest', False) : 1,
+    ('storeRequest', True) : 2,              # getProject, store
+    ('addUserToProject', True) : 2,          # getProject, store
+    ('removeUserFromProject', True) : 2,
+    ('addNodesetToCluster', True) : 3,       # getCluster, storeCluster
+    ('removeNodesetFromCluster', True) : 3,
+    ('terminateRequest', True) : 2,
+    # getRequest, getCluster, then one delete per nodeset, the cluster and the request
+    ('deleteRequest', True) : lambda args, kwargs: 5 + NODESETS,
+    ('getRequestStatusSummary', False) : 1,
+    ('getFleetStatus', False) : 1,
+    ('getQueuesConf', False) : 1,
+    ('getAllQueuesConf', False) : 1,
+}
+
+NODESETS = 3
+
+
+class BudgetExceeded(AssertionError):
+    pass
+
+
+class BudgetedClient(object):
+    '''
+    Wraps VC3ClientAPI (created with [instrument] enabled) and raises BudgetExceeded
+    whenever a call of a method in budgets makes more infoservice calls than allowed.
+    Other attributes are passed through.
+    '''
+
+    def __init__(self, capi, budgets):
+        self.capi = capi
+        self.budgets = budgets
+
+    def __getattr__(self, name):
+        method = getattr(self.capi, name)
+        if not callable(method):
+            return method
+
+        def call(*args, **kwargs):
+            key = (name, kwargs.get('policy_user') is not None)
+            if key not in self.budgets:
+                raise BudgetExceeded("No budget declared for %s(policy_user=%s)" % key)
+            budget = self.budgets[key]
+            if callable(budget):
+                budget = budget(args, kwargs)
+            before = self.capi.instrument.roundtrips(name)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                used = self.capi.instrument.roundtrips(name) - before
+                if used > budget:
+                    raise BudgetExceeded("%s(policy_user=%s) made %d infoservice calls, budget is %d"
+                                         % (key + (used, budget)))
+        return call
+
+
+class TestRoundTripBudgets(unittest.TestCase):
+
+    def setUp(self):
+        capi = make_client(instrument={ 'enabled' : 'true', 'payload' : 'false' },
+                           cache={ 'eligibility_ttl' : 60 })
+        capi.ic.clear()
+        self.capi = capi
+        self.client = BudgetedClient(capi, BUDGETS)
+
+        entities = []
+        for name in ('owner', 'member'):
+            entities.append(capi.defineUser(name, 'First', 'Last', 'test@test.edu', 'Computation Institute'))
+        allocation = capi.defineAllocation('owner.resource', 'owner', 'resource', 'account')
+        allocation.state = 'validated'
+        project = capi.defineProject('project', 'owner', [ 'owner', 'member' ])
+        project.allocations = [ allocation.name ]
+        nodesets = [ capi.defineNodeset('nodeset%d' % i, 'owner', 1, 'htcondor', 'worker-nodes') for i in range(NODESETS) ]
+        cluster = capi.defineCluster('cluster', 'owner', [ n.name for n in nodesets ])
+        request = capi.defineRequest('request', 'owner', cluster.name, [ allocation.name ], [],
+                                     'static-balanced', None, project.name)
+        request.queuesconf = capi.encode('[owner.resource]\nenabled = True\n')
+        entities += [ allocation, project, cluster, request ] + nodesets
+        capi.ic.storeentities(entities)
+
+        # Loads the eligibility index, outside of any budget.
+        capi.listClusters(policy_user='owner')
+
+    def testReads(self):
+        c = self.client
+        c.getUser('owner')
+        c.getProject('project')
+        c.getCluster('cluster')
+        c.getRequest('request')
+        c.getRequest('request', policy_user='owner')
+        c.getRequest('request', policy_user='owner', fields=[ 'state' ])
+        self.assertRaises(PermissionDenied, c.getRequest, 'request', policy_user='member')
+        c.getRequests([ 'request', 'request', 'nosuchrequest' ])
+        c.listUsers()
+        c.listRequests()
+        c.listClusters(policy_user='owner')
+        c.listProjects(policy_user='member')
+        c.getRequestStatusSummary('request')
+        c.getFleetStatus()
+        c.getQueuesConf('request', 'owner.resource')
+        c.getAllQueuesConf('request')
+
+    def testWrites(self):
+        c = self.client
+        c.storeUser(self.capi.defineUser('new', 'First', 'Last', 'test@test.edu', 'Computation Institute'))
+        c.storeCluster(self.capi.defineCluster('newcluster', 'owner', []), policy_user='owner')
+        c.addNodesetToCluster('nodeset0', 'newcluster', policy_user='owner')
+        c.removeNodesetFromCluster('nodeset0', 'newcluster', policy_user='owner')
+        c.addUserToProject('new', 'project', policy_user='owner')
+        c.removeUserFromProject('new', 'project', policy_user='owner')
+        self.assertEqual(self.capi.getProject('project').members, [ 'owner', 'member' ])
+
+        r = self.capi.defineRequest('newrequest', 'owner', 'cluster', [ 'owner.resource' ], [],
+                                    'static-balanced', None, 'project')
+        c.storeRequest(r, policy_user='owner')
+        c.terminateRequest('newrequest', policy_user='owner')
+        self.assertEqual(self.capi.getRequest('newrequest').action, 'terminate')
+        c.deleteRequest('request', policy_user='owner')
+
+    def testColdPolicyCheck(self):
+        # A fresh eligibility index is loaded with one listing of allocations (the
+        # owner has a validated one, so projects need not be listed). With the default
+        # eligibility_ttl of 0 every policy check costs this.
+        self.capi.eligibility.invalidate()
+        budgets = dict(BUDGETS)
+        budgets[('storeCluster', True)] = 3
+        c = BudgetedClient(self.capi, budgets)
+        c.storeCluster(self.capi.defineCluster('newcluster', 'owner', []), policy_user='owner')
+
+    def testBudgetExceeded(self):
+        budgets = dict(BUDGETS)
+        budgets[('deleteRequest', True)] = 4
+        c = BudgetedClient(self.capi, budgets)
+        self.assertRaises(BudgetExceeded, c.deleteRequest, 'request', policy_user='owner')
+        self.assertRaises(BudgetExceeded, c.deleteCluster, 'cluster')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+Read-through entity cache (vc3client.cache)
+"""
+
+import unittest
+import time
+
+from vc3client.cache import EntityCache, LRUCache
+from vc3client.entities import Request, User
+
+from localclient import make_client
+
+
+def make_user(name):
+    return User(name, 'new', 'First', 'Last', 'test@test.edu', 'Computation Institute')
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def testEviction(self):
+        lru = LRUCache(maxsize=3)
+        for k in ('a', 'b', 'c'):
+            lru.put(k, k.upper())
+        # a becomes the most recently used, so b is evicted next.
+        self.assertEqual(lru.get('a'), 'A')
+        lru.put('d', 'D')
+        self.assertEqual(lru.get('b'), None)
+        self.assertEqual([ lru.get(k) for k in ('a', 'c', 'd') ], [ 'A', 'C', 'D' ])
+        lru.put('c', 'C2')
+        lru.put('e', 'E')
+        self.assertEqual(lru.get('a'), None)
+        self.assertEqual(lru.get('c'), 'C2')
+        self.assertEqual(len(lru), 3)
+        stats = lru.stats()
+        self.assertEqual((stats['evictions'], stats['misses']), (2, 2))
+
+    def testTTL(self):
+        lru = LRUCache()
+        lru.put('short', 1, ttl=0.05)
+        lru.put('long', 2, ttl=60)
+        lru.put('forever', 3)
+        self.assertEqual(lru.get('short'), 1)
+        time.sleep(0.1)
+        self.assertEqual(lru.get('short', 'gone'), 'gone')
+        self.assertEqual((lru.get('long'), lru.get('forever')), (2, 3))
+        self.assertEqual(lru.stats()['expirations'], 1)
+
+    def testInvalidate(self):
+        lru = LRUCache()
+        for k in [ ('User', 'a'), ('User', 'b'), ('Request', 'a') ]:
+            lru.put(k, k)
+        lru.popmatching(lambda k: k[0] == 'User')
+        lru.pop(('nosuch', 'key'))
+        self.assertEqual(len(lru), 1)
+        self.assertEqual(lru.stats()['invalidations'], 2)
+
+
+class TestEntityCache(unittest.TestCase):
+
+    def testCopies(self):
+        cache = EntityCache()
+        cache.put(User, make_user('a'))
+        u = cache.get(User, 'a')
+        u.first = 'Changed'
+        self.assertEqual(cache.get(User, 'a').first, 'First')
+        self.assertEqual(cache.get(User, 'b'), None)
+
+    def testTTLs(self):
+        cache = EntityCache(ttls={ 'request' : 0 })
+        cache.put(User, make_user('a'))
+        cache.put(Request, Request('r', 'new', 'owner', action='run'))
+        self.assertNotEqual(cache.get(User, 'a'), None)
+        self.assertEqual(cache.get(Request, 'r'), None)
+        cache.invalidate(User)
+        self.assertEqual(cache.get(User, 'a'), None)
+
+    def testReadThrough(self):
+        capi = make_client(cache={ 'enabled' : 'true' })
+        capi.ic.clear()
+        capi.storeUser(capi.defineUser('a', 'First', 'Last', 'test@test.edu', 'Computation Institute'))
+        calls = capi.ic.calls
+        capi.getUser('a')
+        capi.getUser('a')
+        self.assertEqual(capi.ic.calls - calls, 1)
+
+        # Stores through the client drop the cached copy.
+        u = capi.getUser('a')
+        u.first = 'Changed'
+        capi.storeUser(u)
+        self.assertEqual(capi.getUser('a').first, 'Changed')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+"""
+Request queues/auth confs decoded and parsed once per stored blob (VC3ClientAPI.getQueuesConf & co.)
+"""
+
+import unittest
+import ConfigParser
+
+from localclient import make_client
+
+
+QUEUESCONF = '''[q1]
+enabled = True
+dir = %(base)s/q1
+base = /var/lib/vc3
+
+[q2]
+dir = %(missing)s/q2
+'''
+
+
+class TestConf(unittest.TestCase):
+
+    def setUp(self):
+        capi = make_client()
+        capi.ic.clear()
+        r = capi.defineRequest('r1', 'owner', 'cluster', [], [], 'static-balanced', None, 'project')
+        r.queuesconf = capi.encode(QUEUESCONF)
+        r.authconf = capi.encode('not an ini file\n')
+        capi.ic.storeentities([ r ])
+        self.capi = capi
+
+    def testSections(self):
+        capi = self.capi
+        # Only the section asked for is interpolated: q2's bad reference does not matter.
+        self.assertEqual(dict(capi.getQueuesConf('r1', 'q1')),
+                         { 'enabled' : 'True', 'dir' : '/var/lib/vc3/q1', 'base' : '/var/lib/vc3' })
+        self.assertRaises(ConfigParser.InterpolationMissingOptionError, capi.getQueuesConf, 'r1', 'q2')
+        self.assertRaises(ConfigParser.NoSectionError, capi.getQueuesConf, 'r1', 'q3')
+        self.assertRaises(ConfigParser.InterpolationMissingOptionError, capi.getAllQueuesConf, 'r1')
+
+    def testConfString(self):
+        capi = self.capi
+        # The text is returned as stored, whether or not it parses.
+        self.assertEqual(capi.getConfString('auth', 'r1'), 'not an ini file\n')
+        self.assertEqual(capi.getConfString('queues', 'r1'), QUEUESCONF)
+        self.assertRaises(ConfigParser.MissingSectionHeaderError, capi.getAuthConf, 'r1', 'q1')
+
+    def testChanged(self):
+        capi = self.capi
+        self.assertEqual(dict(capi.getQueuesConf('r1', 'q1'))['enabled'], 'True')
+        r = capi.getRequest('r1')
+        r.queuesconf = capi.encode('[q1]\nenabled = False\n')
+        capi.storeRequest(r)
+        self.assertEqual(capi.getQueuesConf('r1', 'q1'), [ ('enabled', 'False') ])
+        self.assertEqual(capi.getAllQueuesConf('r1').keys(), [ 'q1' ])
+
+
+if __name__ == '__main__':
+    unittest.main()
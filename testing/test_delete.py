@@ -0,0 +1,95 @@
+"""
+Request teardown with its cloned cluster and nodesets (VC3ClientAPI.deleteRequests)
+"""
+
+import unittest
+
+from vc3client.client import CascadeDeleteError, PermissionDenied
+from vc3client.entities import Cluster, Nodeset, Request
+from vc3infoservice.core import InfoEntityMissingException
+
+from localclient import make_client
+
+
+class TestDeleteRequests(unittest.TestCase):
+
+    def setUp(self):
+        capi = make_client()
+        capi.ic.clear()
+        entities = []
+        for r in ('r1', 'r2', 'r3'):
+            nodesets = [ '%s-n%d' % (r, i) for i in range(3) ]
+            entities += [ capi.defineNodeset(n, 'owner', 1, 'htcondor', 'worker-nodes') for n in nodesets ]
+            entities.append(capi.defineCluster(r + '-cluster', 'owner', nodesets))
+            entities.append(capi.defineRequest(r, 'owner', r + '-cluster', [], [], 'static-balanced', None, 'project'))
+        capi.ic.storeentities(entities)
+        self.capi = capi
+
+        # Records deletes as they reach the infoservice, failing those named in self.failing.
+        self.deleted = []
+        self.failing = set()
+        deleteentity = capi.ic.deleteentity
+
+        def delete(entityclass, name):
+            self.deleted.append((entityclass.__name__, name))
+            if name in self.failing:
+                raise IOError('connection reset')
+            return deleteentity(entityclass, name)
+
+        capi.ic.deleteentity = delete
+
+    def tearDown(self):
+        del self.capi.ic.deleteentity
+
+    def names(self, entityclass):
+        return sorted([ e.name for e in self.capi.ic.listentities(entityclass) ])
+
+    def testOnePassPerKind(self):
+        self.assertEqual(self.capi.deleteRequests([ 'r1', 'r2', 'r1' ]), {})
+        kinds = [ k for (k, n) in self.deleted ]
+        self.assertEqual(kinds, [ 'Nodeset' ] * 6 + [ 'Cluster' ] * 2 + [ 'Request' ] * 2)
+        self.assertEqual(self.names(Request), [ 'r3' ])
+        self.assertEqual(self.names(Cluster), [ 'r3-cluster' ])
+        self.assertEqual(len(self.names(Nodeset)), 3)
+
+    def testPartialFailure(self):
+        self.failing.add('r1-n1')
+        errors = self.capi.deleteRequests([ 'r1', 'r2' ])
+        self.assertEqual(errors.keys(), [ 'r1' ])
+        e = errors['r1']
+        self.assertTrue(isinstance(e, CascadeDeleteError))
+        self.assertEqual(e.requestname, 'r1')
+        self.assertEqual([ (c, n) for (c, n, x) in e.errors ], [ (Nodeset, 'r1-n1') ])
+        self.assertTrue(isinstance(e.errors[0][2], IOError))
+
+        # r1 and its cluster are kept, with the nodeset that could not be deleted.
+        self.assertEqual(self.names(Request), [ 'r1', 'r3' ])
+        self.assertEqual(self.names(Cluster), [ 'r1-cluster', 'r3-cluster' ])
+        self.assertEqual([ n for n in self.names(Nodeset) if n.startswith('r1') ], [ 'r1-n1' ])
+
+        # Deleting again retries the rest; children already gone count as deleted.
+        self.failing = set()
+        self.capi.deleteRequest('r1')
+        self.assertEqual(self.names(Request), [ 'r3' ])
+        self.assertEqual(self.names(Cluster), [ 'r3-cluster' ])
+
+    def testFailedCluster(self):
+        self.failing.add('r1-cluster')
+        self.assertRaises(CascadeDeleteError, self.capi.deleteRequest, 'r1')
+        self.assertEqual(self.names(Request), [ 'r1', 'r2', 'r3' ])
+        self.assertEqual([ n for n in self.names(Nodeset) if n.startswith('r1') ], [])
+
+    def testErrors(self):
+        r = self.capi.getRequest('r3')
+        r.owner = 'other'
+        self.capi.storeRequest(r)
+        errors = self.capi.deleteRequests([ 'r2', 'r3', 'nosuchrequest' ], policy_user='owner')
+        self.assertEqual(sorted(errors.keys()), [ 'nosuchrequest', 'r3' ])
+        self.assertTrue(isinstance(errors['r3'], PermissionDenied))
+        self.assertTrue(isinstance(errors['nosuchrequest'], InfoEntityMissingException))
+        self.assertEqual(self.names(Request), [ 'r1', 'r3' ])
+        self.assertRaises(PermissionDenied, self.capi.deleteRequest, 'r3', policy_user='owner')
+
+
+if __name__ == '__main__':
+    unittest.main()
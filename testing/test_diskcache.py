@@ -0,0 +1,198 @@
+"""
+On-disk entity cache shared across client processes (vc3client.diskcache)
+"""
+
+import unittest
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from vc3client import diskcache
+from vc3client.diskcache import CacheFile, DiskCache, writefile
+from vc3client.entities import Request, User
+from vc3client.localinfo import LocalInfoClient
+
+from localclient import make_client
+
+
+def make_cached_client(cachedir, refresh=False):
+    return make_client(diskcache={ 'enabled' : 'true', 'path' : cachedir, 'refresh' : refresh })
+
+
+class TestCacheFile(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'user.cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testLookup(self):
+        records = [ ('user%d' % i, json.dumps({ 'first' : 'First%d' % i })) for i in range(1000) ]
+        writefile(self.path, records, time.time(), True)
+        cf = CacheFile(self.path)
+        try:
+            self.assertEqual(json.loads(cf.lookup('user517')), { 'first' : 'First517' })
+            self.assertEqual(cf.lookup(u'user999'), records[999][1])
+            self.assertEqual(cf.lookup('nosuchuser'), None)
+            self.assertEqual(sorted(cf.records()), sorted(records))
+            self.assertTrue(cf.complete)
+        finally:
+            cf.close()
+
+    def testReplace(self):
+        writefile(self.path, [ ('a', '1') ], time.time(), False)
+        cf = CacheFile(self.path)
+        try:
+            writefile(self.path, [ ('a', '2') ], time.time(), False)
+            # The open mapping still reads the file as it was.
+            self.assertEqual(cf.lookup('a'), '1')
+        finally:
+            cf.close()
+        cf = CacheFile(self.path)
+        self.assertEqual(cf.lookup('a'), '2')
+        cf.close()
+
+    def testInvalid(self):
+        with open(self.path, 'w') as f:
+            f.write('VC3')
+        self.assertRaises(ValueError, CacheFile, self.path)
+        cache = DiskCache(self.tmpdir)
+        self.assertEqual(cache.get(User, 'user'), None)
+
+    def testTruncated(self):
+        cache = DiskCache(self.tmpdir)
+        path = cache._path(User)
+        records = [ ('user%d' % i, json.dumps({ 'first' : 'First%d' % i })) for i in range(100) ]
+
+        # Header only: the slots are missing.
+        writefile(path, records, time.time(), True)
+        with open(path, 'r+') as f:
+            f.truncate(40)
+        self.assertRaises(ValueError, CacheFile, path)
+        self.assertEqual(cache.get(User, 'user1'), None)
+
+        # Slots complete, records missing.
+        writefile(path, records, time.time(), True)
+        cf = CacheFile(path)
+        end = cf._start + 10
+        cf.close()
+        with open(path, 'r+') as f:
+            f.truncate(end)
+        cf = CacheFile(path)
+        self.assertRaises(ValueError, cf.lookup, 'user50')
+        cf.close()
+        self.assertEqual(cache.get(User, 'user50'), None)
+        self.assertEqual(cache.documents(User), None)
+
+
+class TestDiskCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.capi = make_cached_client(self.tmpdir)
+        self.capi.ic.clear()
+        for name in ('user1', 'user2'):
+            self.capi.storeUser(self.capi.defineUser(name, 'First', 'Last', 'test@test.edu', 'Computation Institute'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def testShared(self):
+        self.capi.listUsers()
+        self.assertEqual(self.capi.getUser('user1').first, 'First')
+
+        # Another process: only the files are shared.
+        other = make_cached_client(self.tmpdir)
+        other.ic = LocalInfoClient()
+        calls = other.ic.calls
+        self.assertEqual(other.getUser('user1').first, 'First')
+        self.assertEqual(sorted([ u.name for u in other.listUsers() ]), [ 'user1', 'user2' ])
+        self.assertEqual(other.ic.calls, calls)
+
+        # Writes through a client update the files.
+        u = self.capi.getUser('user1')
+        u.first = 'Changed'
+        self.capi.storeUser(u)
+        self.capi.deleteUser('user2')
+        self.assertEqual(other.getUser('user1').first, 'Changed')
+        self.assertEqual([ u.name for u in other.listUsers() ], [ 'user1' ])
+
+        self.assertEqual(make_cached_client(self.tmpdir, refresh=True).diskcache.get(User, 'user1'), None)
+
+    def testTruncatedFallsBack(self):
+        self.capi.listUsers()
+        with open(self.capi.diskcache._path(User), 'r+') as f:
+            f.truncate(40)
+        other = make_cached_client(self.tmpdir)
+        self.assertEqual(other.getUser('user1').first, 'First')
+
+    def testRewrites(self):
+        written = []
+
+        def counting(path, records, created, complete):
+            written.append(len(records))
+            return writefile(path, records, created, complete)
+
+        diskcache.writefile = counting
+        try:
+            self.capi.listUsers()
+            self.assertEqual(written, [ 2 ])
+
+            # One rewrite for the entities stored together.
+            users = [ self.capi.defineUser('new%d' % i, 'First', 'Last', 'test@test.edu', 'Computation Institute')
+                      for i in range(3) ]
+            self.assertEqual(self.capi._storeentities(users), [ None ] * 3)
+            self.assertEqual(written, [ 2, 5 ])
+
+            # Fetching an entity missing from a fresh file does not rewrite it.
+            self.capi.ic.storeentities([ self.capi.defineUser('other', 'First', 'Last', 'test@test.edu',
+                                                              'Computation Institute') ])
+            self.assertEqual(make_cached_client(self.tmpdir).getUser('other').name, 'other')
+            self.assertEqual(written, [ 2, 5 ])
+        finally:
+            diskcache.writefile = writefile
+
+    def testConcurrentUpdates(self):
+        self.capi.listUsers()
+        caches = [ make_cached_client(self.tmpdir).diskcache for i in range(8) ]
+        users = [ self.capi.defineUser('new%d' % i, 'First', 'Last', 'test@test.edu', 'Computation Institute')
+                  for i in range(len(caches)) ]
+        threads = [ threading.Thread(target=c.entityStored, args=(u,)) for (c, u) in zip(caches, users) ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # Each update read the file as left by the previous one: none is lost.
+        self.assertEqual(len(self.capi.diskcache.documents(User)), 2 + len(users))
+
+    def testFreshRequests(self):
+        r = self.capi.defineRequest('request', 'user1', 'cluster', [], [], 'static-balanced', None, 'project')
+        self.capi.storeRequest(r)
+        self.capi.listRequests()
+        r = self.capi.ic.getentity(Request, 'request')
+        (r.state, r.state_reason, r.statusraw) = ('running', 'started', '{"f" : {"n" : {"q" : {"running" : 3}}}}')
+        self.capi.ic.storeentities([ r ])
+
+        # Polls of request states read the infoservice, not the cached listing.
+        other = make_cached_client(self.tmpdir)
+        self.assertEqual(other.getRequestState('request'), ('running', 'started'))
+        self.assertEqual(other.getRequestStatusSummary('request').totals['running'], 3)
+        events = other.watchRequests(owner='user1')
+        self.assertEqual(events.next()['state'], 'running')
+        events.close()
+
+    def testStale(self):
+        self.capi.listUsers()
+        self.capi.diskcache.ttl = 0.05
+        time.sleep(0.1)
+        self.assertEqual(self.capi.diskcache.get(User, 'user1'), None)
+        self.assertEqual(self.capi.diskcache.documents(User), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+"""
+Policy checks answered from the eligibility index (vc3client.index.EligibilityIndex)
+"""
+
+import unittest
+
+from vc3client.client import PermissionDenied
+
+from localclient import make_client
+
+
+class TestEligibility(unittest.TestCase):
+
+    def setUp(self):
+        capi = make_client()
+        capi.ic.clear()
+        for name in ('owner', 'member'):
+            capi.storeUser(capi.defineUser(name, 'First', 'Last', 'test@test.edu', 'Computation Institute'))
+        a = capi.defineAllocation('owner.resource', 'owner', 'resource', 'account')
+        capi.storeAllocation(a)
+        a = capi.getAllocation('owner.resource')
+        a.state = 'validated'
+        capi.storeAllocation(a)
+        capi.storeProject(capi.defineProject('project', 'owner', [ 'member' ]))
+        # Another client sharing the same infoservice.
+        self.other = make_client()
+
+    def revoke(self):
+        a = self.other.getAllocation('owner.resource')
+        a.state = 'new'
+        self.other.storeAllocation(a)
+        p = self.other.getProject('project')
+        p.removeUser('member')
+        self.other.storeProject(p)
+
+    def testLive(self):
+        capi = make_client()
+        capi.defineProject('p2', 'owner', [], policy_user='owner')
+        capi.listClusters(policy_user='member')
+
+        # Changes made by other clients are seen on the next check.
+        self.revoke()
+        self.assertRaises(PermissionDenied, capi.defineProject, 'p2', 'owner', [], policy_user='owner')
+        self.assertRaises(PermissionDenied, capi.listClusters, policy_user='member')
+
+    def testScan(self):
+        capi = make_client()
+        listed = []
+        getdocumentobject = capi.ic.getdocumentobject
+        capi.ic.getdocumentobject = lambda key: listed.append(key) or getdocumentobject(key)
+        try:
+            capi.listClusters(policy_user='owner')
+            capi.listClusters(policy_user='member')
+        finally:
+            del capi.ic.getdocumentobject
+        # Without a snapshot no index is built, and owner's validated allocation
+        # answers the check before projects are listed.
+        self.assertEqual(listed, [ 'allocation', 'cluster', 'allocation', 'project', 'cluster' ])
+        self.assertTrue(capi.eligibility.allocationsStale() and capi.eligibility.projectsStale())
+
+    def testSnapshot(self):
+        capi = make_client(cache={ 'eligibility_ttl' : 60 })
+        capi.defineProject('p2', 'owner', [], policy_user='owner')
+        capi.listClusters(policy_user='member')
+        calls = capi.ic.calls
+        capi.listClusters(policy_user='member')
+        capi.defineProject('p2', 'owner', [], policy_user='owner')
+        # The user lookup and the cluster listing, not the allocation and project listings.
+        self.assertEqual(capi.ic.calls - calls, 2)
+
+        # Opting in, changes made elsewhere are not seen until the snapshot expires...
+        self.revoke()
+        capi.defineProject('p2', 'owner', [], policy_user='owner')
+        capi.eligibility.invalidate()
+        self.assertRaises(PermissionDenied, capi.defineProject, 'p2', 'owner', [], policy_user='owner')
+
+        # ... but changes made through the client are seen at once.
+        a = capi.getAllocation('owner.resource')
+        a.state = 'validated'
+        capi.storeAllocation(a)
+        capi.defineProject('p2', 'owner', [], policy_user='owner')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+"""
+Attribution of infoservice calls to API methods (vc3client.instrument)
+"""
+
+import unittest
+import types
+
+from vc3client.instrument import NOAPI
+
+from localclient import make_client
+
+
+class TestAttribution(unittest.TestCase):
+
+    def setUp(self):
+        capi = make_client(instrument={ 'enabled' : 'true', 'payload' : 'false' })
+        capi.ic.clear()
+        capi.ic.storeentities([ capi.defineUser('user%d' % i, 'First', 'Last', 'test@test.edu',
+                                                'Computation Institute') for i in range(3) ])
+        r = capi.defineRequest('request', 'user0', 'cluster', [], [], 'static-balanced', None, 'project')
+        r.state = 'terminated'
+        capi.ic.storeentities([ r ])
+        capi.instrument.reset()
+        self.capi = capi
+
+    def testMethods(self):
+        self.capi.getUser('user1')
+        self.capi.getUsers([ 'user1', 'user2' ])
+        self.assertEqual(self.capi.instrument.roundtrips('getUser'), 1)
+        self.assertEqual(self.capi.instrument.roundtrips('getUsers'), 2)
+        self.assertEqual(self.capi.instrument.roundtrips(NOAPI), 0)
+
+    def testGenerators(self):
+        users = self.capi.iterUsers()
+        self.assertTrue(isinstance(users, types.GeneratorType))
+        self.assertEqual(self.capi.instrument.roundtrips(), 0)
+        self.assertEqual(len(list(users)), 3)
+        self.assertEqual(self.capi.instrument.roundtrips('iterUsers'), 1)
+
+        events = list(self.capi.watchRequests([ 'request' ], untilfinal=True))
+        self.assertEqual([ e['state'] for e in events ], [ 'terminated' ])
+        self.assertEqual(self.capi.instrument.roundtrips('watchRequests'), 1)
+        self.assertEqual(self.capi.instrument.roundtrips(NOAPI), 0)
+
+        # Between items, the calls of the consumer are its own.
+        users = self.capi.iterUsers(fields=[ 'first' ])
+        users.next()
+        self.capi.getUser('user0')
+        users.close()
+        self.assertEqual(self.capi.instrument.roundtrips('getUser'), 1)
+        self.assertEqual(self.capi.instrument.roundtrips('iterUsers'), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""
+Listings decoded one entity at a time (VC3ClientAPI._iterentities and the iterX methods)
+"""
+
+import unittest
+import types
+
+from vc3client.entities import User
+from vc3client.projection import Projection
+
+from localclient import make_client
+
+
+class TestIterEntities(unittest.TestCase):
+
+    def setUp(self):
+        capi = make_client()
+        capi.ic.clear()
+        capi.ic.storeentities([ capi.defineUser('user%d' % i, 'First%d' % i, 'Last', 'test@test.edu',
+                                                'Computation Institute') for i in range(10) ])
+        self.capi = capi
+
+    def testIter(self):
+        capi = self.capi
+        calls = capi.ic.calls
+        users = capi.iterUsers()
+        self.assertTrue(isinstance(users, types.GeneratorType))
+        # Nothing is retrieved until the first entity is asked for.
+        self.assertEqual(capi.ic.calls, calls)
+
+        first = users.next()
+        self.assertTrue(isinstance(first, User))
+        rest = list(users)
+        self.assertEqual(capi.ic.calls - calls, 1)
+        listed = dict([ (u.name, u.first) for u in capi.listUsers() ])
+        self.assertEqual(dict([ (u.name, u.first) for u in [ first ] + rest ]), listed)
+        self.assertEqual(len(listed), 10)
+
+    def testDecodedOnDemand(self):
+        decoded = []
+        objectFromDict = User.__dict__['objectFromDict']
+
+        def counting(cls, d):
+            decoded.append(d.keys()[0])
+            return objectFromDict.__func__(cls, d)
+
+        User.objectFromDict = classmethod(counting)
+        try:
+            users = self.capi.iterUsers()
+            users.next()
+            users.next()
+            self.assertEqual(len(decoded), 2)
+            users.close()
+        finally:
+            User.objectFromDict = objectFromDict
+
+    def testFields(self):
+        capi = self.capi
+        calls = capi.ic.calls
+        users = sorted(capi.iterUsers(fields=[ 'first' ]), key=lambda u: u.name)
+        self.assertEqual(capi.ic.calls - calls, 1)
+        self.assertTrue(isinstance(users[3], Projection))
+        self.assertEqual((users[3].name, users[3].first), ('user3', 'First3'))
+
+        # Other attributes are loaded with the entity on first access.
+        self.assertEqual(users[3].email, 'test@test.edu')
+        self.assertEqual(capi.ic.calls - calls, 2)
+        self.assertRaises(ValueError, list, capi.iterUsers(fields=[ 'nosuchattribute' ]))
+
+    def testEmpty(self):
+        self.capi.ic.clear()
+        self.assertEqual(list(self.capi.iterUsers()), [])
+        self.assertEqual(list(self.capi.iterRequests(fields=[ 'state' ])), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+"""
+Unit tests for the in-process infoservice stand-in (vc3client.localinfo)
+"""
+
+import unittest
+import os
+import shutil
+import tempfile
+
+from vc3client.entities import User
+from vc3client.localinfo import LocalInfoClient
+from vc3infoservice.core import InfoMissingPairingException, InfoEntityExistsException, InfoEntityMissingException, InfoEntityUpdateMissingException
+
+from localclient import make_client
+
+
+class TestLocalInfoClient(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'store.sqlite')
+        self.client = make_client(local={ 'path' : self.path })
+
+    def tearDown(self):
+        self.client.ic.close()
+        LocalInfoClient._shared.pop(self.path, None)
+        shutil.rmtree(self.tmpdir)
+
+    def define_user(self, name):
+        return self.client.defineUser(name=name,
+                                      first='First',
+                                      last='Last',
+                                      email='test@test.edu',
+                                      organization='Computation Institute')
+
+    def testBackendSelection(self):
+        self.assertTrue(isinstance(self.client.ic, LocalInfoClient))
+        self.assertTrue(self.client.pool is None)
+
+    def testStoreGetListDelete(self):
+        self.client.storeUser(self.define_user('user1'))
+        self.client.storeUser(self.define_user('user2'))
+
+        u = self.client.getUser('user1')
+        self.assertEqual(u.name, 'user1')
+        self.assertEqual(u.email, 'test@test.edu')
+        self.assertEqual(sorted([ u.name for u in self.client.listUsers() ]), [ 'user1', 'user2' ])
+
+        u.email = 'new@test.edu'
+        self.client.storeUser(u)
+        self.assertEqual(self.client.getUser('user1').email, 'new@test.edu')
+
+        self.client.deleteUser('user1')
+        self.assertRaises(InfoEntityMissingException, self.client.getUser, 'user1')
+        self.assertRaises(InfoEntityMissingException, self.client.deleteUser, 'user1')
+
+    def testReturnsCopies(self):
+        self.client.storeUser(self.define_user('user1'))
+        u = self.client.getUser('user1')
+        u.email = 'changed@test.edu'
+        self.assertEqual(self.client.getUser('user1').email, 'test@test.edu')
+
+    def testExistsAndUpdateMissing(self):
+        self.client.storeUser(self.define_user('user1'))
+        self.assertRaises(InfoEntityExistsException, self.client.storeUser, self.define_user('user1'))
+
+        u = self.client.getUser('user1')
+        self.client.deleteUser('user1')
+        self.assertRaises(InfoEntityUpdateMissingException, self.client.storeUser, u)
+
+    def testStoreEntitiesIsAtomic(self):
+        self.client.storeUser(self.define_user('user2'))
+        users = [ self.define_user('user1'), self.define_user('user2') ]
+        self.assertRaises(InfoEntityExistsException, self.client.ic.storeentities, users)
+        self.assertRaises(InfoEntityMissingException, self.client.getUser, 'user1')
+
+    def testIntAttributes(self):
+        ns = self.client.defineNodeset('nodeset1', 'user1', 4, 'htcondor', 'worker-nodes')
+        self.client.storeNodeset(ns)
+        self.assertEqual(self.client.getNodeset('nodeset1').node_number, 4)
+
+    def testPairing(self):
+        code = self.client.requestPairing('host.example.org')
+        self.assertRaises(InfoMissingPairingException, self.client.getPairing, code)
+        self.client.ic.satisfyPairing(code, 'CERT', 'KEY')
+        self.assertEqual(self.client.getPairing(code), ('CERT', 'KEY'))
+        # one-time only
+        self.assertRaises(InfoMissingPairingException, self.client.getPairing, code)
+        self.assertRaises(InfoMissingPairingException, self.client.getPairing, 'nosuchcode')
+
+    def testPersistence(self):
+        self.client.storeUser(self.define_user('user1'))
+        self.client.storeUser(self.define_user('user2'))
+        self.client.deleteUser('user2')
+
+        reopened = LocalInfoClient(self.path)
+        try:
+            self.assertEqual(reopened.getentity(User, 'user1').name, 'user1')
+            self.assertRaises(InfoEntityMissingException, reopened.getentity, User, 'user2')
+        finally:
+            reopened.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
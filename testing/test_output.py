@@ -0,0 +1,52 @@
+"""
+Machine-readable output of the list subcommands (vc3client.output)
+"""
+
+import json
+import unittest
+import StringIO
+
+from vc3client.entities import User
+from vc3client.output import EntityWriter
+from vc3client.projection import Projection
+
+
+def make_users():
+    u1 = User('u1', 'new', 'First', 'Tab\there', 'a@test.edu', 'Computation Institute')
+    u2 = User('u2', 'new', 'Second', 'Last', 'b@test.edu', 'Computation Institute')
+    return [ u1, u2 ]
+
+
+class TestEntityWriter(unittest.TestCase):
+
+    def write(self, entities, format, fields=None, single=False):
+        out = StringIO.StringIO()
+        EntityWriter(out, format, fields, single=single).writeall(entities)
+        return out.getvalue()
+
+    def testJSON(self):
+        users = json.loads(self.write(make_users(), 'json', 'email'))
+        self.assertEqual(users, [ { 'name' : 'u1', 'email' : 'a@test.edu' },
+                                  { 'name' : 'u2', 'email' : 'b@test.edu' } ])
+        self.assertEqual(json.loads(self.write([], 'json')), [])
+        user = json.loads(self.write(make_users()[:1], 'json', single=True))
+        self.assertEqual(user['last'], 'Tab\there')
+        self.assertEqual(user['sshpubstring'], None)
+
+    def testNDJSON(self):
+        lines = self.write(make_users(), 'ndjson', [ 'last' ]).splitlines()
+        self.assertEqual([ json.loads(l) for l in lines ],
+                         [ { 'name' : 'u1', 'last' : 'Tab\there' }, { 'name' : 'u2', 'last' : 'Last' } ])
+
+    def testTSV(self):
+        lines = self.write(make_users(), 'tsv', 'last,name').splitlines()
+        self.assertEqual(lines, [ 'last\tname', 'Tab\\there\tu1', 'Last\tu2' ])
+        self.assertEqual(self.write([], 'tsv', 'email'), 'name\temail\n')
+
+    def testProjection(self):
+        p = Projection.fromEntity(make_users()[0], [ 'email', 'name' ])
+        self.assertEqual(self.write([ p ], 'ndjson'), '{"name": "u1", "email": "a@test.edu"}\n')
+
+
+if __name__ == '__main__':
+    unittest.main()
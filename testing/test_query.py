@@ -0,0 +1,98 @@
+"""
+Filtered listings answered from entity indexes (VC3ClientAPI.query)
+"""
+
+import unittest
+import StringIO
+import sys
+
+from vc3client.clientcli import VC3ClientCLI
+from vc3client.entities import Project, Request
+
+from localclient import make_client
+
+
+class TestQuery(unittest.TestCase):
+
+    def setUp(self):
+        capi = make_client()
+        capi.ic.clear()
+        entities = [ capi.defineProject('p1', 'owner', [ 'owner', 'member' ]),
+                     capi.defineProject('p2', 'member', [ 'member' ]) ]
+        for (name, owner, project) in [ ('r1', 'owner', 'p1'), ('r2', 'owner', 'p2'), ('r3', 'member', 'p2') ]:
+            entities.append(capi.defineRequest(name, owner, 'cluster', [], [], 'static-balanced', None, project))
+        capi.ic.storeentities(entities)
+        self.capi = capi
+
+    def names(self, entities):
+        return [ e.name for e in entities ]
+
+    def testQuery(self):
+        capi = self.capi
+        self.assertEqual(self.names(capi.query(Request, owner='owner')), [ 'r1', 'r2' ])
+        self.assertEqual(self.names(capi.query(Request, owner='owner', project='p2')), [ 'r2' ])
+        self.assertEqual(self.names(capi.query(Request, owner='owner', project=None)), [ 'r1', 'r2' ])
+        self.assertEqual(capi.query(Request, state='running'), [])
+        self.assertEqual(self.names(capi.getProjectsOfUser('member')), [ 'p1', 'p2' ])
+        self.assertEqual(self.names(capi.getProjectsOfOwner('owner')), [ 'p1' ])
+        self.assertEqual(capi.query(Request, project='p1', fields='owner')[0].owner, 'owner')
+        self.assertRaises(ValueError, capi.query, Request, nosuch='x')
+
+    def testSnapshot(self):
+        capi = self.capi
+        capi.query(Request, owner='owner')
+        calls = capi.ic.calls
+        capi.query(Request, owner='member')
+        capi.query(Request, state='new')
+        self.assertEqual(capi.ic.calls, calls)
+
+        # Changes made through the client are seen, changes to results are not.
+        r = capi.query(Request, name='r1')[0]
+        r.owner = 'member'
+        self.assertEqual(self.names(capi.query(Request, owner='member')), [ 'r3' ])
+        capi.storeRequest(r)
+        self.assertEqual(self.names(capi.query(Request, owner='member')), [ 'r1', 'r3' ])
+        capi.deleteRequest('r3')
+        self.assertEqual(self.names(capi.query(Request, owner='member')), [ 'r1' ])
+
+        p = capi.getProject('p2')
+        p.addUser('owner')
+        capi.storeProject(p)
+        self.assertEqual(self.names(capi.getProjectsOfUser('owner')), [ 'p1', 'p2' ])
+
+    def testProjectsOf(self):
+        capi = self.capi
+        capi.query(Project, members='member')
+
+        # Not answered from the snapshot: changes made by another client are seen.
+        other = make_client()
+        p = other.getProject('p2')
+        p.addUser('newmember')
+        other.storeProject(p)
+        self.assertEqual(self.names(capi.query(Project, members='newmember')), [])
+        self.assertEqual(self.names(capi.getProjectsOfUser('newmember')), [ 'p2' ])
+        self.assertEqual(self.names(capi.getProjectsOfOwner('member')), [ 'p2' ])
+
+    def testCLI(self):
+        argv = sys.argv
+        sys.argv = [ 'vc3-client', 'project-list' ]
+        try:
+            cli = VC3ClientCLI()
+        finally:
+            sys.argv = argv
+        out = StringIO.StringIO()
+        self.assertEqual(cli.runline('request-list --owner owner --project p2 -o tsv --fields name', self.capi, out), 0)
+        self.assertEqual(out.getvalue(), 'name\nr2\n')
+
+        # A name selects one entity: filters are a usage error rather than ignored.
+        stderr = sys.stderr
+        sys.stderr = StringIO.StringIO()
+        try:
+            self.assertEqual(cli.runline('request-list --requestname r1 --owner member', self.capi, out), 2)
+            self.assertTrue('cannot be combined' in sys.stderr.getvalue())
+        finally:
+            sys.stderr = stderr
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""
+In-memory registry snapshots (vc3client.snapshot)
+"""
+
+import unittest
+import sys
+import traceback
+
+from vc3client.entities import Request, User
+from vc3client.snapshot import Snapshot, SnapshotReadOnly, ENTITYCLASSES
+
+from localclient import make_client
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        capi = make_client()
+        capi.ic.clear()
+        entities = [ capi.defineUser('owner', 'First', 'Last', 'test@test.edu', 'Computation Institute'),
+                     capi.defineProject('project', 'owner', [ 'member' ]),
+                     capi.defineResource('resource', 'owner', 'batch', 'ssh', 'slurm', 'login.test.edu', 22,
+                                         'nodeinfo', None, None, None, None, None, None),
+                     capi.defineAllocation('owner.resource', 'owner', 'resource', 'account'),
+                     capi.defineNodeinfo('nodeinfo', 'owner', 1, 1024, 1024, 'linux'),
+                     capi.defineEnvironment('environment', 'owner'),
+                     capi.defineNodeset('nodeset', 'owner', 1, 'htcondor', 'worker-nodes',
+                                        nodeinfo='nodeinfo', environment='environment'),
+                     capi.defineCluster('cluster', 'owner', [ 'nodeset' ]),
+                     capi.defineRequest('request', 'owner', 'cluster', [ 'owner.resource' ], [],
+                                        'static-balanced', None, 'project') ]
+        capi.ic.storeentities(entities)
+        self.capi = capi
+
+    def testRelations(self):
+        calls = self.capi.ic.calls
+        s = Snapshot(self.capi).load()
+        self.assertEqual(self.capi.ic.calls - calls, len(ENTITYCLASSES))
+
+        self.assertEqual([ p.name for p in s.projectsOfUser('owner') ], [ 'project' ])
+        self.assertEqual([ p.name for p in s.projectsOfUser('member') ], [ 'project' ])
+        self.assertEqual(s.resourceOfAllocation('owner.resource').name, 'resource')
+        self.assertEqual([ a.name for a in s.allocationsOfResource('resource') ], [ 'owner.resource' ])
+        self.assertEqual(s.clusterOfRequest('request').name, 'cluster')
+        self.assertEqual([ r.name for r in s.requestsOfCluster('cluster') ], [ 'request' ])
+        self.assertEqual([ n.name for n in s.nodesetsOfRequest('request') ], [ 'nodeset' ])
+        self.assertEqual(s.nodeinfoOfNodeset('nodeset').name, 'nodeinfo')
+        self.assertEqual(s.environmentOfNodeset('nodeset').name, 'environment')
+        self.assertEqual(s.get(Request, 'nosuchrequest'), None)
+        self.assertEqual(s.clusterOfRequest('nosuchrequest'), None)
+        self.assertEqual(self.capi.ic.calls - calls, len(ENTITYCLASSES))
+
+    def testRefresh(self):
+        s = Snapshot(self.capi).load()
+        r = self.capi.getRequest('request')
+        r.state = 'running'
+        self.capi.storeRequest(r)
+        self.capi.storeUser(self.capi.defineUser('new', 'First', 'Last', 'test@test.edu', 'Computation Institute'))
+        self.assertEqual(s.get(Request, 'request').state, 'new')
+
+        changes = s.refresh()
+        self.assertEqual(changes['Request'], ([], [ 'request' ], []))
+        self.assertEqual(changes['User'], ([ 'new' ], [], []))
+        self.assertEqual(changes['Cluster'], ([], [], []))
+        self.assertEqual([ q.name for q in s.query(Request, state='running') ], [ 'request' ])
+
+    def testFailedRefresh(self):
+        s = Snapshot(self.capi).load()
+        r = self.capi.getRequest('request')
+        r.state = 'running'
+        self.capi.storeRequest(r)
+        self.capi.storeUser(self.capi.defineUser('new', 'First', 'Last', 'test@test.edu', 'Computation Institute'))
+
+        # One kind failing to list: nothing is applied, and the error keeps its origin.
+        listdocuments = self.capi._listdocuments
+
+        def failing(entityclass, fresh=False):
+            if entityclass is User:
+                raise IOError('connection reset')
+            return listdocuments(entityclass, fresh=fresh)
+
+        self.capi._listdocuments = failing
+        try:
+            try:
+                s.refresh()
+                self.fail('refresh did not raise')
+            except IOError:
+                frames = traceback.extract_tb(sys.exc_info()[2])
+                self.assertEqual(frames[-1][2], 'failing')
+        finally:
+            del self.capi._listdocuments
+        self.assertEqual(s.get(Request, 'request').state, 'new')
+        self.assertEqual(s.get(User, 'new'), None)
+
+        self.assertEqual(s.refresh()['User'], ([ 'new' ], [], []))
+        self.assertEqual(s.get(Request, 'request').state, 'running')
+
+    def testWithSnapshot(self):
+        view = self.capi.withSnapshot()
+        calls = self.capi.ic.calls
+        self.assertEqual(view.getRequest('request', policy_user='owner').cluster, 'cluster')
+        self.assertEqual([ c.name for c in view.listClusters(policy_user='owner') ], [ 'cluster' ])
+        self.assertEqual([ p.name for p in view.getProjectsOfUser('member') ], [ 'project' ])
+        self.assertEqual(view.getFleetStatus().summary()['requests'], 1)
+        self.assertEqual(self.capi.ic.calls, calls)
+
+        u = view.getUser('owner')
+        u.first = 'Changed'
+        self.assertEqual(view.getUser('owner').first, 'First')
+        self.assertRaises(SnapshotReadOnly, view.storeUser, u)
+        self.assertRaises(SnapshotReadOnly, view.deleteUser, 'owner')
+        self.assertEqual(self.capi.getUser('owner').first, 'First')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+"""
+Job counters parsed from Request.statusraw (vc3client.status)
+"""
+
+import unittest
+import json
+
+from vc3client.status import FleetStatus, RequestStatus, STATES
+
+from localclient import make_client
+
+
+# As reported by two factories running the worker nodes of one request under two
+# allocations: { factory : { nodeset : { queue : { state : count } } } }, queues
+# being named after allocations.
+STATUSRAW = {
+    'factory1.virtualclusters.org' : {
+        'request1-workers' : {
+            'owner.uchicago-midway' : { 'running' : 10, 'queued' : 5, 'idle' : 0, 'error' : 0 },
+            'owner.nersc-cori' : { 'running' : 2, 'queued' : 20, 'idle' : 1, 'error' : 1 },
+        },
+    },
+    'factory2.virtualclusters.org' : {
+        'request1-workers' : {
+            'owner.uchicago-midway' : { 'running' : 3, 'queued' : 0, 'idle' : 0, 'error' : 0 },
+        },
+        'request1-head' : {
+            'owner.uchicago-midway' : { 'running' : 1, 'queued' : 0, 'idle' : 0, 'error' : 0, 'held' : 2 },
+        },
+    },
+}
+
+
+def counters(running=0, queued=0, idle=0, error=0, **others):
+    c = dict(running=running, queued=queued, idle=idle, error=error)
+    c.update(others)
+    return c
+
+
+class Request(object):
+    def __init__(self, name, state, statusraw):
+        self.name = name
+        self.state = state
+        self.statusraw = statusraw
+
+
+class TestRequestStatus(unittest.TestCase):
+
+    def testParse(self):
+        rs = RequestStatus('request1', json.dumps(STATUSRAW))
+        self.assertEqual(rs.totals, counters(running=16, queued=25, idle=1, error=1, held=2))
+        self.assertEqual(rs.nodesets, { 'request1-workers' : counters(running=15, queued=25, idle=1, error=1),
+                                        'request1-head' : counters(running=1, held=2) })
+        self.assertEqual(rs.allocations, { 'owner.uchicago-midway' : counters(running=14, queued=5, held=2),
+                                           'owner.nersc-cori' : counters(running=2, queued=20, idle=1, error=1) })
+
+    def testEmpty(self):
+        for statusraw in (None, '{}', {}):
+            rs = RequestStatus('request1', statusraw)
+            self.assertEqual(rs.totals, dict.fromkeys(STATES, 0))
+            self.assertEqual((rs.nodesets, rs.allocations), ({}, {}))
+
+    def testUpdate(self):
+        rs = RequestStatus('request1', json.dumps(STATUSRAW))
+        self.assertFalse(rs.update(json.dumps(STATUSRAW)))
+
+        statusraw = json.loads(json.dumps(STATUSRAW))
+        statusraw['factory1.virtualclusters.org']['request1-workers']['owner.nersc-cori']['running'] = 22
+        del statusraw['factory2.virtualclusters.org']
+        self.assertTrue(rs.update(statusraw))
+        self.assertEqual(rs.totals, counters(running=32, queued=25, idle=1, error=1))
+        self.assertEqual(rs.nodesets.keys(), [ 'request1-workers' ])
+
+    def testMalformed(self):
+        statusraw = {
+            'factory1' : 'not a report',
+            'factory2' : { 'nodeset1' : [ 'not', 'queues' ],
+                           'nodeset2' : None,
+                           'nodeset3' : { 'alloc1' : 7,
+                                          'alloc2' : { 'running' : '4', 'queued' : 'many',
+                                                       'idle' : None, 'error' : { 'nested' : 1 } } } },
+        }
+        rs = RequestStatus('request1', statusraw)
+        # String counts are taken, anything else that is not an integer is left out.
+        self.assertEqual(rs.totals, counters(running=4))
+        self.assertEqual(rs.nodesets, { 'nodeset3' : counters(running=4) })
+        self.assertEqual(rs.allocations, { 'alloc2' : counters(running=4) })
+
+        # A status that is not a JSON object counts as empty.
+        for statusraw in ('{"factory1" : ', '[ 1, 2 ]', [ 'not', 'factories' ]):
+            rs.update(statusraw)
+            self.assertEqual(rs.totals, dict.fromkeys(STATES, 0))
+            self.assertEqual((rs.nodesets, rs.allocations), ({}, {}))
+
+
+class TestFleetStatus(unittest.TestCase):
+
+    def testUpdate(self):
+        fleet = FleetStatus()
+        other = { 'f' : { 'request2-workers' : { 'owner.nersc-cori' : { 'running' : 4 } } } }
+        requests = [ Request('request1', 'running', json.dumps(STATUSRAW)),
+                     Request('request2', 'pending', json.dumps(other)) ]
+        self.assertEqual(fleet.update(requests), [ 'request1', 'request2' ])
+        summary = fleet.summary()
+        self.assertEqual(summary['requests'], 2)
+        self.assertEqual(summary['states'], { 'running' : 1, 'pending' : 1 })
+        self.assertEqual(summary['totals'], counters(running=20, queued=25, idle=1, error=1, held=2))
+        self.assertEqual(summary['allocations']['owner.nersc-cori'], counters(running=6, queued=20, idle=1, error=1))
+
+        self.assertEqual(fleet.update(requests), [])
+        requests[1].state = 'running'
+        self.assertEqual(fleet.update(requests[1:]), [ 'request1', 'request2' ])
+        summary = fleet.summary()
+        # States other than STATES stay in the totals once seen.
+        self.assertEqual(summary['totals'], counters(running=4, held=0))
+        self.assertEqual(summary['allocations'].keys(), [ 'owner.nersc-cori' ])
+
+
+class TestRequestStatusSummary(unittest.TestCase):
+
+    def testSummary(self):
+        capi = make_client()
+        capi.ic.clear()
+        r = capi.defineRequest('request1', 'owner', 'cluster', [], [], 'static-balanced', None, 'project')
+        r.statusraw = json.dumps(STATUSRAW)
+        capi.ic.storeentities([ r ])
+        rs = capi.getRequestStatusSummary('request1')
+        self.assertEqual(rs.totals['running'], 16)
+        self.assertTrue(capi.getRequestStatusSummary('request1', rs) is rs)
+
+        # A missing request gives None.
+        self.assertEqual(capi.getRequestStatusSummary('nosuchrequest'), None)
+
+
+if __name__ == '__main__':
+    unittest.main()
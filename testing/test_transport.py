@@ -0,0 +1,129 @@
+"""
+Keep-alive connection pool for infoservice calls (vc3client.transport)
+"""
+
+import unittest
+import threading
+import time
+import BaseHTTPServer
+import SocketServer
+
+import requests
+
+from vc3client.transport import ConnectionPool
+
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path == '/slow':
+            time.sleep(0.2)
+        body = self.path
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+# Module state read by InfoClient at call time.
+PREFIX = ''
+
+
+class InfoClient(object):
+    '''
+    Stands in for vc3infoservice.infoclient.InfoClient: calls go through the
+    requests module global of the module defining the class.
+    '''
+
+    def __init__(self, url):
+        self.url = url
+
+    def get(self, path):
+        return requests.get(self.url + PREFIX + path).text
+
+    def getnested(self, path):
+        fetch = lambda: requests.get(self.url + path)
+        return fetch().text
+
+    def gettwice(self, path):
+        return [ self.get(path), self.get(path) ]
+
+
+class NoRequests(object):
+    def get(self, path):
+        return path
+
+
+class TestConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d' % self.server.server_address[1]
+        t = threading.Thread(target=self.server.serve_forever, args=(0.05,))
+        t.daemon = True
+        t.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def testBind(self):
+        pools = [ ConnectionPool(), ConnectionPool() ]
+        clients = [ pool.bind(InfoClient(self.url)) for pool in pools ]
+        for i in range(5):
+            self.assertEqual(clients[0].get('/a'), '/a')
+        clients[1].get('/b')
+
+        # Each instance uses its own pool; other instances and callers are unaffected.
+        self.assertEqual([ p.stats()['requests'] for p in pools ], [ 5, 1 ])
+        self.assertEqual(pools[0].stats()['handshakes'], 1)
+        self.assertEqual(InfoClient(self.url).get('/c'), '/c')
+        self.assertEqual(requests.get(self.url + '/d').text, '/d')
+        self.assertEqual(pools[0].stats()['requests'], 5)
+
+        # Nested functions and calls between methods use the pool too, and module
+        # state changed after binding is seen.
+        self.assertEqual(clients[0].getnested('/e'), '/e')
+        self.assertEqual(clients[0].gettwice('/f'), [ '/f', '/f' ])
+        self.assertEqual(pools[0].stats()['requests'], 8)
+        global PREFIX
+        PREFIX = '/p'
+        try:
+            self.assertEqual(clients[0].get('/g'), '/p/g')
+        finally:
+            PREFIX = ''
+
+    def testNothingToBind(self):
+        self.assertRaises(ValueError, ConnectionPool().bind, NoRequests())
+
+    def testResetInFlight(self):
+        pool = ConnectionPool(idletimeout=60)
+        client = pool.bind(InfoClient(self.url))
+        results = []
+        t = threading.Thread(target=lambda: results.append(client.get('/slow')))
+        t.start()
+        time.sleep(0.05)
+
+        # Idle for long enough: the next call gets a new session, the slow one keeps its own.
+        pool._lastused -= 120
+        old = pool.session
+        self.assertEqual(client.get('/fast'), '/fast')
+        self.assertFalse(pool.session is old)
+        self.assertTrue(old in pool._inflight)
+        t.join()
+        self.assertEqual(results, [ '/slow' ])
+        self.assertEqual(pool._inflight, {})
+        stats = pool.stats()
+        self.assertEqual((stats['resets'], stats['handshakes'], stats['errors']), (1, 2, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
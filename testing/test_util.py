@@ -0,0 +1,104 @@
+"""
+Long-lived bounded thread pool behind VC3ClientAPI._parallel (vc3client.util.WorkerPool)
+"""
+
+import unittest
+import gc
+import threading
+import time
+
+from vc3client.entities import User
+from vc3client.util import WorkerPool
+
+from localclient import make_client
+
+
+class TestWorkerPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = WorkerPool(4)
+        self.lock = threading.Lock()
+        self.active = 0
+        self.peak = 0
+
+    def work(self, item):
+        with self.lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+        time.sleep(0.01)
+        with self.lock:
+            self.active -= 1
+        return (item * 2, threading.current_thread().ident)
+
+    def testMap(self):
+        results = self.pool.map(self.work, range(20))
+        self.assertEqual([ r for (r, t) in results ], [ i * 2 for i in range(20) ])
+        self.assertEqual(self.peak, 4)
+
+        # The same threads serve later calls.
+        threads = set([ t for (r, t) in results ])
+        results = self.pool.map(self.work, range(20))
+        self.assertEqual(set([ t for (r, t) in results ]), threads)
+
+    def testWorkers(self):
+        results = self.pool.map(self.work, range(9), workers=2)
+        self.assertEqual([ r for (r, t) in results ], [ i * 2 for i in range(9) ])
+        self.assertEqual(self.peak, 2)
+
+    def testSerial(self):
+        (r, t) = self.pool.map(self.work, [ 1 ])[0]
+        self.assertEqual(t, threading.current_thread().ident)
+        self.assertEqual(self.pool._pool, None)
+
+    def testClose(self):
+        before = threading.active_count()
+        self.pool.map(self.work, range(8))
+        self.assertTrue(threading.active_count() > before)
+        self.pool.close()
+        self.assertEqual(threading.active_count(), before)
+        # Used again, it starts new threads.
+        self.assertEqual([ r for (r, t) in self.pool.map(self.work, range(4)) ], [ 0, 2, 4, 6 ])
+        self.pool.close()
+
+    def testNested(self):
+        # Every thread of the pool waits on a nested map: they run in the caller's thread.
+        results = self.pool.map(lambda i: self.pool.map(self.work, range(i * 3, i * 3 + 3)), range(4))
+        self.assertEqual([ r for run in results for (r, t) in run ], [ i * 2 for i in range(12) ])
+        self.assertEqual(self.peak, 4)
+
+
+class TestParallel(unittest.TestCase):
+
+    def testGetMany(self):
+        capi = make_client(local={ 'latency_ms' : 20 })
+        capi.ic.clear()
+        names = [ 'user%d' % i for i in range(16) ]
+        capi.ic.storeentities([ capi.defineUser(n, 'First', 'Last', 'test@test.edu', 'Computation Institute')
+                                for n in names ])
+        start = time.time()
+        (users, errors) = capi.getMany(User, names + [ 'nosuchuser' ])
+        # Three rounds on the default 8 threads, rather than 17 calls one after another.
+        self.assertTrue(time.time() - start < 0.2)
+        self.assertEqual([ u.name for u in users[:-1] ], names)
+        self.assertEqual(errors.keys(), [ 'nosuchuser' ])
+
+    def testShared(self):
+        def use():
+            capi = make_client()
+            capi.getMany(User, [ 'user1', 'user2' ])
+            return capi
+
+        capi = use()
+        threads = threading.active_count()
+        # Clients of the same size share one pool: the threads do not grow with them.
+        clients = [ use() for i in range(5) ]
+        self.assertEqual(threading.active_count(), threads)
+        self.assertTrue(all([ c.workers is capi.workers for c in clients ]))
+        del clients
+        gc.collect()
+        self.assertEqual(threading.active_count(), threads)
+        self.assertFalse(make_client(netcomm={ 'maxworkers' : 2 }).workers is capi.workers)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,129 @@
+"""
+Polling of request states (vc3client.watch.RequestWatcher), on a simulated clock
+"""
+
+import unittest
+
+from vc3client.entities import Request
+from vc3client.watch import RequestWatcher
+
+from localclient import make_client
+
+
+class Clock(object):
+    '''
+    Simulated time: sleep() advances it at once, running the actions due meanwhile.
+    '''
+
+    def __init__(self):
+        self.now = 0.0
+        self.actions = []    # (time, callable)
+
+    def time(self):
+        return self.now
+
+    def at(self, t, action):
+        self.actions.append((t, action))
+
+    def sleep(self, seconds):
+        self.now += seconds
+        for (t, action) in sorted([ a for a in self.actions if a[0] <= self.now ]):
+            self.actions.remove((t, action))
+            action()
+
+
+class TestRequestWatcher(unittest.TestCase):
+
+    def setUp(self):
+        capi = make_client()
+        capi.ic.clear()
+        capi.ic.storeentities([ self.define(capi, 'r1', 'owner'), self.define(capi, 'r2', 'other') ])
+        self.capi = capi
+        self.clock = Clock()
+
+        # Counts listings and fetches by name as they reach the infoservice.
+        self.listings = 0
+        self.fetches = []
+        getdocumentobject = capi.ic.getdocumentobject
+        self.getentity = getentity = capi.ic.getentity
+
+        def listing(key):
+            self.listings += 1
+            return getdocumentobject(key)
+
+        def fetch(entityclass, name):
+            self.fetches.append(name)
+            return getentity(entityclass, name)
+
+        capi.ic.getdocumentobject = listing
+        capi.ic.getentity = fetch
+
+    def tearDown(self):
+        del self.capi.ic.getdocumentobject
+        del self.capi.ic.getentity
+
+    def define(self, capi, name, owner):
+        return capi.defineRequest(name, owner, 'cluster', [], [], 'static-balanced', None, 'project')
+
+    def watcher(self, **kwargs):
+        return RequestWatcher(self.capi, mininterval=1.0, maxinterval=8.0,
+                              clock=self.clock.time, sleep=self.clock.sleep, **kwargs)
+
+    def setstate(self, name, state):
+        def action():
+            r = self.getentity(Request, name)
+            r.state = state
+            self.capi.ic.storeentities([ r ])
+        return action
+
+    def testNames(self):
+        self.clock.at(1.0, self.setstate('r1', 'running'))
+        self.clock.at(20.0, self.setstate('r1', 'terminated'))
+        events = self.watcher(names=[ 'r1', 'r2' ], untilfinal=True).events()
+        self.assertEqual([ (e['time'], e['request'], e['state']) for e in [ events.next(), events.next() ] ],
+                         [ (0.0, 'r1', 'new'), (0.0, 'r2', 'new') ])
+        e = events.next()
+        self.assertEqual((e['time'], e['state'], e['previous_state']), (1.0, 'running', 'new'))
+
+        # Unchanged while running, r1 is polled at growing intervals: at 2, 4, 8, 16, 24.
+        self.fetches = []
+        self.clock.at(30.0, lambda: self.capi.ic.deleteentity(Request, 'r2'))
+        e = events.next()
+        self.assertEqual((e['time'], e['request'], e['state']), (24.0, 'r1', 'terminated'))
+        self.assertEqual(self.fetches.count('r1'), 5)
+        e = events.next()
+        self.assertEqual((e['time'], e['request'], e['state'], e['previous_state']), (30.0, 'r2', None, 'new'))
+        self.assertRaises(StopIteration, events.next)
+        self.assertEqual(self.listings, 0)
+
+    def testOwner(self):
+        self.clock.at(1.0, self.setstate('r1', 'running'))
+        self.clock.at(3.0, lambda: self.capi.ic.storeentities([ self.define(self.capi, 'r3', 'owner') ]))
+        events = self.watcher(owner='owner').events()
+        e = events.next()
+        self.assertEqual((e['time'], e['request'], e['state']), (0.0, 'r1', 'new'))
+        self.assertEqual(self.listings, 1)
+
+        # After the first listing, due requests are fetched by name...
+        e = events.next()
+        self.assertEqual((e['time'], e['request'], e['state']), (1.0, 'r1', 'running'))
+        self.assertEqual((self.listings, self.fetches), (1, [ 'r1' ]))
+
+        # ... and new requests are found by the listing made every maxinterval.
+        e = events.next()
+        self.assertEqual((e['time'], e['request'], e['state']), (8.0, 'r3', 'new'))
+        self.assertEqual(self.listings, 2)
+        self.assertEqual(self.fetches, [ 'r1', 'r1', 'r1' ])
+
+        # A request no longer matching owner leaves the selection.
+        def reassign():
+            r = self.getentity(Request, 'r3')
+            r.owner = 'other'
+            self.capi.ic.storeentities([ r ])
+        self.clock.at(8.5, reassign)
+        e = events.next()
+        self.assertEqual((e['time'], e['request'], e['state'], e['previous_state']), (9.0, 'r3', None, 'new'))
+
+
+if __name__ == '__main__':
+    unittest.main()
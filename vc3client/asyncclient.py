@@ -0,0 +1,248 @@
+#!/bin/env python
+__author__ = "John Hover"
+__copyright__ = "2017 John Hover"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "John Hover"
+__email__ = "jhover@bnl.gov"
+__status__ = "Production"
+
+'''
+asyncio front-end to VC3ClientAPI.
+
+Every infoservice operation of VC3ClientAPI (store*, list*, get*, delete*, add*, remove*,
+terminate*, query, ...) is available under the same name and with the same arguments,
+including policy_user, but returns an asyncio Future instead of blocking. On Python 2,
+where the trollius backport provides the asyncio API, coroutines wait on them with
+yield From()::
+
+    @asyncio.coroutine
+    def owner(capi, name, user):
+        request = yield From(capi.getRequest(name, policy_user=user))
+        raise Return(request.owner)
+
+The blocking calls run on one bounded thread pool shared by all coroutines of the
+event loop, so hundreds of concurrent callers need only [netcomm] maxworkers threads,
+and they share the client's infoservice connections.
+
+iter* return a Future of the list of entities, decoded on the pool. watchRequests
+returns a RequestEvents, whose next() returns a Future of the next event. withSnapshot
+returns a Future of an AsyncVC3ClientAPI reading from the snapshot. batch returns an
+AsyncWriteBatch, whose flush() returns a Future.
+
+define* and the encode/decode helpers do no I/O and are plain synchronous methods.
+'''
+
+import functools
+import logging
+
+try:
+    import asyncio
+except ImportError:
+    import trollius as asyncio
+
+from client import VC3ClientAPI
+
+
+# VC3ClientAPI methods doing infoservice I/O, run on the executor.
+ASYNC_METHODS = ('storeUser', 'listUsers', 'getUser', 'getUsers', 'deleteUser',
+                 'storeProject', 'addUserToProject', 'removeUserFromProject',
+                 'addAllocationToProject', 'removeAllocationFromProject', 'listProjects',
+                 'getProject', 'getProjects', 'getProjectsOfOwner', 'getProjectsOfUser', 'deleteProject',
+                 'storeResource', 'listResources', 'getResource', 'getResources', 'deleteResource',
+                 'storeAllocation', 'listAllocations', 'getAllocation', 'getAllocations',
+                 'deleteAllocation', 'getAllocationPubToken',
+                 'storeCluster', 'listClusters', 'getCluster', 'getClusters', 'deleteCluster',
+                 'addNodesetToCluster', 'removeNodesetFromCluster',
+                 'storeNodeinfo', 'listNodeinfos', 'getNodeinfo', 'getNodeinfos', 'deleteNodeinfo',
+                 'storeNodeset', 'listNodesets', 'getNodeset', 'getNodesets', 'deleteNodeset',
+                 'storeEnvironment', 'listEnvironments', 'getEnvironment', 'getEnvironments', 'deleteEnvironment',
+                 'storeRequest', 'listRequests', 'getRequest', 'getRequests', 'deleteRequest', 'deleteRequests',
+                 'terminateRequest', 'getRequestStatus', 'getRequestState', 'getRequestStatusSummary',
+                 'getFleetStatus', 'saveRequestAsBlueprint', 'getQueuesConf', 'getAllQueuesConf',
+                 'getAuthConf', 'getConfString', 'requestPairing', 'getPairing',
+                 'getMany', 'query')
+
+# VC3ClientAPI methods returning generators: the Future is of the list of their items.
+ITER_METHODS = ('iterUsers', 'iterProjects', 'iterResources', 'iterAllocations', 'iterClusters',
+                'iterNodeinfos', 'iterNodesets', 'iterEnvironments', 'iterRequests')
+
+# VC3ClientAPI methods run directly on the event loop thread.
+SYNC_METHODS = ('defineUser', 'defineProject', 'defineResource', 'defineAllocation', 'defineCluster',
+                'defineNodeinfo', 'defineNodeset', 'defineEnvironment', 'defineRequest',
+                'encode', 'decode', 'validate_ssh_pub_key',
+                'getCacheStats', 'getPoolStats', 'clearCache')
+
+
+class AsyncVC3ClientAPI(object):
+    '''
+    Asynchronous client application programming interface. See VC3ClientAPI for
+    the description of each method.
+    '''
+
+    def __init__(self, config, loop=None, capi=None, workers=None):
+        '''
+        :param ConfigParser config: Client configuration.
+        :param loop: Event loop to use. Defaults to the current event loop at call time.
+        :param VC3ClientAPI capi: Existing synchronous client to wrap, if any.
+        :param int workers: Size of the thread pool. Defaults to [netcomm] maxworkers.
+        '''
+        self.log = logging.getLogger('vc3client')
+        self.config = config
+        self.capi = capi or VC3ClientAPI(config)
+        self.loop = loop
+        if workers is None:
+            workers = self.capi.maxworkers
+        from concurrent.futures import ThreadPoolExecutor
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def _run(self, func, *args, **kwargs):
+        loop = self.loop or asyncio.get_event_loop()
+        return loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    def flushBatch(self, batch):
+        '''
+        Returns Future for batch.flush() of an AsyncWriteBatch obtained from batch(), or
+        of a WriteBatch obtained from the synchronous client.
+        '''
+        if isinstance(batch, AsyncWriteBatch):
+            return batch.flush()
+        return self._run(batch.flush)
+
+    def batch(self, rollback=True):
+        '''
+        Returns AsyncWriteBatch queueing stores and deletes. See VC3ClientAPI.batch().
+        '''
+        return AsyncWriteBatch(self, self.capi.batch(rollback=rollback))
+
+    def withSnapshot(self, snapshot=None):
+        '''
+        Returns Future for an AsyncVC3ClientAPI answering reads from snapshot, sharing
+        this client's thread pool. See VC3ClientAPI.withSnapshot().
+        '''
+        def view():
+            return self._wrap(self.capi.withSnapshot(snapshot))
+        return self._run(view)
+
+    def _wrap(self, capi):
+        aclient = object.__new__(self.__class__)
+        aclient.__dict__.update(self.__dict__)
+        aclient.capi = capi
+        return aclient
+
+    def watchRequests(self, *args, **kwargs):
+        '''
+        Returns RequestEvents over the request state transitions of
+        VC3ClientAPI.watchRequests(*args, **kwargs).
+        '''
+        return RequestEvents(self, self.capi.watchRequests(*args, **kwargs))
+
+    def close(self):
+        '''
+        Shuts down the thread pool once pending calls have finished.
+        '''
+        self.executor.shutdown(wait=True)
+
+
+class AsyncWriteBatch(object):
+    '''
+    WriteBatch of AsyncVC3ClientAPI.batch(). store() and delete() only queue operations
+    and are called directly; flush() performs them on the thread pool::
+
+        b = capi.batch()
+        b.store(nodeset)
+        b.store(cluster)
+        results = yield From(b.flush())
+
+    It is not a context manager: leaving a with block cannot wait on the Future, and
+    flushing there would block the event loop.
+    '''
+
+    def __init__(self, aclient, batch):
+        self.aclient = aclient
+        self.batch = batch
+
+    def store(self, entity):
+        return self.batch.store(entity)
+
+    def delete(self, entityclass, name):
+        return self.batch.delete(entityclass, name)
+
+    @property
+    def results(self):
+        return self.batch.results
+
+    def __len__(self):
+        return len(self.batch)
+
+    def flush(self):
+        '''
+        Returns Future of the list of BatchResult of WriteBatch.flush(), which raises
+        BatchError if any operation failed.
+        '''
+        return self.aclient._run(self.batch.flush)
+
+
+class RequestEvents(object):
+    '''
+    Request state transitions from AsyncVC3ClientAPI.watchRequests(). Waiting for the
+    next event, which may take several polls, is done on the thread pool::
+
+        events = capi.watchRequests([ name ], untilfinal=True)
+        while True:
+            event = yield From(events.next())
+            if event is None:
+                break
+    '''
+
+    def __init__(self, aclient, events):
+        self.aclient = aclient
+        self.events = events
+
+    def _next(self):
+        try:
+            return self.events.next()
+        except StopIteration:
+            return None
+
+    def next(self):
+        '''
+        Returns Future of the next event, or of None once watching has ended.
+        '''
+        return self.aclient._run(self._next)
+
+    def close(self):
+        self.events.close()
+
+
+def _asyncmethod(name):
+    def method(self, *args, **kwargs):
+        return self._run(getattr(self.capi, name), *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = "Returns Future for VC3ClientAPI.%s()" % name
+    return method
+
+
+def _itermethod(name):
+    def method(self, *args, **kwargs):
+        return self._run(lambda: list(getattr(self.capi, name)(*args, **kwargs)))
+    method.__name__ = name
+    method.__doc__ = "Returns Future for the list of entities of VC3ClientAPI.%s()" % name
+    return method
+
+
+def _syncmethod(name):
+    def method(self, *args, **kwargs):
+        return getattr(self.capi, name)(*args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = getattr(VC3ClientAPI, name).__doc__
+    return method
+
+
+for _name in SYNC_METHODS:
+    setattr(AsyncVC3ClientAPI, _name, _syncmethod(_name))
+for _name in ASYNC_METHODS:
+    setattr(AsyncVC3ClientAPI, _name, _asyncmethod(_name))
+for _name in ITER_METHODS:
+    setattr(AsyncVC3ClientAPI, _name, _itermethod(_name))
@@ -0,0 +1,189 @@
+#!/bin/env python
+__author__ = "John Hover"
+__copyright__ = "2017 John Hover"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "John Hover"
+__email__ = "jhover@bnl.gov"
+__status__ = "Production"
+
+import logging
+
+from entities import User, Project, Resource, Allocation, Nodeinfo, Nodeset, Request, Cluster, Environment
+
+# Entities only refer to entities of lower rank:
+#   allocation -> user, resource     nodeset -> nodeinfo, environment
+#   project -> allocations, users    cluster -> nodesets
+#   request -> cluster, allocations, environments, project
+RANKS = { User : 0,
+          Resource : 0,
+          Nodeinfo : 0,
+          Environment : 0,
+          Allocation : 1,
+          Nodeset : 1,
+          Project : 2,
+          Cluster : 2,
+          Request : 3,
+          }
+
+
+class BatchResult(object):
+    '''
+    Outcome of one queued operation.
+
+    status is one of 'done', 'failed', 'skipped' (not attempted because an earlier
+    step failed) or 'rolledback' (stored, then deleted again after a later failure).
+    '''
+
+    def __init__(self, operation, entityclass, name):
+        self.operation = operation     # store | delete
+        self.entityclass = entityclass
+        self.name = name
+        self.status = 'skipped'
+        self.error = None
+
+    @property
+    def ok(self):
+        return self.status == 'done'
+
+    def __repr__(self):
+        s = "BatchResult(%s %s %s: %s" % (self.operation, self.entityclass.__name__, self.name, self.status)
+        if self.error is not None:
+            s += " %s" % self.error
+        s += ")"
+        return s
+
+
+class BatchError(Exception):
+    '''
+    Raised on exit from a WriteBatch when some operation failed.
+    results holds the BatchResult of every queued operation.
+    '''
+
+    def __init__(self, results):
+        self.results = results
+        failed = [ r for r in results if r.status == 'failed' ]
+        Exception.__init__(self, "%d of %d batch operations failed: %s" % (len(failed), len(results), failed))
+
+
+class WriteBatch(object):
+    '''
+    Unit of work for VC3ClientAPI stores and deletes. Obtain one from VC3ClientAPI.batch().
+
+    Operations are queued by store() and delete() and performed by flush(), which is
+    called on normal exit from a with block:
+
+        -- Deletes run first, dependents before what they depend on (requests before
+           clusters before nodesets ...).
+        -- Stores run next, in the opposite order. Entities of the same rank do not depend
+           on one another and are stored together.
+        -- A failure stops the flush. Later operations are skipped and, if rollback is set,
+           entities newly created by this batch are deleted again.
+
+    If the with block itself raises, nothing queued is performed.
+    '''
+
+    def __init__(self, capi, rollback=True):
+        self.log = logging.getLogger('vc3client')
+        self.capi = capi
+        self.rollback = rollback
+        self._stores = []    # (entity, BatchResult)
+        self._deletes = []   # (entityclass, name, BatchResult)
+        self.results = []
+
+    def store(self, entity):
+        '''
+        Queues entity to be stored.
+        '''
+        result = BatchResult('store', entity.__class__, entity.name)
+        self._stores.append((entity, result))
+        self.results.append(result)
+        return result
+
+    def delete(self, entityclass, name):
+        '''
+        Queues entity of entityclass named name to be deleted.
+        '''
+        result = BatchResult('delete', entityclass, name)
+        self._deletes.append((entityclass, name, result))
+        self.results.append(result)
+        return result
+
+    def __len__(self):
+        return len(self.results)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is not None:
+            self.log.debug("Discarding %d queued operations after exception" % len(self.results))
+            return False
+        self.flush()
+        return False
+
+    def _levels(self, items, rank, reverse=False):
+        levels = {}
+        for item in items:
+            levels.setdefault(RANKS.get(rank(item), 0), []).append(item)
+        return [ levels[k] for k in sorted(levels.keys(), reverse=reverse) ]
+
+    def flush(self):
+        '''
+        Performs all queued operations.
+
+        :return: List of BatchResult, in the order operations were queued.
+        :raises BatchError: if any operation failed.
+        '''
+        failed = False
+        for level in self._levels(self._deletes, lambda d: d[0], reverse=True):
+            outcomes = self.capi._parallel(lambda d: self.capi._deleteentity(d[0], d[1]), level)
+            for ((entityclass, name, result), (r, e)) in zip(level, outcomes):
+                self._record(result, e)
+                failed = failed or e is not None
+            if failed:
+                break
+
+        stored = []
+        if not failed:
+            for level in self._levels(self._stores, lambda s: s[0].__class__):
+                errors = self.capi._storeentities([ entity for (entity, result) in level ])
+                for ((entity, result), e) in zip(level, errors):
+                    self._record(result, e)
+                    if e is None:
+                        stored.append((entity, result))
+                    failed = failed or e is not None
+                if failed:
+                    break
+
+        if failed and self.rollback:
+            self._rollback(stored)
+
+        self._stores = []
+        self._deletes = []
+        if failed:
+            raise BatchError(self.results)
+        return self.results
+
+    def _record(self, result, error):
+        if error is None:
+            result.status = 'done'
+        else:
+            self.log.error("Batch %s of %s %s failed: %s" % (result.operation, result.entityclass.__name__, result.name, error))
+            result.status = 'failed'
+            result.error = error
+
+    def _rollback(self, stored):
+        '''
+        Deletes entities this batch created, most dependent first. Entities that
+        already existed were updated in place and are left as they are.
+        '''
+        created = [ (entity, result) for (entity, result) in stored if getattr(entity, 'storenew', False) ]
+        for level in self._levels(created, lambda s: s[0].__class__, reverse=True):
+            outcomes = self.capi._parallel(lambda s: self.capi._deleteentity(s[0].__class__, s[0].name), level)
+            for ((entity, result), (r, e)) in zip(level, outcomes):
+                if e is None:
+                    result.status = 'rolledback'
+                else:
+                    self.log.error("Could not roll back %s %s: %s" % (entity.__class__.__name__, entity.name, e))
@@ -0,0 +1,196 @@
+#!/bin/env python
+__author__ = "John Hover"
+__copyright__ = "2017 John Hover"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "John Hover"
+__email__ = "jhover@bnl.gov"
+__status__ = "Production"
+
+import json
+import logging
+import threading
+import time
+
+from collections import OrderedDict
+
+from util import confgetboolean, confgetint, confgetfloat
+
+
+class LRUCache(object):
+    '''
+    Size-bounded, thread-safe mapping with least-recently-used eviction and
+    per-entry expiration.
+
+    Counts hits, misses, evictions (entries dropped to make room) and
+    expirations (entries found past their time-to-live).
+    '''
+
+    def __init__(self, maxsize=1024):
+        '''
+        :param int maxsize: Maximum number of entries held before the least recently used is evicted.
+        '''
+        self.log = logging.getLogger('vc3client')
+        self.maxsize = maxsize
+        self._data = OrderedDict()   # key -> (expires, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, key, default=None):
+        '''
+        Returns value stored for key, or default if absent or expired.
+        '''
+        with self._lock:
+            try:
+                (expires, value) = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires is not None and expires < time.time():
+                self.expirations += 1
+                self.misses += 1
+                return default
+            # re-insert to mark as most recently used
+            self._data[key] = (expires, value)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, ttl=None):
+        '''
+        Stores value for key.
+
+        :param float ttl: Seconds the entry stays valid. None means no expiration.
+        '''
+        expires = None
+        if ttl is not None:
+            expires = time.time() + ttl
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (expires, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key):
+        '''
+        Removes key, if present.
+        '''
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self.invalidations += 1
+
+    def popmatching(self, predicate):
+        '''
+        Removes every key for which predicate(key) is True.
+        '''
+        with self._lock:
+            for key in [ k for k in self._data.keys() if predicate(k) ]:
+                del self._data[key]
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        '''
+        Returns dictionary of counters.
+        '''
+        with self._lock:
+            return { 'size' : len(self._data),
+                     'maxsize' : self.maxsize,
+                     'hits' : self.hits,
+                     'misses' : self.misses,
+                     'evictions' : self.evictions,
+                     'expirations' : self.expirations,
+                     'invalidations' : self.invalidations,
+                     }
+
+
+class EntityCache(object):
+    '''
+    Read-through cache of InfoEntity objects keyed by (entity class, name).
+
+    Entities are held in their serialized document form and re-created on every hit,
+    so callers may modify what they get back without corrupting the cache.
+
+    Time-to-live is set per entity type, e.g. Requests change state often
+    while Users rarely do. A ttl of 0 disables caching for that type.
+    '''
+
+    def __init__(self, maxsize=1024, ttl=60.0, ttls=None):
+        '''
+        :param int maxsize: Maximum number of entities held.
+        :param float ttl: Default time-to-live in seconds.
+        :param dict ttls: Entity class name (lowercase) -> time-to-live overrides.
+        '''
+        self.log = logging.getLogger('vc3client')
+        self.lru = LRUCache(maxsize)
+        self.ttl = ttl
+        self.ttls = ttls or {}
+
+    def _ttl(self, entityclass):
+        return self.ttls.get(entityclass.__name__.lower(), self.ttl)
+
+    def get(self, entityclass, name):
+        '''
+        Returns a fresh entity object for name, or None on a miss.
+        '''
+        doc = self.lru.get((entityclass.__name__, name))
+        if doc is None:
+            return None
+        return entityclass.objectFromDict({ name : json.loads(doc) })
+
+    def put(self, entityclass, entity):
+        ttl = self._ttl(entityclass)
+        if not ttl:
+            return
+        doc = entity.makeDictObject()[entity.name]
+        self.lru.put((entityclass.__name__, entity.name), json.dumps(doc), ttl)
+
+    def invalidate(self, entityclass, name=None):
+        '''
+        Drops cached entity name, or every entity of entityclass if name is None.
+        '''
+        if name is None:
+            clsname = entityclass.__name__
+            self.lru.popmatching(lambda k: k[0] == clsname)
+        else:
+            self.lru.pop((entityclass.__name__, name))
+
+    def clear(self):
+        self.lru.clear()
+
+    def stats(self):
+        return self.lru.stats()
+
+    @classmethod
+    def fromConfig(cls, config):
+        '''
+        Returns EntityCache configured from [cache] section, or None if caching is not enabled.
+
+        [cache]
+        enabled = true
+        maxsize = 1024
+        ttl = 60
+        request_ttl = 5
+        '''
+        if not confgetboolean(config, 'cache', 'enabled', False):
+            return None
+        ttls = {}
+        for name in ['user', 'project', 'resource', 'allocation', 'nodeinfo',
+                     'nodeset', 'cluster', 'environment', 'request']:
+            ttl = confgetfloat(config, 'cache', '%s_ttl' % name, None)
+            if ttl is not None:
+                ttls[name] = ttl
+        return cls( maxsize = confgetint(config, 'cache', 'maxsize', 1024),
+                    ttl = confgetfloat(config, 'cache', 'ttl', 60.0),
+                    ttls = ttls )
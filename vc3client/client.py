@@ -8,20 +8,26 @@ __maintainer__ = "John Hover"
 __email__ = "jhover@bnl.gov"
 __status__ = "Production"
 
-import ast
 import base64
+import functools
+import hashlib
 import json
 import logging
 import os
 import sys
-import subprocess
-import tempfile
-import yaml
 import StringIO
 import ConfigParser
 
+from collections import OrderedDict
 from entities import User, Project, Resource, Allocation, Nodeinfo, Nodeset, Request, Cluster, Environment
-from vc3infoservice import infoclient
+from batch import WriteBatch
+from cache import EntityCache, LRUCache
+from index import EligibilityIndex, EntityIndexes
+from instrument import Instrumentation
+from projection import Projection, checkfields
+from status import FleetStatus, RequestStatus
+from util import WorkerPool, confget, confgetboolean, confgetfloat, confgetint
+from watch import RequestWatcher
 from vc3infoservice.core import  InfoMissingPairingException, InfoConnectionFailure, InfoEntityExistsException, InfoEntityMissingException, InfoEntityUpdateMissingException
 
 
@@ -35,6 +41,20 @@ class PermissionDenied(Exception):
         Exception.__init__(self, *args, **kwargs)
 
 
+class CascadeDeleteError(Exception):
+    """
+    Exception thrown by deleteRequest when some of the entities cloned for the
+    request could not be deleted. errors is a list of (entityclass, name, exception).
+    The request itself is kept, so deleting it again retries the remaining children.
+    """
+
+    def __init__(self, requestname, errors):
+        self.requestname = requestname
+        self.errors = errors
+        failed = [ "%s %s: %s" % (entityclass.__name__, name, e) for (entityclass, name, e) in errors ]
+        Exception.__init__(self, "Could not delete request %s: %s" % (requestname, '; '.join(failed)))
+
+
 class VC3ClientAPI(object):
     '''
     Client application programming interface. 
@@ -54,24 +74,374 @@ class VC3ClientAPI(object):
     
     def __init__(self, config):
         self.config = config
-        self.ic = infoclient.InfoClient(self.config)
+        # Backends are imported only when selected: the infoservice client and requests
+        # are the bulk of the start-up time of a short-lived process.
+        if confget(self.config, 'netcomm', 'backend', 'infoservice') == 'local':
+            from localinfo import LocalInfoClient
+            self.pool = None
+            self.ic = LocalInfoClient.fromConfig(self.config)
+        else:
+            from transport import ConnectionPool
+            from vc3infoservice import infoclient
+            self.pool = ConnectionPool.fromConfig(self.config)
+            self.ic = infoclient.InfoClient(self.config)
+            if self.pool is not None:
+                try:
+                    self.pool.bind(self.ic)
+                except ValueError, e:
+                    logging.getLogger('vc3client').warning("Not pooling infoservice connections: %s" % e)
+                    self.pool = None
+        self.instrument = Instrumentation.fromConfig(self.config)
+        if self.instrument is not None:
+            self.ic = self.instrument.wrap(self.ic)
+            self.instrument.install(self)
         self.log = logging.getLogger('vc3client')
+        self.cache = EntityCache.fromConfig(self.config)
+        self.diskcache = None
+        if confgetboolean(self.config, 'diskcache', 'enabled', False):
+            from diskcache import DiskCache
+            self.diskcache = DiskCache.fromConfig(self.config)
+        self.eligibility = EligibilityIndex(confgetfloat(self.config, 'cache', 'eligibility_ttl', 0.0))
+        self.indexes = EntityIndexes(confgetfloat(self.config, 'cache', 'index_ttl', 60.0))
+        self.maxworkers = confgetint(self.config, 'netcomm', 'maxworkers', 8)
+        self.workers = WorkerPool.shared(self.maxworkers)
+        self.confcache = LRUCache(confgetint(self.config, 'cache', 'confmaxsize', 64))
+
+    ################################################################################
+    #                           Infoservice access
+    ################################################################################
+
+    def _getentity(self, entityclass, name, fields=None, fresh=False):
+        '''
+        Retrieves entity from infoservice, going through the entity cache and then the
+        on-disk cache when enabled.
+
+        :param List str fields: If given, return a Projection of these attributes. The
+                                infoservice only serves whole entities, so this restricts
+                                what is exposed rather than what is transferred.
+        :param Boolean fresh: Retrieve it from the infoservice even if cached, e.g. to
+                              poll a request's state.
+        '''
+        if fields is not None:
+            fields = checkfields(entityclass, fields)
+        if self.cache is None:
+            eo = self._fetchentity(entityclass, name, fresh)
+        else:
+            eo = None
+            if not fresh:
+                eo = self.cache.get(entityclass, name)
+            if eo is None:
+                eo = self._fetchentity(entityclass, name, fresh)
+                if eo is not None:
+                    self.cache.put(entityclass, eo)
+        if eo is not None and fields is not None:
+            eo = Projection.fromEntity(eo, fields)
+        return eo
+
+    def _fetchentity(self, entityclass, name, fresh=False):
+        '''
+        Retrieves entity from the on-disk cache if enabled and it holds it (unless fresh),
+        otherwise from the infoservice (caching it on disk).
+        '''
+        if self.diskcache is None:
+            return self.ic.getentity(entityclass, name)
+        if not fresh:
+            attrs = self.diskcache.get(entityclass, name)
+            if attrs is not None:
+                return entityclass.objectFromDict({ name : attrs })
+        eo = self.ic.getentity(entityclass, name)
+        if eo is not None:
+            self.diskcache.put(entityclass, eo)
+        return eo
+
+    def _listentities(self, entityclass, fields=None):
+        '''
+        Lists all entities of entityclass.
+
+        :param List str fields: If given, return Projections holding only these attributes,
+                                read from the raw infoservice document without constructing
+                                the entities. Other attributes are retrieved per entity on
+                                first access. name is always included.
+        '''
+        if fields is None and self.diskcache is None:
+            return self.ic.listentities(entityclass)
+        return list(self._iterentities(entityclass, fields))
+
+    def _iterentities(self, entityclass, fields=None, fresh=False):
+        '''
+        Generator over all entities of entityclass, decoding each one only when the
+        caller asks for it. Each raw entry is dropped from the retrieved document as it
+        is decoded, so at most the document plus one entity are held at a time, rather
+        than the document plus every entity.
+
+        :param List str fields: As for _listentities.
+        :param Boolean fresh: As for _listdocuments.
+        '''
+        if fields is not None:
+            fields = checkfields(entityclass, fields)
+        docs = self._listdocuments(entityclass, fresh)
+        while docs:
+            (name, attrs) = docs.popitem()
+            if fields is None:
+                yield entityclass.objectFromDict({ name : attrs })
+            else:
+                yield Projection.fromDocument(entityclass, name, attrs or {}, fields,
+                                              functools.partial(self._getentity, entityclass, name))
+
+    def _listdocuments(self, entityclass, fresh=False):
+        '''
+        Returns dictionary of name -> attributes for all entityclass entities, undecoded.
+
+        :param Boolean fresh: Retrieve them from the infoservice even if the on-disk cache
+                              holds a listing.
+        '''
+        if self.diskcache is not None and not fresh:
+            docs = self.diskcache.documents(entityclass)
+            if docs is not None:
+                return docs
+        doc = self.ic.getdocumentobject(entityclass.infokey)
+        docs = {}
+        if doc is not None:
+            docs = doc.get(entityclass.infokey) or {}
+        if self.diskcache is not None:
+            self.diskcache.storeDocuments(entityclass, docs)
+        return docs
+
+    def _storeentity(self, entity):
+        '''
+        Stores entity in infoservice and drops any cached copy of it.
+        '''
+        try:
+            entity.store(self.ic)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(entity.__class__, entity.name)
+        self.eligibility.entityStored(entity)
+        self.indexes.entityStored(entity)
+        if self.diskcache is not None:
+            self.diskcache.entityStored(entity)
+
+    def _storeentities(self, entities):
+        '''
+        Stores several entities, in a single call if the infoclient provides
+        storeentities(), otherwise concurrently.
+
+        :return: list with the exception raised for each entity, or None where it was stored.
+        '''
+        bulk = getattr(self.ic, 'storeentities', None)
+        if bulk is None:
+            return [ e for (r, e) in self._parallel(self._storeentity, entities) ]
+
+        try:
+            bulk(entities)
+            errors = [ None ] * len(entities)
+        except Exception, e:
+            errors = [ e ] * len(entities)
+        for (entity, e) in zip(entities, errors):
+            if self.cache is not None:
+                self.cache.invalidate(entity.__class__, entity.name)
+            if e is None:
+                self.eligibility.entityStored(entity)
+                self.indexes.entityStored(entity)
+        if self.diskcache is not None:
+            self.diskcache.entitiesStored([ entity for (entity, e) in zip(entities, errors) if e is None ])
+        return errors
+
+    def _deleteentity(self, entityclass, name):
+        try:
+            self.ic.deleteentity(entityclass, name)
+        finally:
+            if self.cache is not None:
+                self.cache.invalidate(entityclass, name)
+        self.eligibility.entityDeleted(entityclass, name)
+        self.indexes.entityDeleted(entityclass, name)
+        if self.diskcache is not None:
+            self.diskcache.entityDeleted(entityclass, name)
+
+    def batch(self, rollback=True):
+        '''
+        Returns a WriteBatch that queues stores and deletes and performs them together
+        on exit from a with block, in dependency order::
+
+            with capi.batch() as b:
+                b.store(nodeinfo)
+                b.store(nodeset)
+                b.store(cluster)
+                b.store(request)
+
+        :param Boolean rollback: On failure, delete entities newly created by the batch.
+        :rtype: WriteBatch
+        '''
+        return WriteBatch(self, rollback=rollback)
+
+    def _parallel(self, func, items, workers=None):
+        '''
+        Calls func(item) for every item on the pool of [netcomm] maxworkers threads
+        shared by the clients of the process, or in this thread when there is only one
+        item or when called from one of the pool's threads.
+
+        Returns list of (result, exception) tuples in the same order as items. Exceptions
+        are collected rather than raised, so one failure does not abort the rest; each
+        keeps the traceback of the thread that raised it as __traceback__, for callers
+        re-raising it with raise e.__class__, e, e.__traceback__
+        '''
+        def call(item):
+            try:
+                return (func(item), None)
+            except Exception, e:
+                e.__traceback__ = sys.exc_info()[2]
+                return (None, e)
+
+        items = list(items)
+        if len(items) <= 1:
+            return [ call(i) for i in items ]
+        if self.instrument is not None:
+            call = self.instrument.propagate(call)
+        return self.workers.map(call, items, workers)
+
+    def getMany(self, entityclass, names, fields=None):
+        '''
+        Retrieves several entities of the same class concurrently.
+
+        :param class entityclass: InfoEntity subclass, e.g. Nodeset
+        :param List str names: Names of the entities to get.
+        :param List str fields: Return Projections of these attributes (see _getentity).
+        :return: (entities, errors) where entities is a list in the order of names, with
+                 None for each name that could not be retrieved, and errors maps those
+                 names to the exception raised (e.g. InfoEntityMissingException).
+        :rtype: tuple
+        '''
+        names = list(names)
+        unique = list(OrderedDict.fromkeys(names))
+        if fields is not None:
+            fields = checkfields(entityclass, fields)
+        results = self._parallel(lambda n: self._getentity(entityclass, n, fields), unique)
+
+        found = {}
+        errors = {}
+        for (name, (eo, e)) in zip(unique, results):
+            if e is None and eo is None:
+                e = InfoEntityMissingException("%s %s does not exist" % (entityclass.__name__, name))
+            if e is not None:
+                self.log.debug("Could not get %s %s: %s" % (entityclass.__name__, name, e))
+                errors[name] = e
+            else:
+                found[name] = eo
+        return ([ found.get(n) for n in names ], errors)
+
+    def query(self, entityclass, fields=None, **criteria):
+        '''
+        Returns the entities of entityclass whose attributes equal all criteria, e.g.::
+
+            capi.query(Request, owner='jdoe', state='running')
+
+        Criteria set to None are ignored. A list-valued attribute (Project members,
+        Request allocations, ...) matches if it contains the value.
+
+        Answered from an EntityIndex: a snapshot of the collection, listed once and
+        reloaded after [cache] index_ttl seconds, with an index per queried attribute.
+        Changes made through this client are applied to it immediately; changes made
+        by others may go unseen for up to index_ttl. Only matching entities are decoded.
+
+        :param List str fields: Return Projections of these attributes (see _listentities).
+        :raises ValueError: for criteria that are not attributes of entityclass.
+        :return: list of entities, sorted by name.
+        '''
+        criteria = dict([ (a, v) for (a, v) in criteria.items() if v is not None ])
+        checkfields(entityclass, criteria.keys())
+        if fields is not None:
+            fields = checkfields(entityclass, fields)
+        index = self.indexes.get(entityclass)
+        if index.stale():
+            index.load(self._listdocuments(entityclass))
+
+        entities = []
+        for (name, attrs) in index.lookup(criteria):
+            if fields is None:
+                entities.append(entityclass.objectFromDict({ name : attrs }))
+            else:
+                entities.append(Projection.fromDocument(entityclass, name, attrs, fields,
+                                                        functools.partial(self._getentity, entityclass, name)))
+        return entities
+
+    def withSnapshot(self, snapshot=None):
+        '''
+        Returns a VC3ClientAPI whose read calls are answered from snapshot rather than
+        the infoservice, for reports and other work reading the registry many times over.
+        Calls that would write to the infoservice raise snapshot.SnapshotReadOnly. The
+        snapshot is kept as attribute snapshot of the returned client, to be refreshed
+        or queried directly (see snapshot.Snapshot).
+
+        :param Snapshot snapshot: If None, one of all entity kinds is loaded now.
+        :rtype: VC3ClientAPI
+        '''
+        from snapshot import Snapshot, SnapshotInfoClient
+        if snapshot is None:
+            snapshot = Snapshot(self).load()
+        view = object.__new__(self.__class__)
+        # Instance attributes only: methods wrapped by Instrumentation.install() are bound to self.
+        view.__dict__.update([ (k, v) for (k, v) in self.__dict__.items() if not hasattr(self.__class__, k) ])
+        view.ic = SnapshotInfoClient(snapshot)
+        view.snapshot = snapshot
+        view.instrument = None
+        view.cache = None
+        view.diskcache = None
+        view.eligibility = EligibilityIndex(ttl=self.eligibility.ttl)
+        view.indexes = snapshot.indexes
+        return view
+
+    def getCacheStats(self):
+        '''
+        Returns dictionary of entity cache counters (hits, misses, evictions, ...),
+        or None if the cache is not enabled.
+        '''
+        if self.cache is None:
+            return None
+        return self.cache.stats()
+
+    def clearCache(self):
+        if self.cache is not None:
+            self.cache.clear()
+        if self.diskcache is not None:
+            self.diskcache.clear()
+        self.indexes.invalidate()
+
+    def getPoolStats(self):
+        '''
+        Returns dictionary of connection pool counters (requests, handshakes,
+        handshakes_avoided, ...), or None if pooling is disabled.
+        '''
+        if self.pool is None:
+            return None
+        return self.pool.stats()
 
     ################################################################################
     #                           Policy related checks
     ################################################################################
 
+    def __policy_entities(self, entityclass):
+        '''
+        Lists entityclass entities for a policy check, read from the infoservice
+        rather than from the on-disk cache.
+        '''
+        docs = self._listdocuments(entityclass, fresh=True)
+        return [ entityclass.objectFromDict({ name : attrs }) for (name, attrs) in docs.items() ]
+
     def __has_validated_allocation(self, user=None):
         """
         Check to see if the
         :param user: name from User object (e.g. User.name)
         :return: True if user has a validated allocation
         """
-        allocations = self.listAllocations()
-        for allocation in allocations:
-            if user == allocation.owner and allocation.state == "validated":
-                return True
-        return False
+        if not self.eligibility.ttl:
+            # No snapshot: scan a live listing, decoding up to the first match.
+            for allocation in self._iterentities(Allocation, fresh=True):
+                if user == allocation.owner and allocation.state == "validated":
+                    return True
+            return False
+        if self.eligibility.allocationsStale():
+            self.eligibility.loadAllocations(self.__policy_entities(Allocation))
+        return self.eligibility.hasValidatedAllocation(user)
 
     def __has_project(self, user=None):
         """
@@ -80,11 +450,14 @@ class VC3ClientAPI(object):
         :param user: name from User object (e.g. User.name)
         :return: True if user is owns a project or is a project member
         """
-        projects = self.listProjects()
-        for project in projects:
-            if user == project.owner or user in project.members:
-                return True
-        return False
+        if not self.eligibility.ttl:
+            for project in self._iterentities(Project, fresh=True):
+                if user == project.owner or user in (project.members or []):
+                    return True
+            return False
+        if self.eligibility.projectsStale():
+            self.eligibility.loadProjects(self.__policy_entities(Project))
+        return self.eligibility.hasProject(user)
 
     def __valid_user(self, user=None):
         """
@@ -153,24 +526,37 @@ class VC3ClientAPI(object):
         :param User u:  User to add. 
         :return: None
         '''
-        user.store(self.ic)
+        self._storeentity(user)
           
 
-    def listUsers(self):
+    def listUsers(self, fields=None):
         '''
         Returns list of all valid users as a list of User objects. 
 
+        :param List str fields: Only load these attributes (see _listentities).
         :return: return description
         :rtype: List of User objects. 
         
         '''
-        return self.ic.listentities(User)
+        return self._listentities(User, fields)
+
+    def iterUsers(self, fields=None):
+        '''
+        Like listUsers(), but returns a generator yielding User objects as they are decoded.
+        '''
+        return self._iterentities(User, fields)
        
-    def getUser(self, username):
-        return self.ic.getentity(User , username)
+    def getUser(self, username, fields=None):
+        return self._getentity(User, username, fields)
+
+    def getUsers(self, usernames, fields=None):
+        '''
+        :return: (users, errors) as returned by getMany()
+        '''
+        return self.getMany(User, usernames, fields)
     
     def deleteUser(self, username):
-        self.ic.deleteentity( User, username)
+        self._deleteentity(User, username)
     
     ################################################################################
     #                           Project-related calls
@@ -227,7 +613,7 @@ class VC3ClientAPI(object):
         self.log.debug("Storing project %s" % project)
         if policy_user is not None and policy_user != project.owner:
             raise PermissionDenied("{0} is not the project owner".format(policy_user))
-        project.store(self.ic)
+        self._storeentity(project)
         self.log.debug("Done.")
     
     def addUserToProject(self, user, project, policy_user=None):
@@ -262,15 +648,11 @@ class VC3ClientAPI(object):
             if policy_user is not None:
                 if po.owner != policy_user and user not in po.members:
                     err_msg = "{0} is not allowed ".format(policy_user)
-                    err_msg += "to remove {0} from {1}".format(user.displayname,
-                                                               project)
+                    err_msg += "to remove {0} from {1}".format(user, project)
                     raise PermissionDenied(err_msg)
 
             po.removeUser(user)
             self.storeProject(po)
-        self.log.debug("Removing user %s from project object %s " % (user, po))
-        po.removeUser(user)
-        self.storeProject(po)
 
     def addAllocationToProject(self, allocation, projectname, policy_user=None):
         '''
@@ -313,41 +695,65 @@ class VC3ClientAPI(object):
             po.removeAllocation(allocation)
             self.storeProject(po)
 
-    def listProjects(self, policy_user=None):
+    def listProjects(self, policy_user=None, fields=None):
         """
         :param str policy_user: The VC3 user name of the user trying this operation
         """
         if policy_user is not None and not self.__valid_user(policy_user):
             raise PermissionDenied(policy_user + "is not a valid user")
-        return self.ic.listentities(Project)
+        return self._listentities(Project, fields)
+
+    def iterProjects(self, policy_user=None, fields=None):
+        """
+        Like listProjects(), but returns a generator yielding Project objects as they are decoded.
+
+        :param str policy_user: The VC3 user name of the user trying this operation
+        """
+        if policy_user is not None and not self.__valid_user(policy_user):
+            raise PermissionDenied(policy_user + "is not a valid user")
+        return self._iterentities(Project, fields)
        
-    def getProject(self, projectname, policy_user=None):
+    def getProject(self, projectname, policy_user=None, fields=None):
+        """
+        :param str policy_user: The VC3 user name of the user trying this operation
+        """
+        if policy_user is not None and not self.__valid_user(policy_user):
+            raise PermissionDenied(policy_user + "is not a valid user")
+        return self._getentity(Project, projectname, fields)
+
+    def getProjects(self, projectnames, policy_user=None, fields=None):
         """
         :param str policy_user: The VC3 user name of the user trying this operation
+        :return: (projects, errors) as returned by getMany()
         """
         if policy_user is not None and not self.__valid_user(policy_user):
             raise PermissionDenied(policy_user + "is not a valid user")
-        return self.ic.getentity(Project, projectname)
+        return self.getMany(Project, projectnames, fields)
 
     def getProjectsOfOwner(self, ownername, policy_user=None):
         """
+        Returns projects owned by ownername, sorted by name, from a fresh listing
+        (unlike query(), which may answer from a snapshot up to index_ttl old).
+
         :param str policy_user: The VC3 user name of the user trying this operation
         """
         if policy_user is not None and not self.__valid_user(policy_user):
             raise PermissionDenied(policy_user + "is not a valid user")
-        projects = self.listProjects()
-        filtered = [ p for p in projects if ownername == p.owner ]
-        return filtered
+        docs = self._listdocuments(Project, fresh=True)
+        return [ Project.objectFromDict({ name : attrs }) for (name, attrs) in sorted(docs.items())
+                 if (attrs or {}).get('owner') == ownername ]
 
     def getProjectsOfUser(self, username, policy_user=None):
         """
+        Returns projects username is a member of, sorted by name, from a fresh listing.
+
         :param str policy_user: The VC3 user name of the user trying this operation
         """
         if policy_user is not None and not self.__valid_user(policy_user):
             raise PermissionDenied(policy_user + "is not a valid user")
-        projects = self.listProjects()
-        filtered = [ p for p in projects if username in p.members ]
-        return filtered
+        docs = self._listdocuments(Project, fresh=True)
+        return [ Project.objectFromDict({ name : attrs }) for (name, attrs) in sorted(docs.items())
+                 if username in ((attrs or {}).get('members') or []) ]
 
     def deleteProject(self, projectname, policy_user=None):
         """
@@ -357,7 +763,7 @@ class VC3ClientAPI(object):
             po = self.getProject(projectname)
             if po is not None and po.owner != policy_user:
                 raise PermissionDenied(policy_user + "is not the project owner")
-        self.ic.deleteentity( Project, projectname)
+        self._deleteentity(Project, projectname)
 
         
     ################################################################################
@@ -436,16 +842,25 @@ class VC3ClientAPI(object):
     
     
     def storeResource(self, resource):
-        resource.store(self.ic)
+        self._storeentity(resource)
     
-    def listResources(self):
-        return self.ic.listentities(Resource)
+    def listResources(self, fields=None):
+        return self._listentities(Resource, fields)
+
+    def iterResources(self, fields=None):
+        '''
+        Like listResources(), but returns a generator yielding Resource objects as they are decoded.
+        '''
+        return self._iterentities(Resource, fields)
        
-    def getResource(self, resourcename):
-        return self.ic.getentity(Resource, resourcename)
+    def getResource(self, resourcename, fields=None):
+        return self._getentity(Resource, resourcename, fields)
+
+    def getResources(self, resourcenames, fields=None):
+        return self.getMany(Resource, resourcenames, fields)
 
     def deleteResource(self, resourcename):
-        self.ic.deleteentity( Resource, resourcename)
+        self._deleteentity(Resource, resourcename)
 
 
     ################################################################################
@@ -510,13 +925,22 @@ class VC3ClientAPI(object):
             except InfoEntityMissingException:
                 # if allocation isn't in infoservice, check not needed
                 pass
-        allocation.store(self.ic)
+        self._storeentity(allocation)
 
-    def listAllocations(self):
-        return self.ic.listentities( Allocation )
+    def listAllocations(self, fields=None):
+        return self._listentities(Allocation, fields)
+
+    def iterAllocations(self, fields=None):
+        '''
+        Like listAllocations(), but returns a generator yielding Allocation objects as they are decoded.
+        '''
+        return self._iterentities(Allocation, fields)
        
-    def getAllocation(self, allocationname):
-        return self.ic.getentity( Allocation, allocationname)
+    def getAllocation(self, allocationname, fields=None):
+        return self._getentity(Allocation, allocationname, fields)
+
+    def getAllocations(self, allocationnames, fields=None):
+        return self.getMany(Allocation, allocationnames, fields)
 
     def deleteAllocation(self, allocationname, policy_user=None):
         """
@@ -526,7 +950,7 @@ class VC3ClientAPI(object):
             alloc = self.getAllocation(allocationname)
             if alloc is not None and alloc.owner != policy_user:
                 raise PermissionDenied(policy_user + "is not the allocation owner")
-        self.ic.deleteentity( Allocation, allocationname)
+        self._deleteentity(Allocation, allocationname)
 
 
     def getAllocationPubToken(self, allocationname):
@@ -602,30 +1026,46 @@ class VC3ClientAPI(object):
                 raise PermissionDenied(policy_user +
                                        "needs a valid allocation or " +
                                        "be a project member")
-        cluster.store(self.ic)
+        self._storeentity(cluster)
     
-    def listClusters(self, policy_user=None):
+    def __check_cluster_reader(self, policy_user):
+        if not self.__valid_user(policy_user):
+            raise PermissionDenied(policy_user +
+                                   "is not a valid user")
+
+        if (self.__has_validated_allocation(policy_user) or
+                self.__has_project(policy_user)):
+            pass
+        else:
+            # user needs a validated allocation or to be a project member to
+            # store a template
+            raise PermissionDenied(policy_user +
+                                   "needs a valid allocation or " +
+                                   "be a project member")
+
+    def listClusters(self, policy_user=None, fields=None):
         """
         :param str policy_user: The VC3 user name of the user trying this operation
         """
         if policy_user is not None:
-            if not self.__valid_user(policy_user):
-                raise PermissionDenied(policy_user +
-                                       "is not a valid user")
+            self.__check_cluster_reader(policy_user)
+        return self._listentities(Cluster, fields)
 
-            if (self.__has_validated_allocation(policy_user) or
-                    self.__has_project(policy_user)):
-                pass
-            else:
-                # user needs a validated allocation or to be a project member to
-                # store a template
-                raise PermissionDenied(policy_user +
-                                       "needs a valid allocation or " +
-                                       "be a project member")
-        return self.ic.listentities(Cluster)
+    def iterClusters(self, policy_user=None, fields=None):
+        """
+        Like listClusters(), but returns a generator yielding Cluster objects as they are decoded.
+
+        :param str policy_user: The VC3 user name of the user trying this operation
+        """
+        if policy_user is not None:
+            self.__check_cluster_reader(policy_user)
+        return self._iterentities(Cluster, fields)
        
-    def getCluster(self, clustername):
-        return self.ic.getentity(Cluster, clustername)
+    def getCluster(self, clustername, fields=None):
+        return self._getentity(Cluster, clustername, fields)
+
+    def getClusters(self, clusternames, fields=None):
+        return self.getMany(Cluster, clusternames, fields)
 
     def deleteCluster(self, clustername, policy_user=None):
         """
@@ -635,21 +1075,18 @@ class VC3ClientAPI(object):
             cluster = self.getCluster(clustername)
             if cluster is not None and cluster.owner != policy_user:
                 raise PermissionDenied(policy_user + "is not the cluster owner")
-        self.ic.deleteentity(Cluster , clustername)
+        self._deleteentity(Cluster, clustername)
 
     def addNodesetToCluster(self, nodesetname, clustername, policy_user=None):
         """
         :param str policy_user: The VC3 user name of the user trying this operation
         """
-        if policy_user is not None:
-            cluster = self.getCluster(clustername)
-            if cluster is not None and cluster.owner != policy_user:
-                raise PermissionDenied(policy_user + "is not the cluster owner")
-
         co = self.getCluster(clustername)
         if co is None:
             self.log.warning('Could not find cluster object %s', clustername)
         else:
+            if policy_user is not None and co.owner != policy_user:
+                raise PermissionDenied(policy_user + "is not the cluster owner")
             co.addNodeset(nodesetname)
             self.storeCluster(co, policy_user)
        
@@ -657,15 +1094,12 @@ class VC3ClientAPI(object):
         """
         :param str policy_user: The VC3 user name of the user trying this operation
         """
-        if policy_user is not None:
-            cluster = self.getCluster(clustername)
-            if cluster is not None and cluster.owner != policy_user:
-                raise PermissionDenied(policy_user + "is not the cluster owner")
-
         co = self.getCluster(clustername)
         if co is None:
             self.log.warning('Could not find cluster object %s', clustername)
         else:
+            if policy_user is not None and co.owner != policy_user:
+                raise PermissionDenied(policy_user + "is not the cluster owner")
             co.removeNodeset(nodesetname)
             self.storeCluster(co, policy_user)
 
@@ -703,17 +1137,26 @@ class VC3ClientAPI(object):
         self.log.debug("Created Nodeinfo object: %s" % ns)
         return ns 
     
-    def listNodeinfos(self):
-        return self.ic.listentities(Nodeinfo)
+    def listNodeinfos(self, fields=None):
+        return self._listentities(Nodeinfo, fields)
+
+    def iterNodeinfos(self, fields=None):
+        '''
+        Like listNodeinfos(), but returns a generator yielding Nodeinfo objects as they are decoded.
+        '''
+        return self._iterentities(Nodeinfo, fields)
        
-    def getNodeinfo(self, nodeinfoName):
-        return self.ic.getentity(Nodeinfo, nodeinfoName)
+    def getNodeinfo(self, nodeinfoName, fields=None):
+        return self._getentity(Nodeinfo, nodeinfoName, fields)
+
+    def getNodeinfos(self, nodeinfoNames, fields=None):
+        return self.getMany(Nodeinfo, nodeinfoNames, fields)
 
     def deleteNodeinfo(self, nodeinfoName):
-        self.ic.deleteentity(Nodeinfo, nodeinfoName)
+        self._deleteentity(Nodeinfo, nodeinfoName)
     
     def storeNodeinfo(self, nodeinfo):
-        nodeinfo.store(self.ic)
+        self._storeentity(nodeinfo)
         
 
     ################################################################################
@@ -757,17 +1200,26 @@ class VC3ClientAPI(object):
         self.log.debug("Created Nodeset object: %s" % ns)
         return ns 
     
-    def listNodesets(self):
-        return self.ic.listentities(Nodeset)
+    def listNodesets(self, fields=None):
+        return self._listentities(Nodeset, fields)
+
+    def iterNodesets(self, fields=None):
+        '''
+        Like listNodesets(), but returns a generator yielding Nodeset objects as they are decoded.
+        '''
+        return self._iterentities(Nodeset, fields)
        
-    def getNodeset(self, nodesetname):
-        return self.ic.getentity(Nodeset, nodesetname)
+    def getNodeset(self, nodesetname, fields=None):
+        return self._getentity(Nodeset, nodesetname, fields)
+
+    def getNodesets(self, nodesetnames, fields=None):
+        return self.getMany(Nodeset, nodesetnames, fields)
 
     def deleteNodeset(self, nodesetname):
-        self.ic.deleteentity(Nodeset, nodesetname)
+        self._deleteentity(Nodeset, nodesetname)
     
     def storeNodeset(self, nodeset):
-        nodeset.store(self.ic)
+        self._storeentity(nodeset)
 
     ################################################################################
     #                        Environment-related calls
@@ -805,16 +1257,25 @@ class VC3ClientAPI(object):
         return e
     
     def storeEnvironment(self, environment):
-        environment.store(self.ic)
+        self._storeentity(environment)
     
-    def listEnvironments(self):
-        return self.ic.listentities(Environment)
+    def listEnvironments(self, fields=None):
+        return self._listentities(Environment, fields)
+
+    def iterEnvironments(self, fields=None):
+        '''
+        Like listEnvironments(), but returns a generator yielding Environment objects as they are decoded.
+        '''
+        return self._iterentities(Environment, fields)
        
-    def getEnvironment(self, environmentname):
-        return self.ic.getentity(Environment, environmentname)
+    def getEnvironment(self, environmentname, fields=None):
+        return self._getentity(Environment, environmentname, fields)
+
+    def getEnvironments(self, environmentnames, fields=None):
+        return self.getMany(Environment, environmentnames, fields)
 
     def deleteEnvironment(self, environmentname):
-        self.ic.deleteentity(Environment , environmentname)
+        self._deleteentity(Environment, environmentname)
 
 
     ################################################################################
@@ -878,85 +1339,209 @@ class VC3ClientAPI(object):
                     raise PermissionDenied("{0} must be in project {1}".format(alloc,
                                                                                project.name))
 
-        request.store(self.ic)
+        self._storeentity(request)
 
 
-    def listRequests(self):
-        return self.ic.listentities(Request)
+    def listRequests(self, fields=None):
+        return self._listentities(Request, fields)
+
+    def iterRequests(self, fields=None):
+        '''
+        Like listRequests(), but returns a generator yielding Request objects as they are decoded.
+        '''
+        return self._iterentities(Request, fields)
        
-    def getRequest(self, requestname, policy_user=None):
+    def getRequest(self, requestname, policy_user=None, fields=None):
         """
         :param str policy_user: The VC3 user name of the user trying this operation
         """
+        if policy_user is None:
+            return self._getentity(Request, requestname, fields)
+        request = self._getentity(Request, requestname)
+        if request is not None and request.owner != policy_user:
+            raise PermissionDenied(policy_user + "is not the request owner")
+        if request is not None and fields is not None:
+            request = Projection.fromEntity(request, checkfields(Request, fields))
+        return request
+
+    def getRequests(self, requestnames, policy_user=None, fields=None):
+        """
+        :param str policy_user: The VC3 user name of the user trying this operation
+        :return: (requests, errors) as returned by getMany(). With policy_user, requests
+                 not owned by that user are reported in errors as PermissionDenied.
+        """
+        (requests, errors) = self.getMany(Request, requestnames, fields)
         if policy_user is not None:
-            request = self.ic.getentity(Request, requestname)
-            if request is not None and request.owner != policy_user:
-                raise PermissionDenied(policy_user + "is not the request owner")
-        return self.ic.getentity( Request, requestname)
+            for (i, r) in enumerate(requests):
+                if r is not None and r.owner != policy_user:
+                    errors[r.name] = PermissionDenied(policy_user + "is not the request owner")
+                    requests[i] = None
+        return (requests, errors)
 
     def deleteRequest(self, requestname, policy_user=None):
         """
+        Deletes request together with its cloned cluster and the cluster's nodesets.
+        Nodesets are deleted concurrently; children that no longer exist count as deleted.
+
         :param str policy_user: The VC3 user name of the user trying this operation
+        :raises CascadeDeleteError: if some child could not be deleted. The request and
+                                    cluster are kept in that case.
         """
+        errors = self.deleteRequests([ requestname ], policy_user)
+        if errors:
+            raise errors[requestname]
 
-        request = self.getRequest(requestname)
-        if request is not None:
-            if policy_user is not None and request.owner != policy_user:
-                raise PermissionDenied(policy_user + "is not the request owner")
-            else:
+    def deleteRequests(self, requestnames, policy_user=None, workers=None):
+        """
+        Deletes several requests as deleteRequest() does. The teardowns are done together,
+        one pass per kind: the requests and then their clusters are retrieved, all of the
+        clusters' nodesets are deleted concurrently, then the clusters, then the requests.
 
-                try:
-                    if request.cluster:
-                        self.log.debug('Deleting cloned cluster template %s' % request.cluster)
-                        cluster = self.ic.getentity(Cluster, request.cluster)
-
-                    for nodeset in cluster.nodesets:
-                        try:
-                            self.log.debug('Deleting cloned nodeset %s' % nodeset)
-                            self.deleteNodeset(nodeset)
-                        except Exception, e:
-                            self.log.error('Could not delete cloned nodeset %s' % nodeset)
-                            raise e
-
-                    self.deleteCluster(request.cluster)
-                except Exception, e:
-                    self.log.error('Could not delete cloned cluster %s' % request.cluster)
-                    raise e
+        :param str policy_user: The VC3 user name of the user trying this operation
+        :param int workers: Maximum number of concurrent deletes. Defaults to [netcomm] maxworkers.
+        :return: Dictionary of request name -> exception for the requests not deleted
+                 (empty if all were). A request whose children could not all be deleted
+                 is kept, and reported with a CascadeDeleteError.
+        """
+        requestnames = list(OrderedDict.fromkeys(requestnames))
+        (requests, errors) = self.getRequests(requestnames, policy_user)
+        requests = [ r for r in requests if r is not None ]
 
-        self.ic.deleteentity( Request, requestname)
+        def delete(entityclass, name):
+            try:
+                self._deleteentity(entityclass, name)
+            except InfoEntityMissingException:
+                self.log.debug('Cloned %s %s already deleted' % (entityclass.__name__, name))
+
+        def deleteall(entityclass, names):
+            outcomes = self._parallel(lambda n: delete(entityclass, n), names, workers)
+            return dict([ (n, e) for (n, (r, e)) in zip(names, outcomes) if e is not None ])
+
+        # Cloned cluster template -> names of the requests using it.
+        owners = OrderedDict()
+        for r in requests:
+            if r.cluster:
+                owners.setdefault(r.cluster, []).append(r.name)
+        failed = {}    # request name -> list of (entityclass, name, exception)
+
+        def fail(entityclass, name, clustername, e):
+            self.log.error('Could not delete cloned %s %s: %s' % (entityclass.__name__.lower(), name, e))
+            for requestname in owners[clustername]:
+                failed.setdefault(requestname, []).append((entityclass, name, e))
+
+        (clusters, clustererrors) = self.getMany(Cluster, owners.keys())
+        for (name, e) in clustererrors.items():
+            if isinstance(e, InfoEntityMissingException):
+                self.log.debug('Cloned cluster template %s already deleted' % name)
+            else:
+                fail(Cluster, name, name, e)
+        clusters = [ c for c in clusters if c is not None ]
+
+        nodesets = [ (c.name, n) for c in clusters for n in (c.nodesets or []) ]
+        self.log.debug('Deleting cloned nodesets %s' % [ n for (c, n) in nodesets ])
+        nodeseterrors = deleteall(Nodeset, [ n for (c, n) in nodesets ])
+        for (clustername, n) in nodesets:
+            if n in nodeseterrors:
+                fail(Nodeset, n, clustername, nodeseterrors[n])
+
+        # A cluster is kept while any of its nodesets is.
+        clusternames = [ c.name for c in clusters if not [ r for r in owners[c.name] if r in failed ] ]
+        self.log.debug('Deleting cloned cluster templates %s' % clusternames)
+        for (name, e) in deleteall(Cluster, clusternames).items():
+            fail(Cluster, name, name, e)
+
+        for (name, children) in failed.items():
+            errors[name] = CascadeDeleteError(name, children)
+        names = [ r.name for r in requests if r.name not in errors ]
+        outcomes = self._parallel(lambda n: self._deleteentity(Request, n), names, workers)
+        for (name, (r, e)) in zip(names, outcomes):
+            if e is not None:
+                errors[name] = e
+        return errors
 
     def terminateRequest(self, requestname, policy_user=None):
         """
         :param str policy_user: The VC3 user name of the user trying this operation
         """
-        if policy_user is not None:
-            request = self.getRequest(requestname)
-            if request is not None and request.owner != policy_user:
-                raise PermissionDenied(policy_user + "is not the request owner")
-
-        r = self.ic.getentity( Request, requestname)
+        r = self.getRequest(requestname, policy_user)
         if r is not None:
             self.log.debug("Setting request action to terminate...")
             r.action = 'terminate'
-            r.store(self.ic)
+            self._storeentity(r)
             print("Request.action set to terminate.")
         else:
             self.log.info("Request is None.")
 
     def getRequestStatus(self, requestname):
-        r = self.ic.getentity( Request, requestname)
+        r = self._getentity(Request, requestname, fresh=True)
         out = (None, None)
         if r is not None:
             out = (r.statusraw, r.statusinfo)
         return out
 
     def getRequestState(self, requestname):
-        r = self.ic.getentity( Request, requestname)
+        r = self._getentity(Request, requestname, fresh=True)
         out = (None, None)
         if r is not None:
             out = (r.state, r.state_reason)
         return out      
 
+    def getRequestStatusSummary(self, requestname, previous=None):
+        '''
+        Returns RequestStatus with the request's job counters per nodeset, per allocation
+        and overall, parsed from statusraw.
+
+        :param RequestStatus previous: Result of the previous poll of this request. It is
+                                       updated in place, re-parsing only changed factory
+                                       reports, and returned.
+        :return: RequestStatus, or None if the request does not exist.
+        :rtype: RequestStatus
+        '''
+        try:
+            r = self._getentity(Request, requestname, fresh=True)
+        except InfoEntityMissingException:
+            r = None
+        if r is None:
+            return None
+        if previous is None:
+            return RequestStatus(requestname, r.statusraw)
+        previous.update(r.statusraw)
+        return previous
+
+    def watchRequests(self, names=None, owner=None, project=None,
+                            mininterval=2.0, maxinterval=60.0, untilfinal=False):
+        '''
+        Returns generator of request state transitions, polling all watched requests
+        from one loop. Requests in transitional states are polled every mininterval
+        seconds; the interval of requests unchanged in running, terminated or failure
+        state doubles at each poll up to maxinterval. See watch.RequestWatcher.
+
+        :param List str names: Requests to watch. If None, watch all requests of owner
+                               and/or project, including ones created later.
+        :param Boolean untilfinal: Stop once all watched requests are terminated, failed
+                                   or deleted.
+        :return: Generator of dictionaries with time, request, state, state_reason,
+                 previous_state and previous_state_reason.
+        '''
+        watcher = RequestWatcher(self, names=names, owner=owner, project=project,
+                                 mininterval=mininterval, maxinterval=maxinterval,
+                                 untilfinal=untilfinal)
+        return watcher.events()
+
+    def getFleetStatus(self, fleet=None):
+        '''
+        Returns FleetStatus summarizing the state and job counters of all requests, read
+        in one listing without decoding the requests' other attributes.
+
+        :param FleetStatus fleet: Result of the previous call, to be updated in place.
+                                  Only requests whose status changed are re-parsed.
+        :rtype: FleetStatus
+        '''
+        if fleet is None:
+            fleet = FleetStatus()
+        fleet.update(self._iterentities(Request, [ 'state', 'statusraw' ]))
+        return fleet
+
     def saveRequestAsBlueprint(self, requestid, newlabel):
         '''
         Take the specified request and store it as a re-usable blueprint with new label
@@ -967,6 +1552,57 @@ class VC3ClientAPI(object):
     ################################################################################
     #                        Infrastructural calls
     ################################################################################ 
+    def _conf(self, requestname, conftype, request):
+        '''
+        Returns the cache entry of the request's queues or auth conf, a dictionary of
+        digest (sha1 of the encoded blob), text (decoded), parser (ConfigParser, None
+        until parsed) and items (section -> items, filled as sections are asked for).
+        Entries are keyed by request and conftype and replaced when the blob changes, so
+        a conf is decoded and parsed once per blob, and each of its sections interpolated
+        once, only when asked for.
+
+        :param str conftype: queues|auth
+        :param Request request: The request.
+        '''
+        blob = getattr(request, '%sconf' % conftype)
+        encoded = blob.encode('utf-8') if isinstance(blob, unicode) else blob
+        digest = hashlib.sha1(encoded or '').hexdigest()
+        key = (requestname, conftype)
+        conf = self.confcache.get(key)
+        if conf is None or conf['digest'] != digest:
+            conf = { 'digest' : digest, 'text' : self.decode(blob), 'parser' : None, 'items' : {} }
+            self.confcache.put(key, conf)
+        return conf
+
+    def _confsections(self, requestname, conftype, sections=None):
+        '''
+        Returns OrderedDict of section -> list of (option, value) of the request's queues
+        or auth conf, for sections (all if None).
+        '''
+        r = self.getRequest(requestname)
+        if not getattr(r, '%sconf' % conftype):
+            raise Exception('Request %s does not have a %s.conf defined' % (requestname, conftype))
+        try:
+            conf = self._conf(requestname, conftype, r)
+            parser = conf['parser']
+            if parser is None:
+                parser = ConfigParser.ConfigParser()
+                parser.readfp(StringIO.StringIO(conf['text']))
+                conf['parser'] = parser
+            result = OrderedDict()
+            for section in (parser.sections() if sections is None else sections):
+                items = conf['items'].get(section)
+                if items is None:
+                    items = conf['items'][section] = parser.items(section)
+                result[section] = list(items)
+            return result
+        except Exception, e:
+            self.log.error('Error decoding %s.conf of request %s' % (conftype, requestname))
+            raise e
+
+    def _confsection(self, requestname, conftype, section):
+        return self._confsections(requestname, conftype, [ section ])[section]
+
     def getQueuesConf(self, requestname, queuename):
         '''
         Get the queues.conf sections for the specified request and queuename
@@ -974,41 +1610,21 @@ class VC3ClientAPI(object):
         May raise InfoMissingEntityException if Request doesn't exist. 
         
         '''
-        r = self.getRequest(requestname)
-
-        if not r.queuesconf:
-            raise Exception('Request %s does not have a queues.conf defined' % requestname)
-
-        try:
-            buf   = StringIO.StringIO(self.decode(r.queuesconf))
-            qconf = ConfigParser.ConfigParser()
-            qconf.readfp(buf)
+        return self._confsection(requestname, 'queues', queuename)
 
-            return qconf.items(queuename)
+    def getAllQueuesConf(self, requestname):
+        '''
+        Get all queues.conf sections of the specified request from one fetch and parse.
 
-        except Exception, e:
-            self.log.error('Error decoding queues.conf of request %s' % requestname)
-            raise e
+        :return: OrderedDict of queue name -> list of (option, value), as getQueuesConf returns.
+        '''
+        return self._confsections(requestname, 'queues')
 
     def getAuthConf(self, requestname, queuename):
         '''
         Get the auth.conf sections for the specified request and queuename
         '''
-        r = self.getRequest(requestname)
-
-        if not r.authconf:
-            raise Exception('Request %s does not have a auth.conf defined' % requestname)
-
-        try:
-            buf   = StringIO.StringIO(self.decode(r.authconf))
-            aconf = ConfigParser.ConfigParser()
-            aconf.readfp(buf)
-
-            return aconf.items(queuename)
-
-        except Exception, e:
-            self.log.error('Error decoding auth.conf of request %s' % requestname)
-            raise e
+        return self._confsection(requestname, 'auth', queuename)
 
     def getConfString(self, conftype, requestname ):
         '''
@@ -1017,12 +1633,8 @@ class VC3ClientAPI(object):
         r = self.getRequest(requestname)
         cs = ""
         if r:
-            if conftype == 'queues':
-                buf  = StringIO.StringIO(self.decode(r.queuesconf))
-                cs = buf.read()
-            elif conftype == 'auth':
-                buf   = StringIO.StringIO(self.decode(r.authconf))
-                cs = buf.read()
+            if conftype in ('queues', 'auth'):
+                cs = self._conf(requestname, conftype, r)['text']
         else:
             self.log.debug("No request with name %s" % requestname)
         return cs
@@ -1064,6 +1676,8 @@ class VC3ClientAPI(object):
 
     @classmethod
     def validate_ssh_pub_key(self, keystr):
+        import subprocess
+        import tempfile
         fh = tempfile.NamedTemporaryFile(prefix = "client-key", delete = False)
         try:
             fh.write(keystr)
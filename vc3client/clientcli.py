@@ -9,7 +9,6 @@ __email__ = "jhover@bnl.gov"
 __status__ = "Production"
 
 import argparse
-import base64
 import logging
 import os
 import sys
@@ -18,19 +17,122 @@ import warnings
 
 
 from ConfigParser import ConfigParser
-from client import VC3ClientAPI
-from vc3infoservice.core import  InfoMissingPairingException, InfoConnectionFailure, InfoEntityExistsException, InfoEntityMissingException, InfoEntityUpdateMissingException
+
+# The client modules, and through them the infoservice client, are only imported
+# once a subcommand is run, so that --help and usage errors stay quick.
 
 
 class VC3ClientCLI(object):
     '''
     
     '''
+
+    # Subcommands (name, help), in the order --help lists them. The arguments of each
+    # are added by method _parser_<name>, with '-' replaced by '_', only when that
+    # subcommand is the one being run.
+    SUBCOMMANDS = [
+        ('user-create', 'create new vc3 user'),
+        ('user-list', 'list vc3 user(s)'),
+        ('user-delete', 'delete a vc3 user'),
+        ('project-create', 'create new vc3 project'),
+        ('project-adduser', 'add user to vc3 project'),
+        ('project-removeuser', 'remove user from vc3 project'),
+        ('project-addallocation', 'add allocation to vc3 project'),
+        ('project-removeallocation', 'remove allocation from vc3 project'),
+        ('project-list', 'list all vc3 project(s)'),
+        ('project-delete', 'delete a vc3 project'),
+        ('resource-create', 'create new vc3 resource'),
+        ('resource-list', 'list vc3 resource(s)'),
+        ('resource-delete', 'delete vc3 resource'),
+        ('allocation-create', 'create new vc3 allocation'),
+        ('allocation-list', 'list vc3 allocation(s)'),
+        ('allocation-getpubtoken', 'print pub token'),
+        ('allocation-delete', 'delete a vc3 allocation'),
+        ('allocation-validate', 'Validate allocation.'),
+        ('nodeinfo-create', 'create new nodeinfo specification'),
+        ('nodeinfo-list', 'list vc3 nodeinfo(s)'),
+        ('nodeinfo-delete', 'delete a nodeinfo specification'),
+        ('nodeset-create', 'create new nodeset specification'),
+        ('nodeset-list', 'list vc3 nodeset(s)'),
+        ('nodeset-delete', 'delete a nodeset specification'),
+        ('cluster-create', 'create new cluster specification'),
+        ('cluster-list', 'list vc3 cluster(s)'),
+        ('cluster-addnodeset', 'add a nodeset to a cluster specification'),
+        ('cluster-removenodeset', 'add a nodeset to a cluster specification'),
+        ('cluster-delete', 'delete a cluster specification'),
+        ('environment-create', 'create new environment'),
+        ('environment-list', 'list vc3 environment(s)'),
+        ('environment-delete', 'delete an environment'),
+        ('request-create', 'create new request specification'),
+        ('request-list', 'list vc3 request(s)'),
+        ('request-getconfstring', 'Get configuration string from Request(s)'),
+        ('request-terminate', 'Terminate request.'),
+        ('request-status', 'Get status of the Request.'),
+        ('request-watch', 'Print state transitions of Request(s) as they happen, one JSON object per line.'),
+        ('request-state', 'Get state of the Request.'),
+        ('request-delete', 'delete a request specification'),
+        ('apply', 'create or update all entities described in a YAML manifest'),
+        ('pairing-create', 'create new pairing request'),
+        ('pairing-retrieve', 'Get cert and key for a pairing request'),
+        ('batch', 'run subcommands read one per line from a file, with one client'),
+        ('shell', 'interactive shell running subcommands with one client'),
+        ]
+
     def __init__(self):
+        self._parsers = {}   # subcommand -> ArgumentParser
         self.parseopts()
         self.setuplogging()
 
-    def parseopts(self):
+    def parseopts(self, args=None):
+        if args is None:
+            args = sys.argv[1:]
+        self.results = self.parse(args)
+
+    def parse(self, args):
+        '''
+        Returns namespace of command line args. As for other usage errors, argparse exits
+        if filter options of a list subcommand are given together with an entity name.
+        '''
+        parser = self.makeparser(self.findsubcommand(args))
+        ns = parser.parse_args(args)
+        kind = ns.subcommand[:-len('-list')]
+        if ns.subcommand.endswith('-list') and getattr(ns, kind + 'name', None) is not None and self.filters(ns):
+            parser.error('%s: filter options cannot be combined with a %s name' % (ns.subcommand, kind))
+        return ns
+
+    def findsubcommand(self, args):
+        '''
+        Returns the subcommand named in command line args, or None, without building
+        a parser.
+        '''
+        args = list(args)
+        while args:
+            a = args.pop(0)
+            if a == '--':
+                return args[0] if args else None
+            if a.startswith('--'):
+                # --config VALUE, or any abbreviation argparse accepts
+                if '=' not in a and len(a) > 2 and 'config'.startswith(a[2:]):
+                    args = args[1:]
+            elif a.startswith('-') and len(a) > 1:
+                # -c VALUE, possibly after other flags (-dc VALUE); -cVALUE takes none
+                if a.endswith('c') and 'c' not in a[1:-1]:
+                    args = args[1:]
+            else:
+                return a
+        return None
+
+    def makeparser(self, subcommand=None):
+        '''
+        Returns ArgumentParser for the global options and subcommand. Other subcommands are
+        left out, so an invocation only pays for building the arguments of the one it runs.
+        If subcommand is None or unknown, every subcommand is listed, without arguments,
+        for --help and usage errors.
+        '''
+        parser = self._parsers.get(subcommand)
+        if parser is not None:
+            return parser
+
         parser = argparse.ArgumentParser()
         parser.add_argument('-c', '--config', 
                             action="store", 
@@ -47,13 +149,95 @@ class VC3ClientCLI(object):
                             action="store_true", 
                             dest='verbose', 
                             help='verbose/info logging')            
+
+        parser.add_argument('--no-cache', 
+                            action="store_true", 
+                            dest='nocache', 
+                            help='do not use the on-disk entity cache ([diskcache] in the configuration)')
+
+        parser.add_argument('--refresh', 
+                            action="store_true", 
+                            dest='refresh', 
+                            help='ignore what the on-disk entity cache holds, and update it from the infoservice')
         
         # Init sub-command
-        ########################### User ##########################################
         subparsers = parser.add_subparsers( dest="subcommand")
+        names = [ name for (name, help) in self.SUBCOMMANDS ]
+        for (name, help) in self.SUBCOMMANDS:
+            if subcommand in names and name != subcommand:
+                continue
+            subparser = subparsers.add_parser(name, help=help)
+            if name == subcommand:
+                getattr(self, '_parser_' + name.replace('-', '_'))(subparser)
+
+        self._parsers[subcommand] = parser
+        return parser
+
+    def _outputoptions(self, parser_list):
+        '''
+        Adds the output format and field selection options of the list subcommands.
+        '''
+        from output import FORMATS
+        parser_list.add_argument('-o', '--output',
+                                 action="store",
+                                 dest="output",
+                                 choices=FORMATS,
+                                 required=False,
+                                 help='output format: text (default), json, ndjson (one object per line) or tsv',
+                                 default='text')
+
+        parser_list.add_argument('--fields',
+                                 action="store",
+                                 required=False,
+                                 help='comma-separated list of attributes to show, e.g. name,state,owner',
+                                 default=None)
+
+    def _filteroptions(self, parser_list, *attributes):
+        '''
+        Adds an option per attribute restricting a listing to the entities with that
+        value, e.g. --owner. An attribute may be given as (option, attribute) when
+        they differ.
+        '''
+        for a in attributes:
+            (option, attribute) = a if isinstance(a, tuple) else (a, a)
+            parser_list.add_argument('--%s' % option,
+                                     action="store",
+                                     dest="filter_%s" % attribute,
+                                     metavar=option.upper(),
+                                     required=False,
+                                     help='list only entities with this %s' % option,
+                                     default=None)
 
-        parser_usercreate = subparsers.add_parser('user-create', 
-                                                help='create new vc3 user')
+    def filters(self, ns):
+        '''
+        Returns dictionary of attribute -> value of the filter options given in ns.
+        '''
+        return dict([ (k[len('filter_'):], v) for (k, v) in vars(ns).items()
+                      if k.startswith('filter_') and v is not None ])
+
+    def listentities(self, ns, out, capi, entityclass, iterate):
+        '''
+        Writes the entities listed by iterate, or, if filter options are given in ns,
+        the entities of entityclass matching them (see VC3ClientAPI.query).
+        '''
+        filters = self.filters(ns)
+        if filters:
+            entities = capi.query(entityclass, fields=ns.fields, **filters)
+        else:
+            entities = iterate(fields=ns.fields)
+        self.writeentities(ns, out, entities)
+
+    def writeentities(self, ns, out, entities, single=False):
+        '''
+        Writes entities to out in the format and with the fields of the list subcommand
+        in ns, as they are iterated.
+        '''
+        from output import EntityWriter
+        EntityWriter(out, ns.output, ns.fields, single=single).writeall(entities)
+
+
+    ########################### User ##########################################
+    def _parser_user_create(self, parser_usercreate):
         parser_usercreate.add_argument('username', 
                                      action="store")
         
@@ -122,25 +306,19 @@ class VC3ClientCLI(object):
                                      required=False,
                                      default=None 
                                      )          
-        
-        
-        
-        parser_userlist = subparsers.add_parser('user-list', 
-                                                help='list vc3 user(s)')
-        
+
+    def _parser_user_list(self, parser_userlist):
+        self._outputoptions(parser_userlist)
+        self._filteroptions(parser_userlist, 'state')
         parser_userlist.add_argument('--username', 
                                      action="store")
 
-        parser_userdelete = subparsers.add_parser('user-delete', 
-                                                help='delete a vc3 user')
+    def _parser_user_delete(self, parser_userdelete):
         parser_userdelete.add_argument('username', 
                                      action="store")
-        
-       
-        ########################### Project ##########################################
-        parser_projectcreate = subparsers.add_parser('project-create', 
-                                                help='create new vc3 project')
-        
+
+    ########################### Project ##########################################
+    def _parser_project_create(self, parser_projectcreate):
         parser_projectcreate.add_argument('projectname', 
                                      action="store")
 
@@ -191,9 +369,7 @@ class VC3ClientCLI(object):
                                      default=None 
                                      )
 
-        parser_projectadduser = subparsers.add_parser('project-adduser', 
-                                                help='add user to vc3 project')
-        
+    def _parser_project_adduser(self, parser_projectadduser):
         parser_projectadduser.add_argument('projectname', 
                                      action="store")
 
@@ -201,10 +377,7 @@ class VC3ClientCLI(object):
                                      action="store", 
                                      )
 
-
-        parser_projectremoveuser = subparsers.add_parser('project-removeuser', 
-                help='remove user from vc3 project')
-        
+    def _parser_project_removeuser(self, parser_projectremoveuser):
         parser_projectremoveuser.add_argument('projectname', 
                                      action="store")
 
@@ -212,10 +385,7 @@ class VC3ClientCLI(object):
                                      action="store", 
                                      )
 
-
-        parser_projectaddallocation = subparsers.add_parser('project-addallocation', 
-                                                help='add allocation to vc3 project')
-
+    def _parser_project_addallocation(self, parser_projectaddallocation):
         parser_projectaddallocation.add_argument('projectname', 
                                      action="store")
 
@@ -223,10 +393,7 @@ class VC3ClientCLI(object):
                                      action="store", 
                                      )
 
-
-        parser_projectremoveallocation = subparsers.add_parser('project-removeallocation', 
-                                                help='remove allocation from vc3 project')
-
+    def _parser_project_removeallocation(self, parser_projectremoveallocation):
         parser_projectremoveallocation.add_argument('projectname', 
                                      action="store")
 
@@ -234,11 +401,9 @@ class VC3ClientCLI(object):
                                      action="store", 
                                      )
 
-              
-        
-        parser_projectlist = subparsers.add_parser('project-list', 
-                                                help='list all vc3 project(s)')
-
+    def _parser_project_list(self, parser_projectlist):
+        self._outputoptions(parser_projectlist)
+        self._filteroptions(parser_projectlist, 'owner', 'state', ('member', 'members'))
         parser_projectlist.add_argument('--projectname', 
                                      action="store",
                                      dest='projectname',
@@ -246,17 +411,12 @@ class VC3ClientCLI(object):
                                      help='list details of specified project',
                                      default=None)
 
-        parser_projectdelete = subparsers.add_parser('project-delete', 
-                                                help='delete a vc3 project')
-        
+    def _parser_project_delete(self, parser_projectdelete):
         parser_projectdelete.add_argument('projectname', 
                                      action="store")
 
-
-        ########################### Resource ##########################################
-        parser_resourcecreate = subparsers.add_parser('resource-create', 
-                                                help='create new vc3 resource')
-        
+    ########################### Resource ##########################################
+    def _parser_resource_create(self, parser_resourcecreate):
         parser_resourcecreate.add_argument('resourcename',
                                            action="store")
 
@@ -397,10 +557,10 @@ class VC3ClientCLI(object):
                                      dest="organization",
                                      required=False 
                                      )                
-                                        
-        parser_resourcelist = subparsers.add_parser('resource-list', 
-                                                help='list vc3 resource(s)')
 
+    def _parser_resource_list(self, parser_resourcelist):
+        self._outputoptions(parser_resourcelist)
+        self._filteroptions(parser_resourcelist, 'owner', 'state')
         parser_resourcelist.add_argument('--resource',
                                          dest='resourcename', 
                                          action="store",
@@ -408,16 +568,12 @@ class VC3ClientCLI(object):
                                          help='list details of specified resource',
                                          default=None)
 
-        parser_resourcedelete = subparsers.add_parser('resource-delete', 
-                                                help='delete vc3 resource')
-        
+    def _parser_resource_delete(self, parser_resourcedelete):
         parser_resourcedelete.add_argument('resourcename',
                                            action="store")
 
-        ########################### Allocation  ##########################################
-        parser_allocationcreate = subparsers.add_parser('allocation-create', 
-                                                help='create new vc3 allocation')
-        
+    ########################### Allocation  ##########################################
+    def _parser_allocation_create(self, parser_allocationcreate):
         parser_allocationcreate.add_argument('allocationname', 
                                      action="store")
 
@@ -477,42 +633,34 @@ class VC3ClientCLI(object):
                                      required=False,
                                      default=None 
                                      )
-        
-        parser_allocationlist = subparsers.add_parser('allocation-list', 
-                                                help='list vc3 allocation(s)')
 
+    def _parser_allocation_list(self, parser_allocationlist):
+        self._outputoptions(parser_allocationlist)
+        self._filteroptions(parser_allocationlist, 'owner', 'state', 'resource')
         parser_allocationlist.add_argument('--allocationname',
                                         action="store",
                                         required=False, 
                                         help='list details of specified allocation',
                                         default=None)
 
-        parser_allocationgetpubtoken = subparsers.add_parser('allocation-getpubtoken', 
-                                                help='print pub token')
-
+    def _parser_allocation_getpubtoken(self, parser_allocationgetpubtoken):
         parser_allocationgetpubtoken.add_argument('--allocationname', 
                                         action="store",
                                         required=True,
                                         help='specify allocation')
 
-        parser_allocationdelete = subparsers.add_parser('allocation-delete', 
-                                                help='delete a vc3 allocation')
-        
+    def _parser_allocation_delete(self, parser_allocationdelete):
         parser_allocationdelete.add_argument('allocationname', 
                                      action="store")
 
-        parser_allocationvalidate = subparsers.add_parser('allocation-validate', 
-                                                help='Validate allocation.')
-
+    def _parser_allocation_validate(self, parser_allocationvalidate):
         parser_allocationvalidate.add_argument('--allocationname', 
                                         action="store",
                                         required=True,
                                         help='specify allocation')
 
-        ########################### Nodeinfo  ##########################################
-        parser_nodeinfocreate = subparsers.add_parser('nodeinfo-create',
-                                                     help='create new nodeinfo specification')
-
+    ########################### Nodeinfo  ##########################################
+    def _parser_nodeinfo_create(self, parser_nodeinfocreate):
         parser_nodeinfocreate.add_argument('--owner', 
                                           action="store", 
                                           dest="owner", 
@@ -581,27 +729,22 @@ class VC3ClientCLI(object):
         parser_nodeinfocreate.add_argument('nodeinfoname', 
             help='name of the nodeinfo to be created',
             action="store")
-      
-        parser_nodeinfolist = subparsers.add_parser('nodeinfo-list', 
-                                                help='list vc3 nodeinfo(s)')
 
+    def _parser_nodeinfo_list(self, parser_nodeinfolist):
+        self._outputoptions(parser_nodeinfolist)
+        self._filteroptions(parser_nodeinfolist, 'owner', 'state')
         parser_nodeinfolist.add_argument('--nodeinfoname', 
                                          action="store",
                                          required=False, 
                                          help='list details of specified nodeinfo',
                                          default=None)
 
-        parser_nodeinfodelete = subparsers.add_parser('nodeinfo-delete',
-                                                     help='delete a nodeinfo specification')
-
+    def _parser_nodeinfo_delete(self, parser_nodeinfodelete):
         parser_nodeinfodelete.add_argument('nodeinfoname',
                                            action="store")
 
-        
-        ########################### Nodeset  ##########################################
-        parser_nodesetcreate = subparsers.add_parser('nodeset-create',
-                                                     help='create new nodeset specification')
-
+    ########################### Nodeset  ##########################################
+    def _parser_nodeset_create(self, parser_nodesetcreate):
         parser_nodesetcreate.add_argument('--owner', 
                                           action="store", 
                                           dest="owner", 
@@ -686,26 +829,22 @@ class VC3ClientCLI(object):
         parser_nodesetcreate.add_argument('nodesetname', 
             help='name of the nodeset to be created',
             action="store")
-      
-        parser_nodesetlist = subparsers.add_parser('nodeset-list', 
-                                                help='list vc3 nodeset(s)')
 
+    def _parser_nodeset_list(self, parser_nodesetlist):
+        self._outputoptions(parser_nodesetlist)
+        self._filteroptions(parser_nodesetlist, 'owner', 'state')
         parser_nodesetlist.add_argument('--nodesetname', 
                                          action="store",
                                          required=False, 
                                          help='list details of specified nodeset',
                                          default=None)
 
-        parser_nodesetdelete = subparsers.add_parser('nodeset-delete',
-                                                     help='delete a nodeset specification')
+    def _parser_nodeset_delete(self, parser_nodesetdelete):
         parser_nodesetdelete.add_argument('nodesetname',
                                            action="store")
 
-                                                        
-        ########################### Cluster  ##########################################
-        parser_clustercreate = subparsers.add_parser('cluster-create', 
-                help='create new cluster specification')
-
+    ########################### Cluster  ##########################################
+    def _parser_cluster_create(self, parser_clustercreate):
         parser_clustercreate.add_argument('clustername', 
                 help='name of the cluster to be created',
                 action="store")
@@ -758,18 +897,16 @@ class VC3ClientCLI(object):
                                      default=False, 
                                      )
 
-        parser_clusterlist = subparsers.add_parser('cluster-list', 
-                                                help='list vc3 cluster(s)')
-
+    def _parser_cluster_list(self, parser_clusterlist):
+        self._outputoptions(parser_clusterlist)
+        self._filteroptions(parser_clusterlist, 'owner', 'state')
         parser_clusterlist.add_argument('--clustername', 
                                          action="store",
                                          required=False, 
                                          help='list details of specified cluster',
                                          default=None)
-    
-        parser_clusteraddnodeset = subparsers.add_parser('cluster-addnodeset', 
-                help='add a nodeset to a cluster specification')
-    
+
+    def _parser_cluster_addnodeset(self, parser_clusteraddnodeset):
         parser_clusteraddnodeset.add_argument('clustername',
                                               action='store',
                                               help='clustername to add nodeset to'
@@ -779,11 +916,8 @@ class VC3ClientCLI(object):
                                               action='store',
                                               help='nodeset to add'
                                               )
-            
-        
-        parser_clusterremovenodeset = subparsers.add_parser('cluster-removenodeset', 
-                help='add a nodeset to a cluster specification')
-    
+
+    def _parser_cluster_removenodeset(self, parser_clusterremovenodeset):
         parser_clusterremovenodeset.add_argument('clustername',
                                               action='store',
                                               help='clustername to remove nodeset from'
@@ -794,17 +928,12 @@ class VC3ClientCLI(object):
                                               help='nodeset to remove'
                                               )
 
-        parser_clusterdelete = subparsers.add_parser('cluster-delete', 
-                help='delete a cluster specification')
-
+    def _parser_cluster_delete(self, parser_clusterdelete):
         parser_clusterdelete.add_argument('clustername', 
                                           action="store")
-            
-        
-        ########################### Environment  ##########################################
-        parser_environcreate = subparsers.add_parser('environment-create', 
-                help='create new environment')
 
+    ########################### Environment  ##########################################
+    def _parser_environment_create(self, parser_environcreate):
         parser_environcreate.add_argument('environmentname', 
                 help='name of the environment to be created',
                 action="store")
@@ -883,28 +1012,23 @@ class VC3ClientCLI(object):
                                      required=False,
                                      default=None 
                                      ) 
-        
-        parser_environmentlist = subparsers.add_parser('environment-list', 
-                                                help='list vc3 environment(s)')
 
+    def _parser_environment_list(self, parser_environmentlist):
+        self._outputoptions(parser_environmentlist)
+        self._filteroptions(parser_environmentlist, 'owner', 'state')
         parser_environmentlist.add_argument('--environmentname', 
                                          action="store",
                                          required=False, 
                                          help='list details of specified environment',
                                          default=None)
 
-        parser_environdelete = subparsers.add_parser('environment-delete', 
-                help='delete an environment')
-
+    def _parser_environment_delete(self, parser_environdelete):
         parser_environdelete.add_argument('environmentname', 
                 help='name of the environment to be deleted',
                 action="store")
 
-        
-        ########################### Request  ##########################################
-        parser_requestcreate = subparsers.add_parser('request-create', 
-                help='create new request specification')
-
+    ########################### Request  ##########################################
+    def _parser_request_create(self, parser_requestcreate):
         parser_requestcreate.add_argument('requestname', 
                                     help='name of the request to be created',
                                     action="store")
@@ -992,19 +1116,16 @@ class VC3ClientCLI(object):
                                      default=None 
                                      )
 
-        parser_requestlist = subparsers.add_parser('request-list', 
-                                                help='list vc3 request(s)')
-
+    def _parser_request_list(self, parser_requestlist):
+        self._outputoptions(parser_requestlist)
+        self._filteroptions(parser_requestlist, 'owner', 'state', 'project', 'cluster')
         parser_requestlist.add_argument('--requestname', 
                                          action="store",
                                          required=False, 
                                          help='list details of specified request',
                                          default=None)
 
-        
-        parser_requestgetconfstr = subparsers.add_parser('request-getconfstring', 
-                                                help='Get configuration string from Request(s)')
-        
+    def _parser_request_getconfstring(self, parser_requestgetconfstr):
         parser_requestgetconfstr.add_argument('--requestname', 
                                          action="store",
                                          required=True, 
@@ -1017,23 +1138,18 @@ class VC3ClientCLI(object):
                                          help='auth|queues',
                                          default=None) 
 
-        
-        parser_requestterminate = subparsers.add_parser('request-terminate', 
-                                                help='Terminate request.')
-        
+    def _parser_request_terminate(self, parser_requestterminate):
         parser_requestterminate.add_argument('--requestname', 
                                          action="store",
                                          required=True, 
                                          help='Name of relevant Request.',
                                          default=None)             
 
-        parser_requeststatus = subparsers.add_parser('request-status', 
-                                                help='Get status of the Request.')
-        
+    def _parser_request_status(self, parser_requeststatus):
         parser_requeststatus.add_argument('--requestname', 
                                          action="store",
-                                         required=True, 
-                                         help='Name of relevant Request.',
+                                         required=False, 
+                                         help='Name of relevant Request. Required unless --fleet is given.',
                                          default=None)          
 
         parser_requeststatus.add_argument('--raw', 
@@ -1042,34 +1158,93 @@ class VC3ClientCLI(object):
                                          help='Name of relevant Request.',
                                          default=False)  
 
-        parser_requeststate = subparsers.add_parser('request-state', 
-                                                help='Get state of the Request.')
-        
+        parser_requeststatus.add_argument('--summary', 
+                                         action="store_true",
+                                         required=False, 
+                                         help='Show job counters per nodeset and allocation.',
+                                         default=False)  
+
+        parser_requeststatus.add_argument('--fleet', 
+                                         action="store_true",
+                                         required=False, 
+                                         help='Show summary over all requests.',
+                                         default=False)  
+
+    def _parser_request_watch(self, parser_requestwatch):
+        parser_requestwatch.add_argument('requestname', 
+                                         nargs='*',
+                                         help='Name(s) of Request(s) to watch. Defaults to all selected by --owner/--project.')
+
+        parser_requestwatch.add_argument('--owner', 
+                                         action="store",
+                                         required=False, 
+                                         help='Watch all requests of this user.',
+                                         default=None)          
+
+        parser_requestwatch.add_argument('--project', 
+                                         action="store",
+                                         required=False, 
+                                         help='Watch all requests of this project.',
+                                         default=None)          
+
+        parser_requestwatch.add_argument('--interval', 
+                                         action="store",
+                                         dest='mininterval',
+                                         type=float,
+                                         required=False, 
+                                         help='Seconds between polls of requests changing state [2].',
+                                         default=2.0)          
+
+        parser_requestwatch.add_argument('--max-interval', 
+                                         action="store",
+                                         dest='maxinterval',
+                                         type=float,
+                                         required=False, 
+                                         help='Longest interval between polls of requests in a stable state [60].',
+                                         default=60.0)          
+
+        parser_requestwatch.add_argument('--until-done', 
+                                         action="store_true",
+                                         dest='untilfinal',
+                                         required=False, 
+                                         help='Exit once all watched requests are terminated, failed or deleted.',
+                                         default=False)  
+
+    def _parser_request_state(self, parser_requeststate):
         parser_requeststate.add_argument('--requestname', 
                                          action="store",
                                          required=True, 
                                          help='Name of relevant Request.',
                                          default=None)          
 
-        parser_requestdelete = subparsers.add_parser('request-delete', 
-                help='delete a request specification')
-
+    def _parser_request_delete(self, parser_requestdelete):
         parser_requestdelete.add_argument('requestname', 
-                                    help='name of the request to be deleted',
+                                    help='name(s) of the request(s) to be deleted',
+                                    nargs='+',
                                     action="store")
 
-        ########################### Pairing  ##########################################
-        parser_pairingcreate = subparsers.add_parser('pairing-create', 
-                                                help='create new pairing request')
-        
+    ########################### Bulk  ##########################################
+    def _parser_apply(self, parser_apply):
+        parser_apply.add_argument('-f', '--file', 
+                                  action="store",
+                                  dest="manifest",
+                                  required=True, 
+                                  help='path of the YAML manifest')
+
+        parser_apply.add_argument('--dry-run', 
+                                  action="store_true",
+                                  dest="dryrun",
+                                  default=False, 
+                                  help='only print what would be created or updated')
+
+    ########################### Pairing  ##########################################
+    def _parser_pairing_create(self, parser_pairingcreate):
         parser_pairingcreate.add_argument('commonname',
                                            action="store",
                                            help='SSL Subject Common Name (CN); a vc3 username or hostname'            
                                            )
 
-        parser_pairingretrieve = subparsers.add_parser('pairing-retrieve', 
-                                                help='Get cert and key for a pairing request')
-        
+    def _parser_pairing_retrieve(self, parser_pairingretrieve):
         parser_pairingretrieve.add_argument('pairingcode',
                                            action="store",
                                            help="unique pairing code from original request")       
@@ -1088,7 +1263,31 @@ class VC3ClientCLI(object):
                                      default=None
                                      )        
 
-        self.results= parser.parse_args()
+    ########################### Batch and shell ##################################
+    def _parser_batch(self, parser_batch):
+        parser_batch.add_argument('-f', '--file',
+                                  action="store",
+                                  dest="batchfile",
+                                  default='-',
+                                  help='file of subcommand lines, as typed after vc3-client. Default: stdin'
+                                  )
+
+        parser_batch.add_argument('--parallel',
+                                  action="store",
+                                  dest="parallel",
+                                  type=int,
+                                  default=1,
+                                  help='run up to this many lines concurrently. Lines after a "wait" line start once all lines before it are done.'
+                                  )
+
+        parser_batch.add_argument('-e', '--exit-on-error',
+                                  action="store_true",
+                                  dest="exitonerror",
+                                  help='stop at the first line that fails'
+                                  )
+
+    def _parser_shell(self, parser_shell):
+        pass
 
 
     def setuplogging(self):
@@ -1108,7 +1307,12 @@ class VC3ClientCLI(object):
         self.log.info('Logging initialized.')
 
 
-    def run(self):
+    def formatcounters(self, counters):
+        from status import STATES
+        states = [ s for s in STATES ] + sorted([ s for s in counters.keys() if s not in STATES ])
+        return ' '.join([ "%s=%s" % (s, counters.get(s, 0)) for s in states ])
+
+    def readconfig(self):
         cp = ConfigParser()
         ns = self.results
         self.log.info("Config string is %s" % ns.configpath)
@@ -1119,14 +1323,122 @@ class VC3ClientCLI(object):
             configfiles.append(os.path.expanduser(p))
         readfiles = cp.read(configfiles)
         self.log.info('Read config files %s' % readfiles)
-        capi = VC3ClientAPI(cp)
-        
+        if ns.nocache or ns.refresh:
+            if not cp.has_section('diskcache'):
+                cp.add_section('diskcache')
+            if ns.nocache:
+                cp.set('diskcache', 'enabled', 'false')
+            if ns.refresh:
+                cp.set('diskcache', 'refresh', 'true')
+        return cp
+
+    def run(self):
+        from client import VC3ClientAPI
+        capi = VC3ClientAPI(self.readconfig())
+        ns = self.results
+        if ns.subcommand == 'batch':
+            code = self.runbatch(ns, capi, sys.stdout)
+        elif ns.subcommand == 'shell':
+            from shell import VC3Shell
+            try:
+                VC3Shell(self, capi).cmdloop()
+            except KeyboardInterrupt:
+                sys.stdout.write('\n')
+            code = 0
+        else:
+            code = self.dispatch(ns, capi, sys.stdout)
+        if code:
+            sys.exit(code)
+
+    def runline(self, line, capi, out):
+        '''
+        Runs one subcommand line (as typed after vc3-client) against capi, writing its
+        output to out.
+
+        :return: exit code the line would have had as a separate vc3-client invocation.
+        '''
+        import shlex
+        try:
+            args = shlex.split(line)
+            ns = self.parse(args)
+        except SystemExit, e:
+            # argparse exits on --help and on usage errors.
+            return e.code or 0
+        if ns.subcommand in ('batch', 'shell'):
+            self.log.error('%s cannot be run from a batch or shell' % ns.subcommand)
+            return 1
+        return self.dispatch(ns, capi, out)
+
+    def runbatch(self, ns, capi, out):
+        '''
+        Runs the subcommand lines of ns.batchfile, skipping blank lines and comments. With
+        --parallel, lines between "wait" lines run concurrently and their output is
+        written in line order once all of them are done.
+
+        :return: highest exit code of the lines run.
+        '''
+        import StringIO
+        if ns.batchfile == '-':
+            text = sys.stdin.read()
+        else:
+            with open(os.path.expanduser(ns.batchfile)) as f:
+                text = f.read()
+
+        # groups of (line number, line), separated by wait
+        groups = [ [] ]
+        for (number, line) in enumerate(text.splitlines(), 1):
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if line == 'wait':
+                groups.append([])
+            else:
+                groups[-1].append((number, line))
+
+        codes = []
+        for group in groups:
+            if ns.parallel > 1 and len(group) > 1:
+                def runbuffered(entry):
+                    buf = StringIO.StringIO()
+                    return (self.runline(entry[1], capi, buf), buf.getvalue())
+                results = capi._parallel(runbuffered, group, workers=ns.parallel)
+                for (entry, (result, e)) in zip(group, results):
+                    (code, output) = result if e is None else (1, '')
+                    if e is not None:
+                        self.log.error('line %d: %s' % (entry[0], e))
+                    out.write(output)
+                    codes.append((entry, code))
+            else:
+                for entry in group:
+                    code = self.runline(entry[1], capi, out)
+                    codes.append((entry, code))
+                    if code and ns.exitonerror:
+                        break
+            out.flush()
+            if ns.exitonerror and [ c for (entry, c) in codes if c ]:
+                break
+
+        failed = [ (entry, c) for (entry, c) in codes if c ]
+        for ((number, line), code) in failed:
+            sys.stderr.write("line %d: exit %d: %s\n" % (number, code, line))
+        sys.stderr.write("%d lines run, %d failed\n" % (len(codes), len(failed)))
+        return max([ 0 ] + [ c for (entry, c) in codes ])
+
+    def dispatch(self, ns, capi, out):
+        '''
+        Executes the subcommand parsed into ns with capi, writing its output to out.
+
+        :return: exit code of the subcommand.
+        '''
+        from client import VC3ClientAPI
+        from entities import User, Project, Resource, Allocation, Nodeinfo, Nodeset, Request, Cluster, Environment
+        from vc3infoservice.core import  InfoMissingPairingException, InfoConnectionFailure, InfoEntityExistsException, InfoEntityMissingException, InfoEntityUpdateMissingException
         try:
             # User commands
             if ns.subcommand == 'user-create':
                 if ns.sshpubstring and not capi.validate_ssh_pub_key(ns.sshpubstring):
                     self.log.error('ssh pub key is not a valid key.')
-                    sys.exit(1)
+                    return 1
 
                 u = capi.defineUser( name = ns.username,
                                      first = ns.firstname,
@@ -1144,13 +1456,10 @@ class VC3ClientCLI(object):
                 capi.storeUser(u)
                 
             elif ns.subcommand == 'user-list' and ns.username is None:
-                ulist = capi.listUsers()
-                for u in ulist:
-                    print(u)
+                self.listentities(ns, out, capi, User, capi.iterUsers)
             
             elif ns.subcommand == 'user-list' and ns.username is not None:
-                uo = capi.getUser(ns.username)
-                print(uo)
+                self.writeentities(ns, out, [ capi.getUser(ns.username, fields=ns.fields) ], single=True)
 
             elif ns.subcommand == 'user-delete':
                 capi.deleteUser(ns.username)
@@ -1175,13 +1484,10 @@ class VC3ClientCLI(object):
                 capi.storeUser(p)    
                 
             elif ns.subcommand == 'project-list' and ns.projectname is None:
-                plist = capi.listProjects()
-                for p in plist:
-                    print(p)
+                self.listentities(ns, out, capi, Project, capi.iterProjects)
             
             elif ns.subcommand == 'project-list' and ns.projectname is not None:
-                po = capi.getProject(ns.projectname)
-                print(po)
+                self.writeentities(ns, out, [ capi.getProject(ns.projectname, fields=ns.fields) ], single=True)
     
             elif ns.subcommand == 'project-adduser':
                 capi.addUserToProject(ns.user, ns.projectname)
@@ -1228,13 +1534,10 @@ class VC3ClientCLI(object):
                 capi.storeResource(r)    
                 
             elif ns.subcommand == 'resource-list' and ns.resourcename is None:
-                rlist = capi.listResources()
-                for r in rlist:
-                    print(r)
+                self.listentities(ns, out, capi, Resource, capi.iterResources)
             
             elif ns.subcommand == 'resource-list' and ns.resourcename is not None:
-                ro = capi.getResource(ns.resourcename)
-                print(ro)
+                self.writeentities(ns, out, [ capi.getResource(ns.resourcename, fields=ns.fields) ], single=True)
 
             elif ns.subcommand == 'resource-delete':
                 capi.deleteResource(ns.resourcename)
@@ -1257,17 +1560,14 @@ class VC3ClientCLI(object):
                 capi.storeAllocation(a)    
                 
             elif ns.subcommand == 'allocation-list' and ns.allocationname is None:
-                alist = capi.listAllocations()
-                for a in alist:
-                    print(a)
+                self.listentities(ns, out, capi, Allocation, capi.iterAllocations)
             
             elif ns.subcommand == 'allocation-list' and ns.allocationname is not None:
-                ao = capi.getAllocation(ns.allocationname)
-                print(ao)
+                self.writeentities(ns, out, [ capi.getAllocation(ns.allocationname, fields=ns.fields) ], single=True)
     
             elif ns.subcommand == 'allocation-getpubtoken':
                 pt = capi.getAllocationPubToken(ns.allocationname)
-                print(pt)
+                out.write("%s\n" % pt)
 
             elif ns.subcommand == 'allocation-delete':
                 capi.deleteAllocation(ns.allocationname)
@@ -1294,13 +1594,10 @@ class VC3ClientCLI(object):
                 capi.storeNodeinfo(n)
     
             elif ns.subcommand == 'nodeinfo-list' and ns.nodeinfoname is None:
-                nsl = capi.listNodeinfos()
-                for ns in nsl:
-                    print(ns)
+                self.listentities(ns, out, capi, Nodeinfo, capi.iterNodeinfos)
                     
             elif ns.subcommand == 'nodeinfo-list' and ns.nodeinfoname is not None:
-                ns = capi.getNodeinfo(ns.nodeinfoname)
-                print(ns)
+                self.writeentities(ns, out, [ capi.getNodeinfo(ns.nodeinfoname, fields=ns.fields) ], single=True)
 
             elif ns.subcommand == 'nodeinfo-delete':
                 capi.deleteNodeinfo(ns.nodeinfoname)
@@ -1325,13 +1622,10 @@ class VC3ClientCLI(object):
                 capi.storeNodeset(n)
     
             elif ns.subcommand == 'nodeset-list' and ns.nodesetname is None:
-                nsl = capi.listNodesets()
-                for ns in nsl:
-                    print(ns)
+                self.listentities(ns, out, capi, Nodeset, capi.iterNodesets)
                     
             elif ns.subcommand == 'nodeset-list' and ns.nodesetname is not None:
-                ns = capi.getNodeset(ns.nodesetname)
-                print(ns)
+                self.writeentities(ns, out, [ capi.getNodeset(ns.nodesetname, fields=ns.fields) ], single=True)
 
             elif ns.subcommand == 'nodeset-delete':
                 capi.deleteNodeset(ns.nodesetname)
@@ -1364,13 +1658,10 @@ class VC3ClientCLI(object):
                 capi.storeCluster(c)
 
             elif ns.subcommand == 'cluster-list' and ns.clustername is None:
-                cl = capi.listClusters()
-                for co in cl:
-                    print(co)
+                self.listentities(ns, out, capi, Cluster, capi.iterClusters)
                     
             elif ns.subcommand == 'cluster-list' and ns.clustername is not None:
-                co = capi.getCluster(ns.clustername)
-                print(co)               
+                self.writeentities(ns, out, [ capi.getCluster(ns.clustername, fields=ns.fields) ], single=True)
                                             
             elif ns.subcommand == 'cluster-addnodeset':
                 capi.addNodesetToCluster( ns.nodesetname,
@@ -1427,13 +1718,10 @@ class VC3ClientCLI(object):
                 capi.storeEnvironment(e)
             
             elif ns.subcommand == 'environment-list' and ns.environmentname is None:
-                elist = capi.listEnvironments()
-                for e in elist:
-                    print(e)
+                self.listentities(ns, out, capi, Environment, capi.iterEnvironments)
             
             elif ns.subcommand == 'environment-list' and ns.environmentname is not None:
-                eo = capi.getEnvironment(ns.environmentname)
-                print(eo)
+                self.writeentities(ns, out, [ capi.getEnvironment(ns.environmentname, fields=ns.fields) ], single=True)
 
             elif ns.subcommand == 'environment-delete':
                 capi.deleteEnvironment(ns.environmentname)
@@ -1467,40 +1755,102 @@ class VC3ClientCLI(object):
                 capi.storeRequest(r)    
             
             elif ns.subcommand == 'request-list' and ns.requestname is None:
-                rlist = capi.listRequests()
-                for r in rlist:
-                    print(r)
+                self.listentities(ns, out, capi, Request, capi.iterRequests)
             
             elif ns.subcommand == 'request-list' and ns.requestname is not None:
-                ro = capi.getRequest(ns.requestname)
-                print(ro)
+                self.writeentities(ns, out, [ capi.getRequest(ns.requestname, fields=ns.fields) ], single=True)
             
             elif ns.subcommand == 'request-getconfstring':
                 cs = capi.getConfString(ns.conftype, ns.requestname)
-                print(cs)
+                out.write("%s\n" % cs)
             
             elif ns.subcommand == 'request-terminate':
                 capi.terminateRequest(ns.requestname)
             
+            elif ns.subcommand == 'request-status' and ns.fleet:
+                summary = capi.getFleetStatus().summary()
+                out.write("requests: %d\n" % summary['requests'])
+                for state in sorted(summary['states'].keys()):
+                    out.write("  %s: %d\n" % (state, summary['states'][state]))
+                out.write("jobs: %s\n" % self.formatcounters(summary['totals']))
+                for allocation in sorted(summary['allocations'].keys()):
+                    out.write("  allocation %s: %s\n" % (allocation, self.formatcounters(summary['allocations'][allocation])))
+
+            elif ns.subcommand == 'request-status' and ns.requestname is None:
+                self.log.error('request-status needs --requestname or --fleet')
+                return 1
+
+            elif ns.subcommand == 'request-status' and ns.summary:
+                rs = capi.getRequestStatusSummary(ns.requestname)
+                out.write("request %s: %s\n" % (rs.name, self.formatcounters(rs.totals)))
+                for nodeset in sorted(rs.nodesets.keys()):
+                    out.write("  nodeset %s: %s\n" % (nodeset, self.formatcounters(rs.nodesets[nodeset])))
+                for allocation in sorted(rs.allocations.keys()):
+                    out.write("  allocation %s: %s\n" % (allocation, self.formatcounters(rs.allocations[allocation])))
+
             elif ns.subcommand == 'request-status':
                 (raw, info) =  capi.getRequestStatus(ns.requestname)
                 if ns.raw:
-                    print(raw)
+                    out.write("%s\n" % raw)
                 else:
-                    print(info)
+                    out.write("%s\n" % info)
     
+            elif ns.subcommand == 'request-watch':
+                import json
+                names = ns.requestname or None
+                if names is None and ns.owner is None and ns.project is None:
+                    self.log.error('request-watch needs request names, --owner or --project')
+                    return 1
+                events = capi.watchRequests(names = names,
+                                            owner = ns.owner,
+                                            project = ns.project,
+                                            mininterval = ns.mininterval,
+                                            maxinterval = ns.maxinterval,
+                                            untilfinal = ns.untilfinal)
+                try:
+                    for event in events:
+                        out.write(json.dumps(event, sort_keys=True) + '\n')
+                        out.flush()
+                except KeyboardInterrupt:
+                    pass
+
             elif ns.subcommand == 'request-state':
                 (state, reason) =  capi.getRequestState(ns.requestname)
-                print((str(state), str(reason)))
+                out.write("%s\n" % ((str(state), str(reason)),))
+
+            elif ns.subcommand == 'request-delete' and len(ns.requestname) == 1:
+                capi.deleteRequest(ns.requestname[0])
 
             elif ns.subcommand == 'request-delete':
-                capi.deleteRequest(ns.requestname)
+                errors = capi.deleteRequests(ns.requestname)
+                for name in ns.requestname:
+                    if name in errors:
+                        out.write("Error: Could not delete request %s: %s\n" % (name, errors[name]))
+                if errors:
+                    return 1
 
             
+            # Bulk commands
+            elif ns.subcommand == 'apply':
+                from batch import BatchError
+                from inventory import Inventory
+                inventory = Inventory.fromFile(ns.manifest)
+                changes = inventory.plan(capi)
+                for c in changes:
+                    out.write("%s\n" % c)
+                if not ns.dryrun:
+                    try:
+                        inventory.apply(capi, changes)
+                    except BatchError, e:
+                        for r in e.results:
+                            if not r.ok:
+                                out.write("%s\n" % r)
+                        return 1
+
             # Pairing commands
             elif ns.subcommand == 'pairing-create':
                 code = capi.requestPairing(ns.commonname)
-                print(code)        
+                out.write("%s\n" % code)
             
             elif ns.subcommand == 'pairing-retrieve':
                 try:
@@ -1525,28 +1875,29 @@ class VC3ClientCLI(object):
                         
                     else:
                         # print cert, key to stdout  
-                        print(cert)
-                        print("")
-                        print(key)
+                        out.write("%s\n" % cert)
+                        out.write("\n")
+                        out.write("%s\n" % key)
                 except InfoMissingPairingException:
-                    print("Invalid pairing code or not satisfied yet. Try in 30 seconds.")   
+                    out.write("Invalid pairing code or not satisfied yet. Try in 30 seconds.\n")
             else:
                 self.log.warning('Unrecognized subcommand is %s' % ns.subcommand)
-                sys.exit(1)
+                return 1
                                
         except InfoEntityUpdateMissingException, e:
-            print("Error: Attempt to update/PUT a non-existent entity.")
-            sys.exit(2)
+            out.write("Error: Attempt to update/PUT a non-existent entity.\n")
+            return 2
         except InfoEntityExistsException, e:
-            print("Error: Attempt to create/POST an entity that already exists.")
-            sys.exit(2)
+            out.write("Error: Attempt to create/POST an entity that already exists.\n")
+            return 2
         except InfoEntityMissingException, e: 
-            print("Error: Attempt to retrieve/GET or delete/DELETE a non-existent entity.")
-            sys.exit(3)
+            out.write("Error: Attempt to retrieve/GET or delete/DELETE a non-existent entity.\n")
+            return 3
         except Exception, e:
-            print("Error: Got unexpected exception %s"% e)
-            sys.exit(1)
-        
+            out.write("Error: Got unexpected exception %s\n" % e)
+            return 1
+        return 0
+
 
 if __name__ == '__main__':
 
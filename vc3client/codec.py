@@ -0,0 +1,174 @@
+#!/bin/env python
+__author__ = "John Hover"
+__copyright__ = "2017 John Hover"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "John Hover"
+__email__ = "jhover@bnl.gov"
+__status__ = "Production"
+
+'''
+Generated conversion between infoservice documents and entity objects.
+
+InfoEntity.objectFromDict() and makeDictObject() walk infoattributes for every object,
+building a kwargs dict on the way in and calling getattr per attribute on the way out.
+For each entity class install() instead compiles, once, a decoder and an encoder that
+name every attribute directly, e.g. for Nodeinfo:
+
+    def decode(cls, doc):
+        for name in doc:
+            break
+        d = doc[name]
+        g = d.get
+        v_cores = g('cores')
+        if v_cores is not None:
+            v_cores = int(v_cores)
+        ...
+        return cls(name, g('state'), g('owner'), v_cores, ...)
+
+    def encode(self, newonly=False):
+        if newonly:
+            return base(self, newonly)
+        return { self.name : { 'name' : self.name, 'state' : self.state, ... } }
+
+intattributes are converted to int and validvalues are checked while decoding. A set
+value outside validvalues is logged and kept, as objectFromDict would, so that one bad
+document does not make a whole listing unreadable.
+'''
+
+import logging
+
+log = logging.getLogger('vc3client')
+
+# co_flags bit of functions taking **kwargs
+CO_VARKEYWORDS = 0x08
+
+
+def _initargs(cls):
+    '''
+    Returns (names of the arguments after self, whether **kwargs is taken) of
+    cls.__init__. Read from the code object: inspect costs more to import than all
+    the codecs take to build.
+    '''
+    code = cls.__init__.im_func.func_code
+    return (code.co_varnames[1:code.co_argcount], bool(code.co_flags & CO_VARKEYWORDS))
+
+
+def _decodersource(cls):
+    '''
+    Returns source of the decoder for cls, or None if the constructor does not take
+    every infoattribute (the generic objectFromDict is kept for such classes).
+    '''
+    (args, keywords) = _initargs(cls)
+    if not keywords and [ a for a in cls.infoattributes if a not in args ]:
+        return None
+
+    lines = [ "def decode(cls, doc):",
+              "    for name in doc:",
+              "        break",
+              "    d = doc[name]",
+              "    g = d.get",
+              ]
+    for a in cls.infoattributes:
+        if a == 'name':
+            continue
+        if a in cls.intattributes or a in cls.validvalues:
+            lines.append("    v_%s = g(%r)" % (a, a))
+        if a in cls.intattributes:
+            lines += [ "    if v_%s is not None:" % a,
+                       "        try:",
+                       "            v_%s = int(v_%s)" % (a, a),
+                       "        except (TypeError, ValueError):",
+                       "            log.warning('%%s %%s: %s is not an integer: %%r', cls.__name__, name, v_%s)" % (a, a),
+                       ]
+        if a in cls.validvalues:
+            lines += [ "    if v_%s is not None and v_%s not in valid_%s:" % (a, a, a),
+                       "        log.warning('%%s %%s: invalid %s %%r', cls.__name__, name, v_%s)" % (a, a),
+                       ]
+
+    def value(a):
+        if a == 'name':
+            return 'name'
+        if a in cls.intattributes or a in cls.validvalues:
+            return 'v_%s' % a
+        return "g(%r)" % a
+
+    # Positional arguments as far as the constructor arguments are infoattributes,
+    # keywords after that.
+    callargs = []
+    positional = True
+    for a in args:
+        if a not in cls.infoattributes:
+            positional = False
+            continue
+        if positional:
+            callargs.append(value(a))
+        else:
+            callargs.append("%s=%s" % (a, value(a)))
+    for a in cls.infoattributes:
+        if a not in args:
+            callargs.append("%s=%s" % (a, value(a)))
+    lines.append("    return cls(%s)" % ', '.join(callargs))
+    return '\n'.join(lines) + '\n'
+
+
+def _encodersource(cls):
+    items = ', '.join([ "%r : self.%s" % (a, a) for a in cls.infoattributes ])
+    lines = [ "def encode(self, newonly=False):",
+              "    if newonly:",
+              "        return base(self, newonly)",
+              "    return { self.name : { %s } }" % items,
+              ]
+    return '\n'.join(lines) + '\n'
+
+
+def _compile(source, name, namespace):
+    code = compile(source, '<codec %s>' % name, 'exec')
+    exec code in namespace
+    return namespace[name]
+
+
+def makeDecoder(cls):
+    '''
+    Returns decoder function for cls, to be used as objectFromDict classmethod,
+    or None if cls cannot use one.
+    '''
+    source = _decodersource(cls)
+    if source is None:
+        return None
+    namespace = { 'log' : log }
+    for (a, valid) in cls.validvalues.items():
+        namespace['valid_%s' % a] = frozenset(valid)
+    f = _compile(source, 'decode', namespace)
+    f.__name__ = 'objectFromDict'
+    f.__doc__ = "Generated decoder for %s documents." % cls.__name__
+    f.source = source
+    return f
+
+
+def makeEncoder(cls):
+    '''
+    Returns encoder function for cls, to be used as makeDictObject method. newonly
+    requests go to the inherited makeDictObject.
+    '''
+    source = _encodersource(cls)
+    namespace = { 'base' : super(cls, cls).makeDictObject.im_func }
+    f = _compile(source, 'encode', namespace)
+    f.__name__ = 'makeDictObject'
+    f.__doc__ = "Generated encoder for %s objects." % cls.__name__
+    f.source = source
+    return f
+
+
+def install(*classes):
+    '''
+    Replaces objectFromDict and makeDictObject of each class with generated versions.
+    '''
+    for cls in classes:
+        decoder = makeDecoder(cls)
+        if decoder is None:
+            log.debug("Constructor of %s does not match its infoattributes, keeping generic codec", cls.__name__)
+            continue
+        cls.objectFromDict = classmethod(decoder)
+        cls.makeDictObject = makeEncoder(cls)
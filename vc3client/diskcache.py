@@ -0,0 +1,436 @@
+#!/bin/env python
+__author__ = "John Hover"
+__copyright__ = "2017 John Hover"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "John Hover"
+__email__ = "jhover@bnl.gov"
+__status__ = "Production"
+
+'''
+On-disk entity cache, shared by the short-lived vc3-client processes of a user.
+
+Opt-in, in vc3-client.conf:
+
+    [diskcache]
+    enabled = true
+    path = ~/.cache/vc3
+    ttl = 60
+    request_ttl = 5
+
+Each entity kind of each infoservice is kept in one file, which is memory-mapped and
+read through a hash table, so getting one entity touches the header, a slot or two and
+the entity's record, whatever the size of the file:
+
+    header   magic 'VC3C', format version, creation time, number of slots, number of
+             entities, whether the file holds a complete listing
+    slots    (64-bit hash of the name, offset of the record, length of the record),
+             open addressing with linear probing; offset 0 marks an empty slot
+    records  length of the name, the name (UTF-8), the attributes as JSON
+
+A file is stale, and ignored, once older than the ttl of its kind. Files are never
+changed in place: every update writes a new file next to it and renames it over the
+old one, so a concurrent reader keeps its consistent mapping of the old file. Writers
+hold an exclusive flock on a lock file next to it ('<file>.lock') from reading the
+file to renaming the new one, so concurrent processes do not lose each other's
+updates. Entities added to or removed from an existing file keep its creation time,
+so nothing is served for longer than ttl after it was listed or fetched.
+
+Rewriting a file costs in proportion to its size, so it is done once per listing and
+once per batch of stores or deletes through the client. An entity fetched by name is
+only cached when it starts a new file; fetches missing from a fresh file are not
+added to it, but come with the next listing.
+
+Files are private to the user (mode 0600 in a 0700 directory): they hold whatever the
+infoservice returns, including allocation tokens.
+'''
+
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import time
+
+from util import confget, confgetboolean, confgetfloat
+
+MAGIC = 'VC3C'
+VERSION = 1
+
+HEADER = struct.Struct('<4sIdIIBxxx')   # magic, version, created, slots, entities, complete
+SLOT = struct.Struct('<QQI')            # hash, offset, length
+NAMELEN = struct.Struct('<I')
+
+
+def _hash(name):
+    # Not hash(): it must be the same in every process.
+    return struct.unpack('<Q', hashlib.md5(name).digest()[:8])[0]
+
+
+def _bytes(name):
+    if isinstance(name, unicode):
+        return name.encode('utf-8')
+    return name
+
+
+class CacheFile(object):
+    '''
+    Read-only, memory-mapped view of one cache file.
+    '''
+
+    def __init__(self, path):
+        '''
+        :raises EnvironmentError: if path cannot be opened or mapped.
+        :raises ValueError: if it is not a cache file of this format version.
+        '''
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, self.created, self.nslots, self.nentries, complete) = HEADER.unpack_from(self._mm, 0)
+        except struct.error:
+            self.close()
+            raise ValueError("%s is truncated" % path)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError("%s is not a version %d cache file" % (path, VERSION))
+        self.complete = bool(complete)
+        # Records follow the slots; each one is checked to lie within the file as it
+        # is read, so a truncated file raises ValueError rather than reading past its end.
+        self._start = HEADER.size + self.nslots * SLOT.size
+        if self.nslots == 0 or self.nslots & (self.nslots - 1) or self._start > len(self._mm):
+            self.close()
+            raise ValueError("%s is truncated" % path)
+
+    def close(self):
+        self._mm.close()
+
+    def _record(self, offset, length):
+        '''
+        Returns (name, JSON of attributes) of the record at offset.
+        '''
+        mm = self._mm
+        if offset < self._start or length < NAMELEN.size or offset + length > len(mm):
+            raise ValueError("record at %d is past the end of the file" % offset)
+        (namelen,) = NAMELEN.unpack_from(mm, offset)
+        start = offset + NAMELEN.size
+        if namelen > length - NAMELEN.size:
+            raise ValueError("record at %d is corrupt" % offset)
+        return (mm[start:start + namelen], mm[start + namelen:offset + length])
+
+    def lookup(self, name):
+        '''
+        Returns JSON of the attributes of entity name, or None if it is not in the file.
+
+        :raises ValueError: if the record found is not within the file.
+        '''
+        name = _bytes(name)
+        h = _hash(name)
+        mask = self.nslots - 1
+        for probe in xrange(self.nslots):
+            slot = HEADER.size + ((h + probe) & mask) * SLOT.size
+            (sh, offset, length) = SLOT.unpack_from(self._mm, slot)
+            if offset == 0:
+                return None
+            if sh == h:
+                (rname, value) = self._record(offset, length)
+                if rname == name:
+                    return value
+        return None
+
+    def records(self):
+        '''
+        Returns list of (name, JSON of attributes) of all entities in the file.
+        '''
+        records = []
+        for i in xrange(self.nslots):
+            (sh, offset, length) = SLOT.unpack_from(self._mm, HEADER.size + i * SLOT.size)
+            if offset != 0:
+                records.append(self._record(offset, length))
+        return records
+
+
+def writefile(path, records, created, complete):
+    '''
+    Writes records, list of (name, JSON of attributes), to a new cache file that
+    atomically replaces path.
+    '''
+    import tempfile
+    nslots = 8
+    while nslots < 2 * len(records):
+        nslots *= 2
+    slots = [ None ] * nslots
+    data = []
+    offset = HEADER.size + nslots * SLOT.size
+    for (name, value) in records:
+        name = _bytes(name)
+        h = _hash(name)
+        record = NAMELEN.pack(len(name)) + name + value
+        i = h & (nslots - 1)
+        while slots[i] is not None:
+            i = (i + 1) & (nslots - 1)
+        slots[i] = (h, offset, len(record))
+        data.append(record)
+        offset += len(record)
+
+    directory = os.path.dirname(path)
+    (fd, tmp) = tempfile.mkstemp(dir=directory, prefix='.' + os.path.basename(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, created, nslots, len(records), 1 if complete else 0))
+            f.write(''.join([ SLOT.pack(*(s or (0, 0, 0))) for s in slots ]))
+            f.write(''.join(data))
+        os.rename(tmp, path)
+    except:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+class DiskCache(object):
+    '''
+    Entity documents of one infoservice cached in files under a directory, one file
+    per entity kind. Errors reading or writing the files are logged and otherwise
+    treated as cache misses: the cache never makes a call fail.
+    '''
+
+    def __init__(self, directory, namespace='', ttl=60.0, ttls=None, refresh=False):
+        '''
+        :param str namespace: Identifies the infoservice, so that clients of different
+                              ones sharing directory do not share files.
+        :param float ttl: Default seconds a file stays fresh.
+        :param dict ttls: Entity class name (lowercase) -> time-to-live overrides.
+        :param Boolean refresh: Ignore what is cached, but still cache what is fetched.
+        '''
+        self.log = logging.getLogger('vc3client')
+        self.directory = os.path.expanduser(directory)
+        self.namespace = hashlib.md5(namespace).hexdigest()[:8]
+        self.ttl = ttl
+        self.ttls = ttls or {}
+        self.refresh = refresh
+
+    @classmethod
+    def fromConfig(cls, config):
+        '''
+        Returns DiskCache configured from the [diskcache] section, or None if it is not
+        enabled.
+        '''
+        if not confgetboolean(config, 'diskcache', 'enabled', False):
+            return None
+        if confget(config, 'netcomm', 'backend', 'infoservice') == 'local':
+            namespace = 'local:%s' % confget(config, 'local', 'path', '')
+        else:
+            namespace = '%s:%s' % (confget(config, 'netcomm', 'infohost', ''), confget(config, 'netcomm', 'httpsport', ''))
+        ttls = {}
+        for name in ['user', 'project', 'resource', 'allocation', 'nodeinfo',
+                     'nodeset', 'cluster', 'environment', 'request']:
+            ttl = confgetfloat(config, 'diskcache', '%s_ttl' % name, None)
+            if ttl is not None:
+                ttls[name] = ttl
+        return cls( directory = confget(config, 'diskcache', 'path', '~/.cache/vc3') or '~/.cache/vc3',
+                    namespace = namespace,
+                    ttl = confgetfloat(config, 'diskcache', 'ttl', 60.0),
+                    ttls = ttls,
+                    refresh = confgetboolean(config, 'diskcache', 'refresh', False) )
+
+    def _ttl(self, entityclass):
+        return self.ttls.get(entityclass.__name__.lower(), self.ttl)
+
+    def _path(self, entityclass):
+        return os.path.join(self.directory, '%s-%s.cache' % (entityclass.infokey, self.namespace))
+
+    def _open(self, entityclass):
+        '''
+        Returns CacheFile of entityclass, or None if there is none or it is stale.
+        '''
+        path = self._path(entityclass)
+        try:
+            cf = CacheFile(path)
+        except (EnvironmentError, ValueError), e:
+            if not isinstance(e, EnvironmentError) or os.path.exists(path):
+                self.log.debug("Ignoring cache file %s: %s", path, e)
+            return None
+        if time.time() - cf.created >= self._ttl(entityclass):
+            cf.close()
+            return None
+        return cf
+
+    def _lock(self, entityclass):
+        '''
+        Returns the open lock file of entityclass, exclusively locked, or None if it
+        cannot be. Closing it releases the lock.
+        '''
+        path = self._path(entityclass) + '.lock'
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory, 0700)
+            f = os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0600), 'r+')
+        except EnvironmentError, e:
+            self.log.warning("Could not open cache lock file %s: %s", path, e)
+            return None
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        except EnvironmentError, e:
+            f.close()
+            self.log.warning("Could not lock cache lock file %s: %s", path, e)
+            return None
+        return f
+
+    def _write(self, entityclass, records, created, complete):
+        path = self._path(entityclass)
+        try:
+            writefile(path, records, created, complete)
+        except EnvironmentError, e:
+            self.log.warning("Could not write cache file %s: %s", path, e)
+
+    def _update(self, entityclass, changes, start=False):
+        '''
+        Rewrites the fresh file of entityclass with changes applied, under its lock.
+
+        :param dict changes: Entity name -> JSON of attributes, or None to remove it.
+        :param Boolean start: If there is no fresh file, write a new (incomplete) one of
+                              the entities changed; otherwise leave it at that.
+        '''
+        lock = self._lock(entityclass)
+        if lock is None:
+            return
+        try:
+            cf = self._open(entityclass)
+            if cf is None:
+                if start:
+                    records = [ (n, v) for (n, v) in changes.items() if v is not None ]
+                    self._write(entityclass, records, time.time(), False)
+                return
+            try:
+                names = set([ _bytes(n) for n in changes.keys() ])
+                records = [ (n, v) for (n, v) in cf.records() if n not in names ]
+                (created, complete) = (cf.created, cf.complete)
+            except (struct.error, ValueError), e:
+                self.log.debug("Ignoring cache file of %s: %s", entityclass.__name__, e)
+                records = None
+            finally:
+                cf.close()
+            if records is None:
+                return
+            records.extend([ (n, v) for (n, v) in changes.items() if v is not None ])
+            self._write(entityclass, records, created, complete)
+        finally:
+            lock.close()
+
+    ################################################################################
+    #                           Reads
+    ################################################################################
+
+    def get(self, entityclass, name):
+        '''
+        Returns attributes of entity name, or None if it is not cached.
+        '''
+        if self.refresh or not self._ttl(entityclass):
+            return None
+        cf = self._open(entityclass)
+        if cf is None:
+            return None
+        try:
+            value = cf.lookup(name)
+        except (struct.error, ValueError), e:
+            self.log.debug("Ignoring cache file of %s: %s", entityclass.__name__, e)
+            return None
+        finally:
+            cf.close()
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def documents(self, entityclass):
+        '''
+        Returns name -> attributes of all entities of entityclass, or None unless a
+        complete listing is cached.
+        '''
+        if self.refresh or not self._ttl(entityclass):
+            return None
+        cf = self._open(entityclass)
+        if cf is None:
+            return None
+        try:
+            if not cf.complete:
+                return None
+            return dict([ (name.decode('utf-8'), json.loads(value)) for (name, value) in cf.records() ])
+        except (struct.error, ValueError), e:
+            self.log.debug("Ignoring cache file of %s: %s", entityclass.__name__, e)
+            return None
+        finally:
+            cf.close()
+
+    ################################################################################
+    #                           Writes
+    ################################################################################
+
+    def storeDocuments(self, entityclass, docs):
+        '''
+        Caches docs, a complete listing of name -> attributes, replacing the file.
+        '''
+        if not self._ttl(entityclass):
+            return
+        records = [ (name, json.dumps(attrs)) for (name, attrs) in docs.items() ]
+        lock = self._lock(entityclass)
+        if lock is None:
+            return
+        try:
+            self._write(entityclass, records, time.time(), True)
+        finally:
+            lock.close()
+
+    def put(self, entityclass, entity):
+        '''
+        Caches entity, fetched from the infoservice, if there is no fresh file of its
+        kind: it starts a new (incomplete) one. A fresh file is not rewritten for it.
+        '''
+        if not self._ttl(entityclass):
+            return
+        cf = self._open(entityclass)
+        if cf is not None:
+            cf.close()
+            return
+        self._update(entityclass, { entity.name : json.dumps(entity.makeDictObject()[entity.name]) }, start=True)
+
+    def entitiesStored(self, entities):
+        '''
+        Updates the cached files with entities, just stored through the client, in one
+        rewrite per kind.
+        '''
+        changes = {}
+        for entity in entities:
+            entityclass = entity.__class__
+            if self._ttl(entityclass):
+                value = json.dumps(entity.makeDictObject()[entity.name])
+                changes.setdefault(entityclass, {})[entity.name] = value
+        for (entityclass, c) in changes.items():
+            self._update(entityclass, c)
+
+    def entityStored(self, entity):
+        '''
+        Updates a cached file with entity, just stored through the client.
+        '''
+        self.entitiesStored([ entity ])
+
+    def entityDeleted(self, entityclass, name):
+        if self._ttl(entityclass):
+            self._update(entityclass, { name : None })
+
+    def clear(self):
+        '''
+        Removes the cache files of this infoservice.
+        '''
+        suffix = '-%s.cache' % self.namespace
+        try:
+            names = os.listdir(self.directory)
+        except EnvironmentError:
+            return
+        for name in names:
+            if name.endswith(suffix):
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                except EnvironmentError, e:
+                    self.log.warning("Could not remove cache file %s: %s", name, e)
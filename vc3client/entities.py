@@ -9,9 +9,14 @@ __email__ = "jhover@bnl.gov"
 __status__ = "Production"
 
 import logging
-import urllib
 
 from vc3infoservice.core import InfoEntity
+
+import codec
+
+# Listings can hold many thousands of entities, so each class keeps its attributes in
+# __slots__ (no per-object __dict__ unless an undeclared attribute is set) and shares one
+# class-level logger. Debug messages are formatted only when debug logging is enabled.
    
 class User(InfoEntity):
     '''
@@ -35,7 +40,9 @@ class User(InfoEntity):
     infokey = 'user'
     validvalues = {}
     intattributes = []
-    
+    __slots__ = infoattributes + [ '_diffmap', 'allocations' ]
+    log = logging.getLogger()
+
     def __init__(self,
                    name,
                    state,
@@ -66,7 +73,6 @@ class User(InfoEntity):
         :rtype: User
         
         '''
-        self.log = logging.getLogger()
         self.state = state
         self.name = name
         self.first = first
@@ -80,7 +86,7 @@ class User(InfoEntity):
         self.sshpubstring = sshpubstring
         self.url = url
         self.docurl = docurl
-        self.log.debug("Entity created: %s" % self)
+        self.log.debug("Entity created: %s", self)
 
 
     def addAllocation(self, allocation):
@@ -91,10 +97,10 @@ class User(InfoEntity):
         if self.allocations is None:
             self.allocations = []
 
-        self.log.debug("Adding allocation %s to project" % allocation)
+        self.log.debug("Adding allocation %s to project", allocation)
         if allocation not in self.allocations:
             self.allocations.append(allocation)
-        self.log.debug("Allocations now %s" % self.allocations)
+        self.log.debug("Allocations now %s", self.allocations)
         
 
     def removeAllocation(self, allocation):
@@ -105,12 +111,12 @@ class User(InfoEntity):
         if self.allocations is None:
             self.allocations = []
 
-        self.log.debug("Removing allocation %s to project" % allocation)
+        self.log.debug("Removing allocation %s to project", allocation)
         if allocation not in self.allocations:
             self.log.debug("Allocation %s did not belong to project")
         else:
             self.allocations.remove(allocation)
-            self.log.debug("Allocations now %s" % self.allocations)
+            self.log.debug("Allocations now %s", self.allocations)
 
 
 class Project(InfoEntity):
@@ -132,8 +138,10 @@ class Project(InfoEntity):
                      'organization', 
                      ]
     validvalues = {}
-    intattributes = []    
-    
+    intattributes = []
+    __slots__ = infoattributes + [ '_diffmap' ]
+    log = logging.getLogger()
+
     def __init__(self, 
                    name,
                    state,
@@ -164,7 +172,6 @@ class Project(InfoEntity):
         :rtype: Project
         
         '''  
-        self.log = logging.getLogger()
         self.name = name
         self.state = state
         self.owner = owner
@@ -179,7 +186,7 @@ class Project(InfoEntity):
         self.url = url
         self.docurl = docurl
         self.organization = organization
-        self.log.debug("Entity created: %s" % self)
+        self.log.debug("Entity created: %s", self)
  
     def addUser(self, user):
         '''
@@ -188,12 +195,12 @@ class Project(InfoEntity):
         if self.members is None:
             self.members = []
 
-        self.log.debug("Adding user %s to project" % user)
+        self.log.debug("Adding user %s to project", user)
         if user not in self.members:
             ulist = self.members
             ulist.append(user)
             self.members = ulist
-        self.log.debug("Members now %s" % self.members)
+        self.log.debug("Members now %s", self.members)
         
 
     def removeUser(self, user):
@@ -203,14 +210,14 @@ class Project(InfoEntity):
         if self.members is None:
             self.members = []
 
-        self.log.debug("Removing user %s to project" % user)
+        self.log.debug("Removing user %s to project", user)
         if user not in self.members:
             self.log.debug("User %s did not belong to project")
         else:
             ulist = self.members
             ulist.remove(user)
             self.members = ulist
-            self.log.debug("Members now %s" % self.members)
+            self.log.debug("Members now %s", self.members)
 
     def addAllocation(self, allocation):
         '''
@@ -219,12 +226,12 @@ class Project(InfoEntity):
         if self.allocations is None:
             self.allocations = []
 
-        self.log.debug("Adding allocation %s to project" % allocation)
+        self.log.debug("Adding allocation %s to project", allocation)
         if allocation not in self.allocations:
             alist = self.allocations
             alist.append(allocation)
             self.allocations = alist
-        self.log.debug("Allocations now %s" % self.allocations)
+        self.log.debug("Allocations now %s", self.allocations)
         
 
     def removeAllocation(self, allocation):
@@ -234,14 +241,14 @@ class Project(InfoEntity):
         if self.allocations is None:
             self.allocations = []
 
-        self.log.debug("Removing allocation %s from project" % allocation)
+        self.log.debug("Removing allocation %s from project", allocation)
         if allocation not in self.allocations:
             self.log.debug("Allocation %s did not belong to project")
         else:
             alist = self.allocations
             alist.remove(allocation)
             self.allocations = alist
-            self.log.debug("Allocations now %s" % self.allocations)
+            self.log.debug("Allocations now %s", self.allocations)
 
 class Resource(InfoEntity):
     '''
@@ -280,7 +287,9 @@ class Resource(InfoEntity):
         'accesstype' : ['batch','cloud']
         }
     intattributes = []
-    
+    __slots__ = infoattributes + [ '_diffmap' ]
+    log = logging.getLogger()
+
     def __init__(self,
                  name,
                  state,
@@ -314,7 +323,6 @@ class Resource(InfoEntity):
     :param str url: High-level URL reference for this entity. 
     :param str docurl: Link to how-to/usage documentation for this entity.     
         '''
-        self.log = logging.getLogger()
         self.name = name
         self.state = state
         self.owner = owner
@@ -341,7 +349,7 @@ class Resource(InfoEntity):
         self.pubtokendocurl = pubtokendocurl
         self.organization = organization
 
-        self.log.debug("Entity created: %s" % self)
+        self.log.debug("Entity created: %s", self)
 
 
 class Allocation(InfoEntity):
@@ -378,8 +386,10 @@ class Allocation(InfoEntity):
     validvalues = {
         'sectype' : [ None, 'ssh-rsa', 'ssh-dsa' , 'x509' ],
         }
-    intattributes = []    
-    
+    intattributes = []
+    __slots__ = infoattributes + [ '_diffmap' ]
+    log = logging.getLogger()
+
     def __init__(self, 
                  name, 
                  state, 
@@ -409,7 +419,6 @@ class Allocation(InfoEntity):
     :param str docurl: Link to how-to/usage documentation for this entity. 
         
         '''
-        self.log = logging.getLogger()
         self.name = name
         self.state = state
         self.owner = owner
@@ -428,7 +437,7 @@ class Allocation(InfoEntity):
         self.sectype = sectype
         self.pubtoken = pubtoken
         self.privtoken = privtoken
-        self.log.debug("Entity created: %s" % self)
+        self.log.debug("Entity created: %s", self)
 
 class Policy(InfoEntity):
     '''
@@ -448,8 +457,9 @@ class Policy(InfoEntity):
                       ]
     validvalues = {}
     intattributes = []
-    
-    
+    __slots__ = infoattributes + [ '_diffmap' ]
+    log = logging.getLogger()
+
     def __init__(self, 
                  name, 
                  state, 
@@ -467,7 +477,6 @@ class Policy(InfoEntity):
         :param str docurl: Link to how-to/usage documentation for this entity.             
         
         '''
-        self.log = logging.getLogger()
         self.name = name
         self.owner = owner
         self.pluginname = pluginname
@@ -475,7 +484,7 @@ class Policy(InfoEntity):
         self.displayname = displayname
         self.url = url
         self.docurl = docurl
-        self.log.debug("Entity created: %s" % self)
+        self.log.debug("Entity created: %s", self)
 
 
 class Nodeinfo(InfoEntity):
@@ -504,7 +513,9 @@ class Nodeinfo(InfoEntity):
                       'memory_mb',
                       'storage_mb'
                      ]
-    
+    __slots__ = infoattributes + [ '_diffmap' ]
+    log = logging.getLogger()
+
     def __init__(self, name, 
                        state,
                        owner, 
@@ -528,7 +539,6 @@ class Nodeinfo(InfoEntity):
         :param str environment:  Environment to preload per job (e.g. a glidein)
             
         '''
-        self.log = logging.getLogger()
         self.name = name
         self.state = state
         self.owner = owner
@@ -543,7 +553,7 @@ class Nodeinfo(InfoEntity):
         self.displayname = displayname
         self.url = url
         self.docurl = docurl
-        self.log.debug("Entity created: %s" % self)
+        self.log.debug("Entity created: %s", self)
 
 class Nodeset(InfoEntity):
     '''
@@ -581,7 +591,9 @@ class Nodeset(InfoEntity):
         }
     intattributes = [ 'node_number', 'app_lingertime' ]
     nameattributes = ['owner','displayname']
-    
+    __slots__ = infoattributes + [ '_diffmap', 'resource_type' ]
+    log = logging.getLogger()
+
     def __init__(self, name, 
                        state,
                        owner, 
@@ -613,7 +625,6 @@ class Nodeset(InfoEntity):
         :param str environment:  Environment to preload per job (e.g. a glidein)
             
         '''
-        self.log = logging.getLogger()
         self.name = name
         self.state = state
         self.state_reason = state_reason
@@ -636,7 +647,7 @@ class Nodeset(InfoEntity):
         self.displayname = displayname
         self.url = url
         self.docurl = docurl
-        self.log.debug("Entity created: %s" % self)
+        self.log.debug("Entity created: %s", self)
 
    
       
@@ -666,6 +677,8 @@ class Cluster(InfoEntity):
     validvalues = {}
     intattributes = []
     nameattributes = ['owner','displayname']
+    __slots__ = infoattributes + [ '_diffmap' ]
+    log = logging.getLogger()
 
     def __init__(self, 
                  name, 
@@ -685,7 +698,6 @@ class Cluster(InfoEntity):
         :param str url: High-level URL reference for this entity. 
         :param str docurl: Link to how-to/usage documentation for this entity.  
         '''
-        self.log = logging.getLogger()
         self.name = name
         self.state = state
         self.owner = owner
@@ -695,7 +707,7 @@ class Cluster(InfoEntity):
         self.displayname = displayname
         self.url = url
         self.docurl = docurl
-        self.log.debug("Entity created: %s" % self)
+        self.log.debug("Entity created: %s", self)
 
     def addNodeset(self, nodesetname ):
         if self.nodesets is None:
@@ -713,7 +725,7 @@ class Cluster(InfoEntity):
 
 
         if nodesetname not in self.nodesets:
-            self.log.debug("Nodeset %s did not belong to Cluster" % nodesetname)
+            self.log.debug("Nodeset %s did not belong to Cluster", nodesetname)
         else:
             nlist = self.nodesets
             nlist.remove(nodesetname)
@@ -747,6 +759,8 @@ class Environment(InfoEntity):
                      ]
     validvalues = { }
     intattributes = []
+    __slots__ = infoattributes + [ '_diffmap' ]
+    log = logging.getLogger()
 
     def __init__(self, 
                  name, 
@@ -780,7 +794,6 @@ class Environment(InfoEntity):
         :rtype: Environment
         
         '''  
-        self.log = logging.getLogger()
         self.name  = name
         self.state = state
         self.owner = owner
@@ -794,7 +807,7 @@ class Environment(InfoEntity):
         self.displayname = displayname
         self.url = url
         self.docurl = docurl
-        self.log.debug("Entity created: %s" % self)
+        self.log.debug("Entity created: %s", self)
 
 
 class Request(InfoEntity):
@@ -839,7 +852,9 @@ class Request(InfoEntity):
                      'action' : [ 'new', 'run', 'terminate' ]
                     } 
     intattributes = []
-    
+    __slots__ = infoattributes + [ '_diffmap' ]
+    log = logging.getLogger()
+
     def __init__(self, 
                  name, 
                  state, 
@@ -877,7 +892,6 @@ class Request(InfoEntity):
                 
         '''
         # Common attributes
-        self.log = logging.getLogger()
         self.name = name
         self.state = state
         self.owner = owner
@@ -910,7 +924,7 @@ class Request(InfoEntity):
         self.url = url
         self.docurl = docurl
         self.organization = organization
-        self.log.debug("Entity created: %s" % self)
+        self.log.debug("Entity created: %s", self)
 
 
 class Provisioner(InfoEntity):
@@ -932,6 +946,8 @@ class Provisioner(InfoEntity):
                      ]
     validvalues = {}
     intattributes = []
+    __slots__ = infoattributes + [ '_diffmap', 'queuesconfig' ]
+    log = logging.getLogger()
 
     def __init__(self, 
                  name, 
@@ -955,7 +971,6 @@ class Provisioner(InfoEntity):
         :rtype: Provisioner
         :return: Valid Provisioner object.  
         '''  
-        self.log = logging.getLogger()
         self.name  = name  # i.e. factory-id
         self.state = state
         self.owner = owner
@@ -966,7 +981,7 @@ class Provisioner(InfoEntity):
         self.displayname = displayname
         self.url = url
         self.docurl = docurl
-        self.log.debug("Entity created: %s" % self)
+        self.log.debug("Entity created: %s", self)
 
 class PrivateToken(InfoEntity):
     '''
@@ -985,6 +1000,8 @@ class PrivateToken(InfoEntity):
                      ]
     validvalues = {}
     intattributes = []
+    __slots__ = infoattributes + [ '_diffmap' ]
+    log = logging.getLogger()
 
     def __init__(self,
                  name,
@@ -1004,7 +1021,6 @@ class PrivateToken(InfoEntity):
         :rtype: PrivateToken
         :return: Valid PrivateToken object.
         '''
-        self.log = logging.getLogger()
         self.name  = name  # i.e. factory-id
         self.state = state
         self.data = data
@@ -1012,7 +1028,11 @@ class PrivateToken(InfoEntity):
         self.displayname = displayname
         self.url = url
         self.docurl = docurl
-        self.log.debug("Entity created: %s" % self)
+        self.log.debug("Entity created: %s", self)
+
+
+codec.install(User, Project, Resource, Allocation, Policy, Nodeinfo, Nodeset, Cluster,
+              Environment, Request, Provisioner, PrivateToken)
 
         
 if __name__ == '__main__':
@@ -0,0 +1,367 @@
+#!/bin/env python
+__author__ = "John Hover"
+__copyright__ = "2017 John Hover"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "John Hover"
+__email__ = "jhover@bnl.gov"
+__status__ = "Production"
+
+import json
+import logging
+import threading
+import time
+
+from entities import Allocation, Project
+
+
+class EligibilityIndex(object):
+    '''
+    Indexes answering the policy questions asked by VC3ClientAPI:
+
+        owner -> names of validated allocations
+        user  -> names of projects the user owns or is a member of
+
+    Each side is built from one listing (a snapshot) and then kept current by the
+    stores and deletes made through the client. A snapshot older than ttl seconds
+    is considered stale and is rebuilt on next use, which bounds how long changes
+    made by other clients go unseen. With a ttl of 0 (the default) VC3ClientAPI does
+not use the index: each check scans a live listing up to the first match.
+    '''
+
+    def __init__(self, ttl=0.0):
+        self.log = logging.getLogger('vc3client')
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._alloctime = None
+        self._allocations = {}    # allocation name -> (owner, validated)
+        self._validated = {}      # owner -> set of validated allocation names
+        self._projecttime = None
+        self._projects = {}       # project name -> set of owner and member names
+        self._userprojects = {}   # user -> set of project names
+
+    def _stale(self, loadtime):
+        return loadtime is None or (time.time() - loadtime) >= self.ttl
+
+    def allocationsStale(self):
+        return self._stale(self._alloctime)
+
+    def projectsStale(self):
+        return self._stale(self._projecttime)
+
+    def invalidate(self):
+        with self._lock:
+            self._alloctime = None
+            self._projecttime = None
+
+    ############################  Allocations  ###################################
+
+    def loadAllocations(self, allocations):
+        '''
+        Rebuilds allocation side of the index from a full listing.
+        '''
+        with self._lock:
+            self._allocations = {}
+            self._validated = {}
+            for a in allocations:
+                self._addallocation(a)
+            self._alloctime = time.time()
+        self.log.debug("Indexed %d allocations" % len(self._allocations))
+
+    def _addallocation(self, allocation):
+        validated = allocation.state == 'validated'
+        self._allocations[allocation.name] = (allocation.owner, validated)
+        if validated:
+            self._validated.setdefault(allocation.owner, set()).add(allocation.name)
+
+    def _removeallocation(self, name):
+        try:
+            (owner, validated) = self._allocations.pop(name)
+        except KeyError:
+            return
+        if validated:
+            names = self._validated.get(owner, set())
+            names.discard(name)
+            if not names:
+                self._validated.pop(owner, None)
+
+    def updateAllocation(self, allocation):
+        with self._lock:
+            if self._alloctime is not None:
+                self._removeallocation(allocation.name)
+                self._addallocation(allocation)
+
+    def removeAllocation(self, name):
+        with self._lock:
+            if self._alloctime is not None:
+                self._removeallocation(name)
+
+    def hasValidatedAllocation(self, user):
+        return user in self._validated
+
+    ############################  Projects  ######################################
+
+    def loadProjects(self, projects):
+        '''
+        Rebuilds project side of the index from a full listing.
+        '''
+        with self._lock:
+            self._projects = {}
+            self._userprojects = {}
+            for p in projects:
+                self._addproject(p)
+            self._projecttime = time.time()
+        self.log.debug("Indexed %d projects" % len(self._projects))
+
+    def _addproject(self, project):
+        users = set(project.members or [])
+        users.add(project.owner)
+        self._projects[project.name] = users
+        for u in users:
+            self._userprojects.setdefault(u, set()).add(project.name)
+
+    def _removeproject(self, name):
+        for u in self._projects.pop(name, set()):
+            names = self._userprojects.get(u, set())
+            names.discard(name)
+            if not names:
+                self._userprojects.pop(u, None)
+
+    def updateProject(self, project):
+        with self._lock:
+            if self._projecttime is not None:
+                self._removeproject(project.name)
+                self._addproject(project)
+
+    def removeProject(self, name):
+        with self._lock:
+            if self._projecttime is not None:
+                self._removeproject(name)
+
+    def hasProject(self, user):
+        return user in self._userprojects
+
+    ############################  Write hooks  ###################################
+
+    def entityStored(self, entity):
+        if isinstance(entity, Allocation):
+            self.updateAllocation(entity)
+        elif isinstance(entity, Project):
+            self.updateProject(entity)
+
+    def entityDeleted(self, entityclass, name):
+        if entityclass is Allocation:
+            self.removeAllocation(name)
+        elif entityclass is Project:
+            self.removeProject(name)
+
+
+def _keys(value):
+    '''
+    Returns the index keys of an attribute value: the value itself, each element of a
+    list, nothing for None and for values that cannot be keys (dicts).
+    '''
+    if value is None:
+        return []
+    if isinstance(value, (list, tuple)):
+        return [ v for v in value if not isinstance(v, (list, dict)) ]
+    if isinstance(value, dict):
+        return []
+    return [ value ]
+
+
+class EntityIndex(object):
+    '''
+    Snapshot of the documents of all entities of one class, with secondary indexes
+    answering attribute equality queries (owner, state, project, ...):
+
+        attribute -> value -> set of entity names
+
+    An index is built from the snapshot the first time its attribute is queried, and
+    then kept current with it. As for EligibilityIndex, the snapshot is one listing,
+    updated by the stores and deletes made through the client, and reloaded on next
+    use once older than ttl seconds, or never if ttl is None. List-valued attributes
+    (Project members, ...) are indexed by each of their elements.
+    '''
+
+    def __init__(self, entityclass, ttl=60.0):
+        self.log = logging.getLogger('vc3client')
+        self.entityclass = entityclass
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._loadtime = None
+        self._docs = {}       # entity name -> attributes, as in the infoservice document
+        self._indexes = {}    # attribute -> value -> set of entity names
+
+    def stale(self):
+        if self._loadtime is None:
+            return True
+        return self.ttl is not None and (time.time() - self._loadtime) >= self.ttl
+
+    def loaded(self):
+        return self._loadtime is not None
+
+    def invalidate(self):
+        with self._lock:
+            self._loadtime = None
+
+    def load(self, docs):
+        '''
+        Replaces the snapshot with docs, a listing of name -> attributes. Indexes are
+        dropped, and rebuilt as they are queried.
+        '''
+        with self._lock:
+            self._docs = dict([ (name, attrs or {}) for (name, attrs) in docs.items() ])
+            self._indexes = {}
+            self._loadtime = time.time()
+        self.log.debug("Indexed %d %s entities" % (len(self._docs), self.entityclass.__name__))
+
+    def refresh(self, docs):
+        '''
+        Brings the snapshot up to date with docs, a new listing, re-indexing only the
+        entities that were added, changed or removed since the last one.
+
+        :return: (added, changed, removed), sorted lists of entity names.
+        '''
+        with self._lock:
+            if self._loadtime is None:
+                self.load(docs)
+                return (sorted(self._docs.keys()), [], [])
+            added = []
+            changed = []
+            for (name, attrs) in docs.items():
+                attrs = attrs or {}
+                old = self._docs.get(name)
+                if old is None:
+                    added.append(name)
+                elif old != attrs:
+                    changed.append(name)
+                    self._remove(name)
+                else:
+                    continue
+                self._add(name, attrs)
+            removed = [ name for name in self._docs.keys() if name not in docs ]
+            for name in removed:
+                self._remove(name)
+            self._loadtime = time.time()
+        self.log.debug("Refreshed %s entities: %d added, %d changed, %d removed" %
+                       (self.entityclass.__name__, len(added), len(changed), len(removed)))
+        return (sorted(added), sorted(changed), sorted(removed))
+
+    def document(self, name):
+        '''
+        Returns a copy of the attributes of entity name, or None if there is none.
+        '''
+        with self._lock:
+            attrs = self._docs.get(name)
+            if attrs is None:
+                return None
+            return json.loads(json.dumps(attrs))
+
+    def documents(self):
+        '''
+        Returns a copy of the snapshot, as name -> attributes.
+        '''
+        with self._lock:
+            return json.loads(json.dumps(self._docs))
+
+    def attribute(self, name, attribute):
+        '''
+        Returns attribute of entity name, not copied, or None if there is no such entity.
+        '''
+        with self._lock:
+            return (self._docs.get(name) or {}).get(attribute)
+
+    def _index(self, attribute):
+        index = self._indexes.get(attribute)
+        if index is None:
+            index = {}
+            for (name, attrs) in self._docs.iteritems():
+                for k in _keys(attrs.get(attribute)):
+                    index.setdefault(k, set()).add(name)
+            self._indexes[attribute] = index
+        return index
+
+    def lookup(self, criteria):
+        '''
+        Returns list of (name, attributes) of the entities matching every attribute ->
+        value of criteria, sorted by name. The attributes are a copy, which the caller
+        may keep and modify.
+        '''
+        with self._lock:
+            names = None
+            for (attribute, value) in criteria.items():
+                matched = self._index(attribute).get(value, set())
+                names = matched if names is None else names & matched
+                if not names:
+                    break
+            if names is None:
+                names = self._docs.keys()
+            return [ (n, json.loads(json.dumps(self._docs[n]))) for n in sorted(names) ]
+
+    def _add(self, name, attrs):
+        self._docs[name] = attrs
+        for (attribute, index) in self._indexes.items():
+            for k in _keys(attrs.get(attribute)):
+                index.setdefault(k, set()).add(name)
+
+    def _remove(self, name):
+        attrs = self._docs.pop(name, None)
+        if attrs is None:
+            return
+        for (attribute, index) in self._indexes.items():
+            for k in _keys(attrs.get(attribute)):
+                names = index.get(k)
+                if names is not None:
+                    names.discard(name)
+                    if not names:
+                        del index[k]
+
+    def update(self, entity):
+        with self._lock:
+            if self._loadtime is not None:
+                # a copy, so later changes to the entity object do not leak in
+                attrs = json.loads(json.dumps(entity.makeDictObject()[entity.name]))
+                self._remove(entity.name)
+                self._add(entity.name, attrs)
+
+    def remove(self, name):
+        with self._lock:
+            if self._loadtime is not None:
+                self._remove(name)
+
+
+class EntityIndexes(object):
+    '''
+    The EntityIndex of each entity class queried through the client.
+    '''
+
+    def __init__(self, ttl=60.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._indexes = {}    # entity class -> EntityIndex
+
+    def get(self, entityclass):
+        with self._lock:
+            index = self._indexes.get(entityclass)
+            if index is None:
+                index = self._indexes[entityclass] = EntityIndex(entityclass, self.ttl)
+            return index
+
+    def invalidate(self):
+        with self._lock:
+            for index in self._indexes.values():
+                index.invalidate()
+
+    ############################  Write hooks  ###################################
+
+    def entityStored(self, entity):
+        index = self._indexes.get(entity.__class__)
+        if index is not None:
+            index.update(entity)
+
+    def entityDeleted(self, entityclass, name):
+        index = self._indexes.get(entityclass)
+        if index is not None:
+            index.remove(name)
@@ -0,0 +1,392 @@
+#!/bin/env python
+__author__ = "John Hover"
+__copyright__ = "2017 John Hover"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "John Hover"
+__email__ = "jhover@bnl.gov"
+__status__ = "Production"
+
+'''
+Latency and round-trip instrumentation of infoservice calls.
+
+When enabled, VC3ClientAPI talks to the infoservice through an InstrumentedInfoClient,
+which times every call and records, per public API method that triggered it (getRequest,
+storeCluster, ...), the infoclient method, entity type, outcome and payload size. Calls
+made by one API method from inside another are attributed to the outermost one, including
+calls made from the worker threads of the bulk operations.
+
+Recorded calls are aggregated into histograms, written out in Prometheus text exposition
+format by Instrumentation.prometheus() and, if a path is configured, at process exit:
+
+    [instrument]
+    enabled = true
+    path = /var/lib/node_exporter/vc3client.prom
+    payload = true
+
+Payload sizes are the length of the JSON the call sends or receives, computed again here,
+so they cost one extra encoding per call; payload = false skips them.
+'''
+
+import atexit
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import types
+
+from util import confget, confgetboolean
+
+# Seconds.
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bytes.
+PAYLOAD_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Position of the infokey argument of infoclient methods that take one.
+KEYARGS = { 'getdocument' : 0,
+            'getdocumentobject' : 0,
+            'storedocument' : 0,
+            'mergedocument' : 0,
+            'storedocumentobject' : 1,
+            'mergedocumentobject' : 1,
+            '_storeentitydict' : 1,
+            '_mergeentitydict' : 1,
+            }
+
+# Attribution of calls not made from a VC3ClientAPI method.
+NOAPI = 'none'
+
+
+class Histogram(object):
+    '''
+    Cumulative histogram, as Prometheus defines it: counts[i] is the number of
+    observations <= buckets[i]; count includes those above the last bucket.
+    '''
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [ 0 ] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i in xrange(len(self.buckets) - 1, -1, -1):
+            if value > self.buckets[i]:
+                break
+            self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+def _entitytype(method, args, kwargs):
+    if 'key' in kwargs:
+        return kwargs['key']
+    position = KEYARGS.get(method)
+    if position is not None:
+        return args[position] if len(args) > position else ''
+    if method == 'storeentities' and args:
+        keys = set([ e.__class__.infokey for e in args[0] ])
+        return keys.pop() if len(keys) == 1 else 'mixed'
+    for arg in args:
+        if isinstance(arg, type):
+            return getattr(arg, 'infokey', arg.__name__)
+    return ''
+
+
+def _jsonsize(value):
+    '''
+    Returns length of the JSON of value, 0 if it has none.
+    '''
+    if value is None:
+        return 0
+    if isinstance(value, basestring):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum([ _jsonsize(v) for v in value ])
+    if hasattr(value, 'makeDictObject'):
+        value = value.makeDictObject()
+    try:
+        return len(json.dumps(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+class Instrumentation(object):
+    '''
+    Aggregates timings of infoservice calls and tracks, per thread, which API method
+    is running.
+    '''
+
+    log = logging.getLogger('vc3client')
+
+    def __init__(self, payload=True, latencybuckets=LATENCY_BUCKETS, payloadbuckets=PAYLOAD_BUCKETS):
+        '''
+        :param Boolean payload: Record payload sizes.
+        '''
+        self.payload = payload
+        self.latencybuckets = latencybuckets
+        self.payloadbuckets = payloadbuckets
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    @classmethod
+    def fromConfig(cls, config):
+        '''
+        Returns Instrumentation configured from the [instrument] section, or None if it
+        is not enabled. If path is set, the metrics are written there at exit.
+        '''
+        if not confgetboolean(config, 'instrument', 'enabled', False):
+            return None
+        instrument = cls(payload=confgetboolean(config, 'instrument', 'payload', True))
+        path = confget(config, 'instrument', 'path', None)
+        if path:
+            atexit.register(instrument.write, os.path.expanduser(path))
+        return instrument
+
+    def reset(self):
+        with self._lock:
+            self.latency = {}   # (api, method, entity, outcome) -> Histogram of seconds
+            self.payloads = {}  # (api, method, entity) -> Histogram of bytes
+
+    ################################################################################
+    #                           Attribution
+    ################################################################################
+
+    def _stack(self):
+        stack = getattr(self._local, 'stack', None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def current(self):
+        '''
+        Returns name of the outermost API method running in this thread.
+        '''
+        stack = self._stack()
+        return stack[0] if stack else NOAPI
+
+    def attributed(self, name, func):
+        '''
+        Returns func wrapped so that infoservice calls made while it runs are attributed
+        to name. If func returns a generator, so are the calls made while iterating over it.
+        '''
+        @functools.wraps(func)
+        def call(*args, **kwargs):
+            stack = self._stack()
+            stack.append(name)
+            try:
+                result = func(*args, **kwargs)
+            finally:
+                stack.pop()
+            if isinstance(result, types.GeneratorType):
+                return self._iterate(name, result)
+            return result
+        return call
+
+    def _iterate(self, name, generator):
+        '''
+        Generator over generator, attributing the calls it makes each time it is resumed
+        to name: the body of a generator only runs once the caller iterates over it.
+        '''
+        try:
+            while True:
+                stack = self._stack()
+                stack.append(name)
+                try:
+                    item = generator.next()
+                except StopIteration:
+                    return
+                finally:
+                    stack.pop()
+                yield item
+        finally:
+            generator.close()
+
+    def propagate(self, func):
+        '''
+        Returns func wrapped to run, in whatever thread, under the attribution current
+        in the calling thread. Used for work handed to worker threads.
+        '''
+        stack = list(self._stack())
+
+        @functools.wraps(func)
+        def call(*args, **kwargs):
+            saved = getattr(self._local, 'stack', None)
+            self._local.stack = list(stack)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._local.stack = saved
+        return call
+
+    def install(self, capi):
+        '''
+        Wraps the public methods of capi (a VC3ClientAPI) so that the calls they make
+        are attributed to them. Only this instance is affected.
+        '''
+        for name in dir(capi.__class__):
+            if name.startswith('_'):
+                continue
+            method = getattr(capi, name)
+            if isinstance(method, types.MethodType) and method.im_self is capi:
+                setattr(capi, name, self.attributed(name, method))
+
+    def wrap(self, ic):
+        return InstrumentedInfoClient(ic, self)
+
+    ################################################################################
+    #                           Recording
+    ################################################################################
+
+    def record(self, method, entity, seconds, outcome, size=None, api=None):
+        '''
+        Records one infoservice call.
+
+        :param str outcome: 'ok', or the name of the exception class raised.
+        :param int size: Payload bytes sent and received, if known.
+        '''
+        if api is None:
+            api = self.current()
+        with self._lock:
+            key = (api, method, entity, outcome)
+            h = self.latency.get(key)
+            if h is None:
+                h = self.latency[key] = Histogram(self.latencybuckets)
+            h.observe(seconds)
+            if size is not None:
+                key = (api, method, entity)
+                h = self.payloads.get(key)
+                if h is None:
+                    h = self.payloads[key] = Histogram(self.payloadbuckets)
+                h.observe(size)
+
+    def summary(self):
+        '''
+        Returns { api : { 'calls' : n, 'seconds' : s, 'methods' : { method : n } } }, the
+        number of infoservice round trips and time spent in them per API method.
+        '''
+        summary = {}
+        with self._lock:
+            for ((api, method, entity, outcome), h) in self.latency.items():
+                s = summary.setdefault(api, { 'calls' : 0, 'seconds' : 0.0, 'methods' : {} })
+                s['calls'] += h.count
+                s['seconds'] += h.sum
+                s['methods'][method] = s['methods'].get(method, 0) + h.count
+        return summary
+
+    def roundtrips(self, api=None):
+        '''
+        Returns number of infoservice calls recorded, in total or for API method api.
+        '''
+        with self._lock:
+            return sum([ h.count for (k, h) in self.latency.items() if api is None or k[0] == api ])
+
+    ################################################################################
+    #                           Export
+    ################################################################################
+
+    def _lines(self, metric, histograms, labelnames):
+        lines = []
+        for (key, h) in sorted(histograms.items()):
+            labels = ','.join([ '%s="%s"' % (n, _escape(v)) for (n, v) in zip(labelnames, key) ])
+            for (bound, count) in zip(h.buckets, h.counts):
+                lines.append('%s_bucket{%s,le="%s"} %d' % (metric, labels, _number(bound), count))
+            lines.append('%s_bucket{%s,le="+Inf"} %d' % (metric, labels, h.count))
+            lines.append('%s_sum{%s} %s' % (metric, labels, _number(h.sum)))
+            lines.append('%s_count{%s} %d' % (metric, labels, h.count))
+        return lines
+
+    def prometheus(self):
+        '''
+        Returns the recorded histograms in Prometheus text exposition format.
+        '''
+        with self._lock:
+            latency = dict([ (k, _copy(h)) for (k, h) in self.latency.items() ])
+            payloads = dict([ (k, _copy(h)) for (k, h) in self.payloads.items() ])
+        lines = [ '# HELP vc3client_infoservice_call_seconds Latency of infoservice calls.',
+                  '# TYPE vc3client_infoservice_call_seconds histogram' ]
+        lines += self._lines('vc3client_infoservice_call_seconds', latency, ('api', 'method', 'entity', 'outcome'))
+        lines += [ '# HELP vc3client_infoservice_payload_bytes JSON bytes sent and received by infoservice calls.',
+                   '# TYPE vc3client_infoservice_payload_bytes histogram' ]
+        lines += self._lines('vc3client_infoservice_payload_bytes', payloads, ('api', 'method', 'entity'))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        '''
+        Writes prometheus() to path, replacing it atomically (as the node_exporter
+        textfile collector expects).
+        '''
+        import tempfile
+        directory = os.path.dirname(os.path.abspath(path))
+        try:
+            (fd, tmp) = tempfile.mkstemp(dir=directory, prefix='.vc3client')
+            with os.fdopen(fd, 'w') as f:
+                f.write(self.prometheus())
+            os.rename(tmp, path)
+        except (IOError, OSError), e:
+            self.log.warning("Could not write metrics to %s: %s", path, e)
+
+
+def _copy(h):
+    c = Histogram(h.buckets)
+    c.counts = list(h.counts)
+    c.count = h.count
+    c.sum = h.sum
+    return c
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value))
+
+
+class InstrumentedInfoClient(object):
+    '''
+    Proxy of an infoclient that records every method call in an Instrumentation.
+    Other attributes are read from and set on the wrapped infoclient.
+    '''
+
+    def __init__(self, ic, instrument):
+        object.__setattr__(self, '_ic', ic)
+        object.__setattr__(self, '_instrument', instrument)
+
+    def __getattr__(self, name):
+        attr = getattr(self._ic, name)
+        if name.startswith('__') or not isinstance(attr, types.MethodType):
+            return attr
+        call = self._timed(name, attr)
+        object.__setattr__(self, name, call)
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self._ic, name, value)
+
+    def _timed(self, name, method):
+        instrument = self._instrument
+
+        @functools.wraps(method)
+        def call(*args, **kwargs):
+            entity = _entitytype(name, args, kwargs)
+            start = time.time()
+            result = None
+            outcome = 'ok'
+            try:
+                result = method(*args, **kwargs)
+                return result
+            except Exception, e:
+                outcome = e.__class__.__name__
+                raise
+            finally:
+                seconds = time.time() - start
+                size = None
+                if instrument.payload:
+                    size = _jsonsize(result) + sum([ _jsonsize(a) for a in args if not isinstance(a, type) ])
+                instrument.record(name, entity, seconds, outcome, size)
+        return call
@@ -0,0 +1,218 @@
+#!/bin/env python
+__author__ = "John Hover"
+__copyright__ = "2017 John Hover"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "John Hover"
+__email__ = "jhover@bnl.gov"
+__status__ = "Production"
+
+'''
+Declarative bulk creation of entities from one YAML manifest, e.g.::
+
+    users:
+      - name: lincolnb
+        first: Lincoln
+        last: Bryant
+        email: lincolnb@uchicago.edu
+        organization: UChicago
+    nodeinfos:
+      - name: small
+        owner: lincolnb
+        cores: 1
+        memory_mb: 2048
+        storage_mb: 1024
+        native_os: el7
+    nodesets:
+      - name: workers
+        owner: lincolnb
+        node_number: 4
+        app_type: htcondor
+        app_role: worker-nodes
+        nodeinfo: small
+
+Top-level keys are users, projects, nodeinfos, resources, allocations, nodesets,
+clusters, environments and requests. Each holds a list of attribute mappings, or a
+mapping of name -> attributes. Attribute names are those of the entity constructors in
+entities.py; state defaults to 'new'. Environments may also give localfiles, a mapping
+of remote name -> local path whose contents are read and base64-encoded into files.
+
+Applying the manifest compares it with what the infoservice already holds, creates
+missing entities, updates those whose listed attributes differ, and leaves the rest
+alone, so re-applying an unchanged manifest performs no writes.
+'''
+
+import base64
+import inspect
+import logging
+import os
+
+from entities import User, Project, Resource, Allocation, Nodeinfo, Nodeset, Request, Cluster, Environment
+
+
+KINDS = [ ('users', User),
+          ('projects', Project),
+          ('nodeinfos', Nodeinfo),
+          ('resources', Resource),
+          ('allocations', Allocation),
+          ('nodesets', Nodeset),
+          ('clusters', Cluster),
+          ('environments', Environment),
+          ('requests', Request),
+          ]
+
+# Attributes set by the corresponding VC3ClientAPI.defineX() methods.
+DEFAULTS = { Nodeset : { 'state_reason' : 'new' },
+             Request : { 'action' : 'new', 'state_reason' : 'new' },
+             }
+
+
+class InventoryError(Exception):
+    '''
+    Raised for a manifest that cannot be turned into entities.
+    '''
+
+    def __init__(self, *args, **kwargs):
+        Exception.__init__(self, *args, **kwargs)
+
+
+class Change(object):
+    '''
+    Planned action for one manifest entry: create, update or unchanged.
+    '''
+
+    def __init__(self, action, entity, changed=None):
+        self.action = action
+        self.entity = entity
+        self.changed = changed or []
+
+    def __str__(self):
+        s = "%s %s %s" % (self.action, self.entity.__class__.__name__.lower(), self.entity.name)
+        if self.changed:
+            s += " (%s)" % ','.join(self.changed)
+        return s
+
+
+class Inventory(object):
+    '''
+    Set of entity definitions read from a manifest.
+    '''
+
+    def __init__(self, entries):
+        '''
+        :param list entries: (entityclass, attributes dict) tuples.
+        '''
+        self.log = logging.getLogger('vc3client')
+        self.entries = entries
+
+    @classmethod
+    def fromFile(cls, path):
+        import yaml
+        with open(os.path.expanduser(path)) as f:
+            doc = yaml.safe_load(f)
+        return cls.fromDict(doc or {}, os.path.dirname(os.path.abspath(path)))
+
+    @classmethod
+    def fromDict(cls, doc, basedir='.'):
+        known = dict(KINDS)
+        unknown = [ k for k in doc.keys() if k not in known ]
+        if unknown:
+            raise InventoryError("Unknown manifest section(s): %s" % ', '.join(unknown))
+
+        entries = []
+        for (kind, entityclass) in KINDS:
+            section = doc.get(kind) or []
+            if isinstance(section, dict):
+                items = []
+                for (name, attrs) in section.items():
+                    attrs = dict(attrs or {})
+                    attrs['name'] = name
+                    items.append(attrs)
+                section = items
+            for attrs in section:
+                attrs = dict(attrs)
+                if 'name' not in attrs:
+                    raise InventoryError("Entry in %s without a name: %s" % (kind, attrs))
+                if entityclass is Environment and 'localfiles' in attrs:
+                    files = dict(attrs.get('files') or {})
+                    for (remote, local) in attrs.pop('localfiles').items():
+                        with open(os.path.join(basedir, os.path.expanduser(local))) as f:
+                            files[remote] = base64.b64encode(f.read())
+                    attrs['files'] = files
+                entries.append((entityclass, attrs))
+        return cls(entries)
+
+    def _makeentity(self, entityclass, attrs):
+        (args, varargs, keywords, defaults) = inspect.getargspec(entityclass.__init__)
+        args = args[1:]
+        unknown = [ a for a in attrs.keys() if a not in args ]
+        if unknown:
+            raise InventoryError("%s %s: unknown attribute(s) %s" % (entityclass.__name__, attrs['name'], ', '.join(unknown)))
+
+        kwargs = dict(DEFAULTS.get(entityclass, {}))
+        kwargs['state'] = 'new'
+        kwargs.update(attrs)
+        required = args[:len(args) - len(defaults or ())]
+        missing = [ a for a in required if a not in kwargs ]
+        if missing:
+            raise InventoryError("%s %s: missing attribute(s) %s" % (entityclass.__name__, attrs['name'], ', '.join(missing)))
+
+        if entityclass is Project:
+            kwargs['members'] = list(kwargs.get('members') or [])
+            if kwargs.get('owner') not in kwargs['members']:
+                kwargs['members'].append(kwargs['owner'])
+
+        eo = entityclass(**kwargs)
+        eo.storenew = True
+        return eo
+
+    def plan(self, capi):
+        '''
+        Compares manifest with infoservice contents.
+
+        :return: List of Change, one per manifest entry.
+        '''
+        classes = []
+        for (entityclass, attrs) in self.entries:
+            if entityclass not in classes:
+                classes.append(entityclass)
+
+        listings = capi._parallel(capi._listentities, classes)
+        existing = {}
+        for (entityclass, (entities, e)) in zip(classes, listings):
+            if e is not None:
+                raise e
+            existing[entityclass] = dict([ (eo.name, eo) for eo in entities or [] ])
+
+        changes = []
+        for (entityclass, attrs) in self.entries:
+            new = self._makeentity(entityclass, attrs)
+            old = existing[entityclass].get(new.name)
+            if old is None:
+                changes.append(Change('create', new))
+                continue
+            changed = [ a for a in sorted(attrs.keys()) if a != 'name' and getattr(old, a, None) != getattr(new, a) ]
+            if not changed:
+                changes.append(Change('unchanged', old))
+                continue
+            for a in changed:
+                setattr(old, a, getattr(new, a))
+            changes.append(Change('update', old, changed))
+        return changes
+
+    def apply(self, capi, changes=None):
+        '''
+        Stores created and updated entities, independent ones concurrently.
+
+        :return: (changes, results) where results are the BatchResult of each store.
+        :raises BatchError: if some store failed. Entities stored before the failure are kept,
+                            so a re-run only redoes the remaining work.
+        '''
+        if changes is None:
+            changes = self.plan(capi)
+        with capi.batch(rollback=False) as b:
+            for c in changes:
+                if c.action != 'unchanged':
+                    b.store(c.entity)
+        return (changes, b.results)
@@ -0,0 +1,317 @@
+#!/bin/env python
+__author__ = "John Hover"
+__copyright__ = "2017 John Hover"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "John Hover"
+__email__ = "jhover@bnl.gov"
+__status__ = "Production"
+
+'''
+In-process stand-in for the infoservice.
+
+LocalInfoClient offers the InfoClient calls VC3ClientAPI uses (getentity, listentities,
+deleteentity, the document calls behind InfoEntity.store(), storeentities, requestPairing
+and getPairing) with the same exceptions, over an in-memory store. Given a path it also
+keeps the store in an SQLite file, so it survives between processes.
+
+Select it in vc3-client.conf:
+
+    [netcomm]
+    backend = local
+
+    [local]
+    # SQLite file. Empty keeps everything in memory, shared by the whole process.
+    path =
+    # Delay added to every call, to mimic the infoservice round trip.
+    latency_ms = 0
+
+Entities are kept as JSON text, as the infoservice keeps them, so objects returned are
+always independent copies and anything that would not survive the infoservice's JSON
+round trip fails here too.
+'''
+
+import binascii
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from util import confget, confgetfloat
+from vc3infoservice.core import InfoMissingPairingException, InfoEntityExistsException, InfoEntityMissingException, InfoEntityUpdateMissingException
+
+
+class LocalInfoClient(object):
+    '''
+    Thread-safe in-memory infoservice with optional SQLite persistence.
+    '''
+
+    # path -> LocalInfoClient, so every client of a process sees the same store.
+    _shared = {}
+    _sharedlock = threading.Lock()
+
+    PAIRINGKEY = 'pairing'
+
+    def __init__(self, path=None, latency=0.0):
+        '''
+        :param str path: SQLite file to load from and write through to. None keeps
+                         the store in memory only.
+        :param float latency: Seconds each call waits before being served, as a network
+                              round trip would. Calls wait concurrently.
+        '''
+        self.log = logging.getLogger('vc3client')
+        self.path = path
+        self.latency = latency
+        self.calls = 0
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._docs = {}      # infokey -> { name : JSON text of attributes }
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(os.path.expanduser(path), check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS entities "
+                             "(infokey TEXT, name TEXT, body TEXT, PRIMARY KEY (infokey, name))")
+            self._db.commit()
+            for (infokey, name, body) in self._db.execute("SELECT infokey, name, body FROM entities"):
+                self._docs.setdefault(infokey, {})[name] = body
+            self.log.debug("Loaded local infoservice store %s", path)
+
+    @classmethod
+    def fromConfig(cls, config):
+        '''
+        Returns the process-wide LocalInfoClient for config's [local] path.
+        '''
+        path = confget(config, 'local', 'path', None) or None
+        with cls._sharedlock:
+            ic = cls._shared.get(path)
+            if ic is None:
+                ic = cls(path)
+                cls._shared[path] = ic
+        ic.latency = confgetfloat(config, 'local', 'latency_ms', 0.0) / 1000.0
+        return ic
+
+    def _roundtrip(self):
+        '''
+        Called on entry of every public call, except those made within storeentities().
+        '''
+        if getattr(self._local, 'bulk', False):
+            return
+        self.calls += 1
+        if self.latency > 0:
+            time.sleep(self.latency)
+
+    ################################################################################
+    #                           Storage
+    ################################################################################
+
+    def _write(self, infokey, names):
+        '''
+        Writes current state of entities names of infokey through to SQLite.
+        '''
+        if self._db is None:
+            return
+        docs = self._docs.get(infokey, {})
+        for name in names:
+            if name in docs:
+                self._db.execute("INSERT OR REPLACE INTO entities (infokey, name, body) VALUES (?, ?, ?)",
+                                 (infokey, name, docs[name]))
+            else:
+                self._db.execute("DELETE FROM entities WHERE infokey = ? AND name = ?", (infokey, name))
+        self._db.commit()
+
+    def _load(self, infokey, name):
+        try:
+            return json.loads(self._docs[infokey][name])
+        except KeyError:
+            return None
+
+    def clear(self):
+        '''
+        Removes every entity and document.
+        '''
+        with self._lock:
+            self._docs = {}
+            if self._db is not None:
+                self._db.execute("DELETE FROM entities")
+                self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            with self._lock:
+                self._db.close()
+                self._db = None
+
+    ################################################################################
+    #                           Documents
+    ################################################################################
+
+    def getdocumentobject(self, key):
+        '''
+        Returns { key : { name : attributes } } for all entities under key.
+        '''
+        self._roundtrip()
+        with self._lock:
+            docs = self._docs.get(key, {})
+            return { key : dict([ (name, json.loads(body)) for (name, body) in docs.items() ]) }
+
+    def getdocument(self, key):
+        return json.dumps(self.getdocumentobject(key))
+
+    def storedocumentobject(self, dobj, key):
+        '''
+        Replaces all entities under key with those of dobj ({ key : { name : attributes } }).
+        '''
+        self._roundtrip()
+        with self._lock:
+            old = self._docs.get(key, {})
+            self._docs[key] = dict([ (name, json.dumps(attrs)) for (name, attrs) in dobj.get(key, {}).items() ])
+            self._write(key, set(old.keys()) | set(self._docs[key].keys()))
+
+    def storedocument(self, key, doc):
+        self.storedocumentobject(json.loads(doc), key)
+
+    def mergedocumentobject(self, dobj, key):
+        '''
+        Merges attributes of each entity of dobj ({ key : { name : attributes } }) into
+        those stored, creating entities that do not exist.
+        '''
+        self._roundtrip()
+        self._merge(dobj.get(key, {}), key)
+
+    def _merge(self, entdict, key):
+        with self._lock:
+            docs = self._docs.setdefault(key, {})
+            for (name, attrs) in entdict.items():
+                current = self._load(key, name) or {}
+                current.update(attrs)
+                docs[name] = json.dumps(current)
+            self._write(key, entdict.keys())
+
+    def mergedocument(self, key, doc):
+        self.mergedocumentobject(json.loads(doc), key)
+
+    ################################################################################
+    #                           Entities
+    ################################################################################
+
+    def _storeentitydict(self, entdict, key):
+        '''
+        Stores new entities ({ name : attributes }). Raises InfoEntityExistsException
+        if one already exists.
+        '''
+        self._roundtrip()
+        self._store(entdict, key)
+
+    def _store(self, entdict, key):
+        with self._lock:
+            docs = self._docs.setdefault(key, {})
+            for name in entdict.keys():
+                if name in docs:
+                    raise InfoEntityExistsException("Entity %s already exists in %s" % (name, key))
+            for (name, attrs) in entdict.items():
+                docs[name] = json.dumps(attrs)
+            self._write(key, entdict.keys())
+
+    def _mergeentitydict(self, entdict, key):
+        '''
+        Updates existing entities ({ name : changed attributes }). Raises
+        InfoEntityUpdateMissingException if one does not exist.
+        '''
+        self._roundtrip()
+        self._update(entdict, key)
+
+    def _update(self, entdict, key):
+        with self._lock:
+            docs = self._docs.setdefault(key, {})
+            for name in entdict.keys():
+                if name not in docs:
+                    raise InfoEntityUpdateMissingException("Entity %s does not exist in %s" % (name, key))
+            self._merge(entdict, key)
+
+    def getentity(self, entityclass, name):
+        self._roundtrip()
+        with self._lock:
+            attrs = self._load(entityclass.infokey, name)
+        if attrs is None:
+            raise InfoEntityMissingException("%s %s does not exist" % (entityclass.__name__, name))
+        return entityclass.objectFromDict({ name : attrs })
+
+    def listentities(self, entityclass):
+        doc = self.getdocumentobject(entityclass.infokey)[entityclass.infokey]
+        return [ entityclass.objectFromDict({ name : attrs }) for (name, attrs) in doc.items() ]
+
+    def deleteentity(self, entityclass, name):
+        self._roundtrip()
+        key = entityclass.infokey
+        with self._lock:
+            if name not in self._docs.get(key, {}):
+                raise InfoEntityMissingException("%s %s does not exist" % (entityclass.__name__, name))
+            del self._docs[key][name]
+            self._write(key, [ name ])
+
+    def storeentities(self, entities):
+        '''
+        Stores all entities or, if any store fails, none of them, in one round trip.
+        '''
+        self._roundtrip()
+        with self._lock:
+            saved = {}
+            for entity in entities:
+                key = entity.__class__.infokey
+                if key not in saved:
+                    saved[key] = dict(self._docs.get(key, {}))
+            db, self._db = self._db, None
+            self._local.bulk = True
+            try:
+                for entity in entities:
+                    entity.store(self)
+            except Exception:
+                self._docs.update(saved)
+                raise
+            finally:
+                self._db = db
+                self._local.bulk = False
+            for entity in entities:
+                self._write(entity.__class__.infokey, [ entity.name ])
+
+    ################################################################################
+    #                           Pairing
+    ################################################################################
+
+    def requestPairing(self, commonname):
+        '''
+        Records a pairing request for commonname and returns its pairing code.
+        '''
+        code = binascii.hexlify(os.urandom(8))
+        self.mergedocumentobject({ self.PAIRINGKEY : { code : { 'cn' : commonname,
+                                                                'state' : 'new',
+                                                                'cert' : None,
+                                                                'key' : None } } },
+                                 self.PAIRINGKEY)
+        return code
+
+    def satisfyPairing(self, code, cert, key):
+        '''
+        Attaches credentials to a pairing request, as the VC3 master does.
+        '''
+        with self._lock:
+            if self._load(self.PAIRINGKEY, code) is None:
+                raise InfoMissingPairingException("No pairing request %s" % code)
+            self._mergeentitydict({ code : { 'state' : 'satisfied', 'cert' : cert, 'key' : key } }, self.PAIRINGKEY)
+
+    def getPairing(self, code):
+        '''
+        Returns (cert, key) of a satisfied pairing request and removes it. Raises
+        InfoMissingPairingException if it does not exist or is not satisfied yet.
+        '''
+        self._roundtrip()
+        with self._lock:
+            pairing = self._load(self.PAIRINGKEY, code)
+            if pairing is None or pairing.get('state') != 'satisfied':
+                raise InfoMissingPairingException("Pairing %s missing or not satisfied yet" % code)
+            del self._docs[self.PAIRINGKEY][code]
+            self._write(self.PAIRINGKEY, [ code ])
+        return (pairing['cert'], pairing['key'])
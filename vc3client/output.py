@@ -0,0 +1,139 @@
+#!/bin/env python
+__author__ = "John Hover"
+__copyright__ = "2017 John Hover"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "John Hover"
+__email__ = "jhover@bnl.gov"
+__status__ = "Production"
+
+'''
+Machine-readable output of entities for the list and get subcommands.
+
+EntityWriter writes each entity as it is handed over, so a listing is never held in
+memory in full:
+
+    text     the entity's repr, one per line (the historical output)
+    json     one JSON array of objects for a listing, a single object for a get
+    ndjson   one JSON object per line
+    tsv      a header line with the field names, then one tab-separated line per
+             entity; lists are joined with ',', dicts written as JSON, None left
+             empty, and backslash, tab and newline escaped as \\\\, \\t and \\n
+
+Objects hold the requested fields in the order given (name first), or every
+attribute of the entity.
+'''
+
+import json
+
+from collections import OrderedDict
+
+from projection import Projection
+
+FORMATS = ('text', 'json', 'ndjson', 'tsv')
+
+TSV_ESCAPES = [ ('\\', '\\\\'), ('\t', '\\t'), ('\n', '\\n'), ('\r', '\\r') ]
+
+
+def _encode(s):
+    if isinstance(s, unicode):
+        return s.encode('utf-8')
+    return s
+
+
+def _tsvvalue(v):
+    if v is None:
+        return ''
+    if isinstance(v, (list, tuple)):
+        v = ','.join([ unicode(i) for i in v ])
+    elif isinstance(v, dict):
+        v = json.dumps(v, sort_keys=True)
+    elif not isinstance(v, basestring):
+        v = unicode(v)
+    for (char, escaped) in TSV_ESCAPES:
+        v = v.replace(char, escaped)
+    return v
+
+
+class EntityWriter(object):
+    '''
+    Streams entities (or Projections) to a file object in one of FORMATS.
+    '''
+
+    def __init__(self, out, format='text', fields=None, single=False):
+        '''
+        :param out: File object written to.
+        :param fields: List, or comma-separated string, of attributes to write. None
+                       writes all attributes of each entity. Ignored for text.
+        :param Boolean single: Output of a get: json writes the object rather than an
+                               array holding it.
+        '''
+        if format not in FORMATS:
+            raise ValueError("Unknown output format %s, not one of %s" % (format, ', '.join(FORMATS)))
+        if isinstance(fields, basestring):
+            fields = fields.split(',')
+        if fields is not None:
+            fields = [ f.strip() for f in fields if f.strip() ]
+            if 'name' not in fields:
+                fields.insert(0, 'name')
+        self.out = out
+        self.format = format
+        self.fields = fields
+        self.single = single
+        self.count = 0
+        self._columns = None
+
+    def _columnsof(self, entity):
+        if self.fields is not None:
+            return self.fields
+        if isinstance(entity, Projection):
+            return entity.fields
+        return entity.infoattributes
+
+    def _values(self, entity):
+        if self._columns is None:
+            self._columns = self._columnsof(entity)
+        return OrderedDict([ (f, getattr(entity, f, None)) for f in self._columns ])
+
+    def write(self, entity):
+        out = self.out
+        if self.format == 'text':
+            out.write("%s\n" % (entity,))
+        elif entity is None:
+            if self.format == 'json':
+                out.write('null' if self.single else ('[\n' if self.count == 0 else ',\n') + 'null')
+            elif self.format == 'ndjson':
+                out.write('null\n')
+        elif self.format == 'ndjson':
+            out.write(json.dumps(self._values(entity), default=str) + '\n')
+        elif self.format == 'json':
+            if self.single:
+                out.write(json.dumps(self._values(entity), default=str, indent=2, separators=(',', ': ')))
+            else:
+                out.write(('[\n' if self.count == 0 else ',\n') + json.dumps(self._values(entity), default=str))
+        else:
+            values = self._values(entity)
+            if self.count == 0:
+                out.write('\t'.join(self._columns) + '\n')
+            out.write(_encode('\t'.join([ _tsvvalue(v) for v in values.values() ]) + '\n'))
+        self.count += 1
+
+    def writeall(self, entities):
+        for entity in entities:
+            self.write(entity)
+        self.close()
+
+    def close(self):
+        '''
+        Completes the output: closes the json array, or writes the tsv header of an
+        empty listing when fields are known.
+        '''
+        if self.format == 'json':
+            if self.single:
+                self.out.write('\n')
+            else:
+                self.out.write('[]\n' if self.count == 0 else '\n]\n')
+        elif self.format == 'tsv' and self.count == 0 and self.fields is not None:
+            self.out.write('\t'.join(self.fields) + '\n')
+        self.out.flush()
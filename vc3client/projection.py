@@ -0,0 +1,114 @@
+#!/bin/env python
+__author__ = "John Hover"
+__copyright__ = "2017 John Hover"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "John Hover"
+__email__ = "jhover@bnl.gov"
+__status__ = "Production"
+
+'''
+Sparse views of entities, for list and get calls made with fields=.
+
+Request and Environment objects carry large base64 attributes (queuesconf, authconf,
+statusraw, files...). A Projection holds only the requested attributes, taken directly
+from the infoservice document without constructing the entity. Reading any other
+attribute (or calling an entity method) retrieves the full entity once, on first use.
+'''
+
+import logging
+
+
+def checkfields(entityclass, fields):
+    '''
+    Returns fields as a list of attribute names of entityclass, always including name.
+
+    :param fields: List of names, or comma-separated string.
+    :raises ValueError: for names that are not infoattributes of entityclass.
+    '''
+    if isinstance(fields, basestring):
+        fields = fields.split(',')
+    fields = [ f.strip() for f in fields if f.strip() ]
+    unknown = [ f for f in fields if f not in entityclass.infoattributes ]
+    if unknown:
+        raise ValueError("Unknown %s field(s): %s" % (entityclass.__name__, ', '.join(unknown)))
+    if 'name' not in fields:
+        fields.insert(0, 'name')
+    return fields
+
+
+class Projection(object):
+    '''
+    Read-only view of an entity with only some attributes loaded.
+    '''
+
+    log = logging.getLogger('vc3client')
+
+    def __init__(self, entityclass, values, loader, entity=None):
+        '''
+        :param class entityclass: InfoEntity subclass viewed.
+        :param dict values: Loaded attribute values, including name.
+        :param loader: Callable returning the full entity, used on access to other attributes.
+        :param entity: Full entity, if already at hand.
+        '''
+        self.__dict__.update(values)
+        self._entityclass = entityclass
+        self._fields = [ a for a in entityclass.infoattributes if a in values ]
+        self._loader = loader
+        self._entity = entity
+
+    @classmethod
+    def fromDocument(cls, entityclass, name, attrs, fields, loader):
+        '''
+        Builds Projection of fields from one infoservice document entry {name : attrs}.
+        '''
+        values = {}
+        for f in fields:
+            v = attrs.get(f)
+            if v is not None and f in entityclass.intattributes:
+                v = int(v)
+            values[f] = v
+        values['name'] = name
+        return cls(entityclass, values, loader)
+
+    @classmethod
+    def fromEntity(cls, entity, fields, loader=None):
+        values = dict([ (f, getattr(entity, f, None)) for f in fields ])
+        return cls(entity.__class__, values, loader, entity)
+
+    @property
+    def fields(self):
+        return list(self._fields)
+
+    @property
+    def entityclass(self):
+        return self._entityclass
+
+    def entity(self):
+        '''
+        Returns the full entity, retrieving it on first call.
+        '''
+        if self._entity is None:
+            self.log.debug("Loading full %s %s", self._entityclass.__name__, self.name)
+            self._entity = self._loader()
+        return self._entity
+
+    def __getattr__(self, attr):
+        # Only called for attributes not loaded in the projection.
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        return getattr(self.entity(), attr)
+
+    def __setattr__(self, attr, value):
+        if not attr.startswith('_'):
+            raise AttributeError("%s projection of %s is read-only" % (self._entityclass.__name__, self.name))
+        object.__setattr__(self, attr, value)
+
+    def __repr__(self):
+        s = "%s( " % self._entityclass.__name__
+        for a in self._entityclass.infoattributes:
+            if a in self.__dict__:
+                s += "%s=%s " % (a, self.__dict__[a])
+        s += ")"
+        return s
@@ -0,0 +1,69 @@
+#!/bin/env python
+__author__ = "John Hover"
+__copyright__ = "2017 John Hover"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "John Hover"
+__email__ = "jhover@bnl.gov"
+__status__ = "Production"
+
+'''
+Interactive shell of the vc3-client command line (vc3-client shell).
+'''
+
+import cmd
+import sys
+
+
+class VC3Shell(cmd.Cmd):
+    '''
+    Interactive shell. Each line is a vc3-client subcommand, run with the shell's
+    client, so configuration, connections and caches are set up once.
+    '''
+
+    intro = 'vc3-client shell. Type help for the list of subcommands, exit or Ctrl-D to leave.'
+    prompt = 'vc3> '
+
+    def __init__(self, cli, capi):
+        cmd.Cmd.__init__(self)
+        self.cli = cli
+        self.capi = capi
+        self.code = 0
+
+    def subcommands(self):
+        return sorted([ name for (name, help) in self.cli.SUBCOMMANDS ])
+
+    def default(self, line):
+        self.code = self.cli.runline(line, self.capi, sys.stdout)
+        if self.code:
+            sys.stdout.write("exit %d\n" % self.code)
+
+    def preloop(self):
+        try:
+            import readline
+            # Subcommand names contain '-'; complete them whole.
+            readline.set_completer_delims(' \t\n')
+        except ImportError:
+            pass
+
+    def emptyline(self):
+        pass
+
+    def completenames(self, text, *ignored):
+        return [ c for c in self.subcommands() if c.startswith(text) ]
+
+    def do_help(self, arg):
+        if arg:
+            self.default('%s --help' % arg)
+        else:
+            self.cli.makeparser().print_help()
+
+    def do_exit(self, arg):
+        return True
+
+    do_quit = do_exit
+
+    def do_EOF(self, arg):
+        sys.stdout.write('\n')
+        return True
@@ -0,0 +1,253 @@
+#!/bin/env python
+__author__ = "John Hover"
+__copyright__ = "2017 John Hover"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "John Hover"
+__email__ = "jhover@bnl.gov"
+__status__ = "Production"
+
+'''
+In-memory snapshot of the whole registry, for "one fetch, many queries" work such as
+reports and dashboards.
+
+A Snapshot lists every entity kind concurrently, once, and keeps the documents in an
+EntityIndex per kind, so the same queries as VC3ClientAPI.query() are answered from
+memory, along with the relations between entities:
+
+    owner, state, ...       query(entityclass, owner=...)
+    project membership      projectsOfUser(user)
+    allocation -> resource  resourceOfAllocation(name), allocationsOfResource(name)
+    request -> cluster      clusterOfRequest(name), requestsOfCluster(name)
+    cluster -> nodesets     nodesetsOfCluster(name)
+    nodeset -> nodeinfo     nodeinfoOfNodeset(name)
+    nodeset -> environment  environmentOfNodeset(name)
+
+refresh() lists the kinds again and re-indexes only what changed. The snapshot is not
+updated by anything else, in particular not by stores made through the client.
+
+VC3ClientAPI.withSnapshot() returns a client whose read calls (getX, listX, query,
+policy checks, getFleetStatus, ...) are answered from a snapshot, through the read-only
+infoclient interface of SnapshotInfoClient. Calls that write raise SnapshotReadOnly.
+
+    view = capi.withSnapshot()
+    for u in view.listUsers():
+        print u.name, [ p.name for p in view.snapshot.projectsOfUser(u.name) ]
+'''
+
+import logging
+import time
+
+from entities import User, Project, Resource, Allocation, Nodeinfo, Nodeset, Request, Cluster, Environment
+from index import EntityIndexes
+from projection import Projection, checkfields
+from vc3infoservice.core import InfoEntityMissingException
+
+ENTITYCLASSES = [ User, Project, Resource, Allocation, Nodeinfo, Nodeset, Cluster, Environment, Request ]
+
+
+class SnapshotReadOnly(Exception):
+    """
+    Exception thrown when a client answering from a Snapshot is asked to write
+    to the infoservice.
+    """
+
+    def __init__(self, *args, **kwargs):
+        Exception.__init__(self, *args, **kwargs)
+
+
+class Snapshot(object):
+    '''
+    Documents of all entities of the given kinds, with indexes by attribute value.
+    '''
+
+    def __init__(self, capi, entityclasses=ENTITYCLASSES):
+        '''
+        :param VC3ClientAPI capi: Client the entities are listed with.
+        :param List entityclasses: Kinds loaded by load() and refresh(). Other kinds are
+                                   listed on first use.
+        '''
+        self.log = logging.getLogger('vc3client')
+        self.capi = capi
+        self.entityclasses = list(entityclasses)
+        self.indexes = EntityIndexes(ttl=None)
+        self.loadtime = None
+
+    def load(self):
+        '''
+        Lists all entity kinds, concurrently.
+
+        :return: self
+        '''
+        self.refresh()
+        return self
+
+    def refresh(self, *entityclasses):
+        '''
+        Lists entityclasses (all kinds if none given) again, concurrently, and applies
+        the differences. If any listing fails nothing is applied, so the snapshot is
+        never a mix of old and new listings of the kinds refreshed.
+
+        :return: { entity class name : (added, changed, removed) } with the sorted
+                 names of the entities in each case.
+        '''
+        if not entityclasses:
+            entityclasses = self.entityclasses
+        start = time.time()
+        results = self.capi._parallel(lambda c: self.capi._listdocuments(c, fresh=True), entityclasses)
+        for (entityclass, (docs, e)) in zip(entityclasses, results):
+            if e is not None:
+                self.log.debug("Listing %s for snapshot refresh failed: %s" % (entityclass.__name__, e))
+                raise e.__class__, e, getattr(e, '__traceback__', None)
+        changes = {}
+        for (entityclass, (docs, e)) in zip(entityclasses, results):
+            changes[entityclass.__name__] = self.indexes.get(entityclass).refresh(docs)
+        self.loadtime = time.time()
+        self.log.debug("Snapshot of %d entity kinds refreshed in %.3f s" % (len(entityclasses), self.loadtime - start))
+        return changes
+
+    def index(self, entityclass):
+        '''
+        Returns the EntityIndex of entityclass, listing it first if not loaded.
+        '''
+        index = self.indexes.get(entityclass)
+        if not index.loaded():
+            index.refresh(self.capi._listdocuments(entityclass, fresh=True))
+        return index
+
+    ################################################################################
+    #                           Entities
+    ################################################################################
+
+    def _decode(self, entityclass, name, attrs, fields=None):
+        if fields is None:
+            return entityclass.objectFromDict({ name : attrs })
+        return Projection.fromDocument(entityclass, name, attrs, fields,
+                                       lambda: self.get(entityclass, name))
+
+    def get(self, entityclass, name, fields=None):
+        '''
+        Returns entity name of entityclass, a new object on every call, or None if there
+        is no such entity.
+
+        :param List str fields: Return a Projection of these attributes.
+        '''
+        attrs = self.index(entityclass).document(name)
+        if attrs is None:
+            return None
+        if fields is not None:
+            fields = checkfields(entityclass, fields)
+        return self._decode(entityclass, name, attrs, fields)
+
+    def query(self, entityclass, fields=None, **criteria):
+        '''
+        Returns entities of entityclass matching criteria, sorted by name. Same as
+        VC3ClientAPI.query(), answered from the snapshot.
+        '''
+        criteria = dict([ (a, v) for (a, v) in criteria.items() if v is not None ])
+        checkfields(entityclass, criteria.keys())
+        if fields is not None:
+            fields = checkfields(entityclass, fields)
+        return [ self._decode(entityclass, name, attrs, fields)
+                 for (name, attrs) in self.index(entityclass).lookup(criteria) ]
+
+    def _references(self, entityclass, name, attribute):
+        '''
+        Returns list of the names in attribute of entity name (a name or a list of them).
+        '''
+        value = self.index(entityclass).attribute(name, attribute)
+        if value is None:
+            return []
+        if isinstance(value, (list, tuple)):
+            return list(value)
+        return [ value ]
+
+    def _follow(self, entityclass, name, attribute, targetclass):
+        '''
+        Returns the targetclass entities named in attribute of entity name, skipping
+        names of entities that do not exist.
+        '''
+        targets = [ self.get(targetclass, n) for n in self._references(entityclass, name, attribute) ]
+        return [ t for t in targets if t is not None ]
+
+    def _one(self, entities):
+        return entities[0] if entities else None
+
+    ################################################################################
+    #                           Relations
+    ################################################################################
+
+    def projectsOfUser(self, username):
+        '''
+        Returns projects username owns or is a member of, sorted by name.
+        '''
+        projects = dict([ (p.name, p) for p in self.query(Project, owner=username) ])
+        for p in self.query(Project, members=username):
+            projects.setdefault(p.name, p)
+        return [ projects[n] for n in sorted(projects) ]
+
+    def resourceOfAllocation(self, allocationname):
+        return self._one(self._follow(Allocation, allocationname, 'resource', Resource))
+
+    def allocationsOfResource(self, resourcename):
+        return self.query(Allocation, resource=resourcename)
+
+    def clusterOfRequest(self, requestname):
+        return self._one(self._follow(Request, requestname, 'cluster', Cluster))
+
+    def requestsOfCluster(self, clustername):
+        return self.query(Request, cluster=clustername)
+
+    def nodesetsOfCluster(self, clustername):
+        '''
+        Returns the nodesets of cluster clustername, in the cluster's order.
+        '''
+        return self._follow(Cluster, clustername, 'nodesets', Nodeset)
+
+    def nodesetsOfRequest(self, requestname):
+        nodesets = []
+        for clustername in self._references(Request, requestname, 'cluster'):
+            nodesets += self.nodesetsOfCluster(clustername)
+        return nodesets
+
+    def nodeinfoOfNodeset(self, nodesetname):
+        return self._one(self._follow(Nodeset, nodesetname, 'nodeinfo', Nodeinfo))
+
+    def environmentOfNodeset(self, nodesetname):
+        return self._one(self._follow(Nodeset, nodesetname, 'environment', Environment))
+
+
+class SnapshotInfoClient(object):
+    '''
+    Read-only infoclient interface over a Snapshot: the reads VC3ClientAPI makes are
+    answered from it, and writes raise SnapshotReadOnly.
+    '''
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self._classes = dict([ (c.infokey, c) for c in ENTITYCLASSES ])
+
+    def getentity(self, entityclass, name):
+        eo = self.snapshot.get(entityclass, name)
+        if eo is None:
+            raise InfoEntityMissingException("%s %s does not exist" % (entityclass.__name__, name))
+        return eo
+
+    def listentities(self, entityclass):
+        return self.snapshot.query(entityclass)
+
+    def getdocumentobject(self, key):
+        entityclass = self._classes.get(key)
+        if entityclass is None:
+            raise SnapshotReadOnly("%s documents are not held in snapshots" % key)
+        return { key : self.snapshot.index(entityclass).documents() }
+
+    def _readonly(self, *args, **kwargs):
+        raise SnapshotReadOnly("Client answering from a snapshot cannot write to the infoservice")
+
+    storedocumentobject = storedocument = _readonly
+    mergedocumentobject = mergedocument = _readonly
+    _storeentitydict = _mergeentitydict = _readonly
+    deleteentity = storeentities = _readonly
+    requestPairing = getPairing = _readonly
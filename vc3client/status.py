@@ -0,0 +1,216 @@
+#!/bin/env python
+__author__ = "John Hover"
+__copyright__ = "2017 John Hover"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "John Hover"
+__email__ = "jhover@bnl.gov"
+__status__ = "Production"
+
+'''
+Structured view of Request.statusraw.
+
+statusraw holds what each factory reports for the queues it runs for a request:
+
+    { factory : { nodeset : { queue : { state : count, ... }, ... }, ... }, ... }
+
+Factory queues are per allocation, so queue names are taken as allocation names.
+RequestStatus sums those counts per nodeset, per allocation and overall. Counters always
+have the states in STATES, plus any other state a factory reports.
+
+Both RequestStatus and FleetStatus are meant to be kept between polls: update() only
+re-parses the factory reports (or requests) whose content changed since the last call.
+'''
+
+import json
+import logging
+
+STATES = ('queued', 'running', 'idle', 'error')
+
+
+def newcounters():
+    return dict.fromkeys(STATES, 0)
+
+
+def addcounters(into, counts, sign=1):
+    '''
+    Adds (or with sign -1, subtracts) counters counts, as parsed by RequestStatus, to into.
+    '''
+    for (state, n) in counts.items():
+        into[state] = into.get(state, 0) + sign * n
+    return into
+
+
+class RequestStatus(object):
+    '''
+    Job counters of one request, parsed from its statusraw.
+    '''
+
+    log = logging.getLogger('vc3client')
+
+    def __init__(self, name, statusraw=None):
+        self.name = name
+        self.nodesets = {}       # nodeset -> counters
+        self.allocations = {}    # allocation -> counters
+        self.totals = newcounters()
+        self._factories = {}     # factory -> (raw report, [ (nodeset, allocation, counters) ])
+        self._rawstring = None
+        if statusraw is not None:
+            self.update(statusraw)
+
+    def allocationOf(self, nodeset, queue):
+        '''
+        Returns the allocation a factory queue of nodeset runs under.
+        '''
+        return queue
+
+    def _parse(self, factory, report):
+        entries = []
+        if not isinstance(report, dict):
+            self.log.warning("Request %s: unexpected status from factory %s: %r", self.name, factory, report)
+            return entries
+        for (nodeset, queues) in report.items():
+            if not isinstance(queues, dict):
+                if queues is not None:
+                    self.log.warning("Request %s: unexpected status of nodeset %s from factory %s: %r",
+                                     self.name, nodeset, factory, queues)
+                continue
+            for (queue, counts) in queues.items():
+                if not isinstance(counts, dict):
+                    self.log.warning("Request %s: unexpected status of queue %s from factory %s: %r",
+                                     self.name, queue, factory, counts)
+                    continue
+                entries.append((nodeset, self.allocationOf(nodeset, queue), self._counters(factory, queue, counts)))
+        return entries
+
+    def _counters(self, factory, queue, counts):
+        counters = newcounters()
+        for (state, n) in counts.items():
+            try:
+                counters[state] = counters.get(state, 0) + int(n)
+            except (TypeError, ValueError):
+                self.log.warning("Request %s: ignoring count %r of state %s in queue %s from factory %s",
+                                 self.name, n, state, queue, factory)
+        return counters
+
+    def update(self, statusraw):
+        '''
+        Brings counters up to date with statusraw (dict, or its JSON string). Factory
+        reports identical to the previous update are not parsed again.
+
+        :return: True if any counter may have changed.
+        '''
+        if isinstance(statusraw, basestring):
+            if statusraw == self._rawstring:
+                return False
+            self._rawstring = statusraw
+            try:
+                statusraw = json.loads(statusraw)
+            except ValueError, e:
+                self.log.warning("Request %s: status is not valid JSON: %s", self.name, e)
+                statusraw = {}
+        statusraw = statusraw or {}
+        if not isinstance(statusraw, dict):
+            self.log.warning("Request %s: unexpected status: %r", self.name, statusraw)
+            statusraw = {}
+
+        changed = set(self._factories.keys()) != set(statusraw.keys())
+        factories = {}
+        for (factory, report) in statusraw.items():
+            previous = self._factories.get(factory)
+            if previous is not None and previous[0] == report:
+                factories[factory] = previous
+            else:
+                factories[factory] = (report, self._parse(factory, report))
+                changed = True
+        self._factories = factories
+        if not changed:
+            return False
+
+        nodesets = {}
+        allocations = {}
+        totals = newcounters()
+        for (report, entries) in factories.values():
+            for (nodeset, allocation, counts) in entries:
+                addcounters(nodesets.setdefault(nodeset, newcounters()), counts)
+                addcounters(allocations.setdefault(allocation, newcounters()), counts)
+                addcounters(totals, counts)
+        self.nodesets = nodesets
+        self.allocations = allocations
+        self.totals = totals
+        return True
+
+    def __repr__(self):
+        return "RequestStatus(%s %s)" % (self.name, self.totals)
+
+
+class FleetStatus(object):
+    '''
+    Status summary over many requests, maintained incrementally.
+    '''
+
+    def __init__(self):
+        self.requests = {}      # name -> RequestStatus
+        self.states = {}        # name -> request state
+        self.totals = newcounters()
+        self.allocations = {}   # allocation -> counters over all requests
+
+    def _account(self, totals, allocations, sign):
+        addcounters(self.totals, totals, sign)
+        for (allocation, counts) in allocations.items():
+            addcounters(self.allocations.setdefault(allocation, newcounters()), counts, sign)
+
+    def update(self, requests):
+        '''
+        Updates the summary from requests, the complete current set of Request objects
+        (or projections with name, state and statusraw). Only requests whose statusraw
+        changed are re-parsed; requests no longer present are dropped.
+
+        :return: List of names of requests whose counters or state changed.
+        '''
+        changed = set()
+        seen = set()
+        for r in requests:
+            seen.add(r.name)
+            rs = self.requests.get(r.name)
+            if rs is None:
+                rs = RequestStatus(r.name, r.statusraw)
+                self.requests[r.name] = rs
+                self._account(rs.totals, rs.allocations, 1)
+                changed.add(r.name)
+            else:
+                # update() replaces the counter dicts it changes, so these stay as they were.
+                (totals, allocations) = (rs.totals, rs.allocations)
+                if rs.update(r.statusraw):
+                    self._account(totals, allocations, -1)
+                    self._account(rs.totals, rs.allocations, 1)
+                    changed.add(r.name)
+            if self.states.get(r.name) != r.state:
+                self.states[r.name] = r.state
+                changed.add(r.name)
+
+        for name in [ n for n in self.requests.keys() if n not in seen ]:
+            rs = self.requests.pop(name)
+            self._account(rs.totals, rs.allocations, -1)
+            self.states.pop(name, None)
+            changed.add(name)
+
+        for (allocation, counts) in self.allocations.items():
+            if not any(counts.values()):
+                del self.allocations[allocation]
+        return sorted(changed)
+
+    def summary(self):
+        '''
+        Returns dictionary with the number of requests, the number of requests in each
+        state, and job counters overall and per allocation.
+        '''
+        states = {}
+        for state in self.states.values():
+            states[state] = states.get(state, 0) + 1
+        return { 'requests' : len(self.requests),
+                 'states' : states,
+                 'totals' : dict(self.totals),
+                 'allocations' : dict([ (a, dict(c)) for (a, c) in self.allocations.items() ]),
+                 }
@@ -0,0 +1,307 @@
+#!/bin/env python
+__author__ = "John Hover"
+__copyright__ = "2017 John Hover"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "John Hover"
+__email__ = "jhover@bnl.gov"
+__status__ = "Production"
+
+'''
+Persistent HTTPS connections for infoservice calls.
+
+The infoclient module issues each call through the module-level requests functions,
+which open (and TLS handshake) a new connection every time. ConnectionPool routes the
+calls of an InfoClient instance through one keep-alive requests.Session instead, so the
+client-certificate handshake is paid once per pooled connection rather than once per call.
+
+The infoclient module takes no session, so ConnectionPool.bind() sets its requests global
+to a RequestsProxy. Calls made while a method of a bound InfoClient runs in the thread go
+to that instance's pool; all others go to the requests module, as before.
+'''
+
+import logging
+import os
+import sys
+import threading
+import time
+import types
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from util import confget, confgetboolean, confgetint, confgetfloat
+
+
+def _uses(code, name):
+    '''
+    Returns True if code, or a function defined within it, refers to global name.
+    '''
+    if name in code.co_names:
+        return True
+    return any([ _uses(c, name) for c in code.co_consts if isinstance(c, types.CodeType) ])
+
+
+class RequestsProxy(object):
+    '''
+    Stands for the requests module in the module of a bound InfoClient class, passing
+    each call on to the ConnectionPool of the bound InfoClient whose method is running
+    in the calling thread, or to the requests module if there is none.
+    '''
+
+    _current = threading.local()
+
+    def __init__(self, module):
+        self.module = module
+
+    def __getattr__(self, name):
+        pool = getattr(RequestsProxy._current, 'pool', None)
+        if pool is None:
+            return getattr(self.module, name)
+        return getattr(pool, name)
+
+    @classmethod
+    def wrap(cls, pool, method):
+        '''
+        Returns function calling method with pool as the current pool of the thread.
+        '''
+        def pooled(*args, **kwargs):
+            current = cls._current
+            previous = getattr(current, 'pool', None)
+            current.pool = pool
+            try:
+                return method(*args, **kwargs)
+            finally:
+                current.pool = previous
+        pooled.__name__ = method.__name__
+        pooled.__doc__ = method.__doc__
+        return pooled
+
+
+class ConnectionPool(object):
+    '''
+    Thread-safe keep-alive connection pool with the requests module call interface
+    (get, put, post, delete, head, request).
+
+    Connections left idle for longer than idletimeout seconds are dropped before the
+    next call, since the server or a firewall has likely closed them by then. The
+    session holding them is closed once the calls still running on it have returned.
+    '''
+
+    # (infohost, httpsport, certfile, keyfile) -> ConnectionPool
+    _shared = {}
+    _sharedlock = threading.Lock()
+
+    def __init__(self, certfile=None, keyfile=None, chainfile=None, maxsize=10, idletimeout=60.0):
+        '''
+        :param int maxsize: Maximum number of connections kept open per host. Callers beyond
+                            that wait for a free connection.
+        :param float idletimeout: Seconds after which idle connections are discarded.
+        '''
+        self.log = logging.getLogger('vc3client')
+        self.certfile = certfile
+        self.keyfile = keyfile
+        self.chainfile = chainfile
+        self.maxsize = maxsize
+        self.idletimeout = idletimeout
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.resets = 0
+        self._closedconnections = 0
+        self._lastused = time.time()
+        self._inflight = {}    # session -> number of calls running on it
+        self.session = self._newsession()
+
+    def _newsession(self):
+        session = requests.Session()
+        if self.certfile is not None and self.keyfile is not None:
+            session.cert = (self.certfile, self.keyfile)
+        if self.chainfile is not None:
+            session.verify = self.chainfile
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.maxsize, pool_block=True)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        return session
+
+    def _connections(self, session):
+        '''
+        Number of connections opened (and so handshakes made) so far by session.
+        '''
+        n = 0
+        # The same adapter is mounted for https:// and http://.
+        for adapter in set(session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is not None:
+                    n += getattr(pool, 'num_connections', 0)
+        return n
+
+    def _close(self, session):
+        self._closedconnections += self._connections(session)
+        session.close()
+
+    def _reset(self):
+        old = self.session
+        self.session = self._newsession()
+        self.resets += 1
+        if old not in self._inflight:
+            self._close(old)
+
+    def _release(self, session):
+        n = self._inflight.pop(session) - 1
+        if n:
+            self._inflight[session] = n
+        elif session is not self.session:
+            self._close(session)
+
+    def request(self, method, url, **kwargs):
+        with self._lock:
+            now = time.time()
+            if self.idletimeout and now - self._lastused > self.idletimeout:
+                self.log.debug("Connections idle for %.0f seconds, reconnecting" % (now - self._lastused))
+                self._reset()
+            self._lastused = now
+            self.requests += 1
+            session = self.session
+            self._inflight[session] = self._inflight.get(session, 0) + 1
+        try:
+            return session.request(method, url, **kwargs)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+        finally:
+            with self._lock:
+                self._release(session)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.request('POST', url, data=data, **kwargs)
+
+    def put(self, url, data=None, **kwargs):
+        return self.request('PUT', url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def __getattr__(self, name):
+        # Anything else infoclient takes from the requests module (exceptions, ...).
+        return getattr(requests, name)
+
+    def prewarm(self, url, count=None):
+        '''
+        Opens count connections to url concurrently, so that the first calls
+        do not pay the handshake.
+        '''
+        if count is None:
+            count = self.maxsize
+
+        def warm():
+            try:
+                self.request('HEAD', url, timeout=10)
+            except Exception, e:
+                self.log.debug("Prewarm request to %s failed: %s" % (url, e))
+
+        threads = [ threading.Thread(target=warm) for i in range(count) ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+    def close(self):
+        with self._lock:
+            self._close(self.session)
+
+    def stats(self):
+        '''
+        Returns dictionary of counters. handshakes is the number of connections opened;
+        every other request reused a connection and avoided one.
+        '''
+        with self._lock:
+            handshakes = self._closedconnections + self._connections(self.session)
+            for session in self._inflight.keys():
+                if session is not self.session:
+                    handshakes += self._connections(session)
+            return { 'requests' : self.requests,
+                     'errors' : self.errors,
+                     'handshakes' : handshakes,
+                     'handshakes_avoided' : max(self.requests - handshakes, 0),
+                     'resets' : self.resets,
+                     'maxsize' : self.maxsize,
+                     }
+
+    def bind(self, infoclient):
+        '''
+        Makes infoclient (a vc3infoservice.infoclient.InfoClient) issue its requests calls
+        through this pool, including calls made by functions its methods define or call
+        in the same thread. Only that instance is affected: its methods are wrapped to
+        select this pool while they run, and other users of the infoclient module still
+        reach the requests module.
+
+        :return: infoclient
+        :raises ValueError: if no method of infoclient's class uses the requests module,
+                            so that binding would silently leave its calls unpooled.
+        '''
+        cls = infoclient.__class__
+        module = sys.modules[cls.__module__]
+        methods = {}
+        for klass in reversed(cls.__mro__):
+            for (name, func) in vars(klass).items():
+                if isinstance(func, types.FunctionType) and not name.startswith('__'):
+                    methods[name] = func
+        used = [ f for f in methods.values() if f.__globals__ is vars(module) and _uses(f.__code__, 'requests') ]
+        if not used or not hasattr(module, 'requests'):
+            raise ValueError("%s.%s makes no requests calls to pool" % (module.__name__, cls.__name__))
+
+        if not isinstance(module.requests, RequestsProxy):
+            module.requests = RequestsProxy(module.requests)
+        for (name, func) in methods.items():
+            setattr(infoclient, name, RequestsProxy.wrap(self, types.MethodType(func, infoclient)))
+        return infoclient
+
+    @classmethod
+    def fromConfig(cls, config):
+        '''
+        Returns the process-wide ConnectionPool for the infoservice in config's [netcomm]
+        section, creating it on first use, or None if pooling is disabled.
+
+        [netcomm]
+        pool = true
+        poolsize = 10
+        poolidletimeout = 60
+        poolprewarm = 0
+        '''
+        if not confgetboolean(config, 'netcomm', 'pool', True):
+            return None
+
+        def path(option):
+            p = confget(config, 'netcomm', option)
+            if p is not None:
+                p = os.path.expanduser(p)
+            return p
+
+        infohost = confget(config, 'netcomm', 'infohost', 'localhost')
+        httpsport = confget(config, 'netcomm', 'httpsport', '20334')
+        key = (infohost, httpsport, path('certfile'), path('keyfile'))
+        with cls._sharedlock:
+            pool = cls._shared.get(key)
+            if pool is None:
+                pool = cls( certfile = path('certfile'),
+                            keyfile = path('keyfile'),
+                            chainfile = path('chainfile'),
+                            maxsize = confgetint(config, 'netcomm', 'poolsize', 10),
+                            idletimeout = confgetfloat(config, 'netcomm', 'poolidletimeout', 60.0),
+                            )
+                prewarm = confgetint(config, 'netcomm', 'poolprewarm', 0)
+                if prewarm:
+                    pool.prewarm('https://%s:%s/' % (infohost, httpsport), prewarm)
+                cls._shared[key] = pool
+        return pool
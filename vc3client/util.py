@@ -0,0 +1,137 @@
+#!/bin/env python
+__author__ = "John Hover"
+__copyright__ = "2017 John Hover"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "John Hover"
+__email__ = "jhover@bnl.gov"
+__status__ = "Production"
+
+'''
+Small helpers shared by the client modules.
+
+Optional settings are read through the conf* functions so that a missing
+section or option in vc3-client.conf always falls back to a default instead
+of raising NoSectionError/NoOptionError.
+'''
+
+import threading
+
+from ConfigParser import NoSectionError, NoOptionError
+
+
+def confget(config, section, option, default=None):
+    '''
+    Returns option from section of config as a string, or default if either is missing.
+    '''
+    if config is None:
+        return default
+    try:
+        return config.get(section, option)
+    except (NoSectionError, NoOptionError):
+        return default
+
+
+def confgetint(config, section, option, default=None):
+    value = confget(config, section, option, None)
+    if value is None or value.strip() == '':
+        return default
+    return int(value)
+
+
+def confgetfloat(config, section, option, default=None):
+    value = confget(config, section, option, None)
+    if value is None or value.strip() == '':
+        return default
+    return float(value)
+
+
+def confgetboolean(config, section, option, default=False):
+    value = confget(config, section, option, None)
+    if value is None or value.strip() == '':
+        return default
+    return value.strip().lower() in ('1', 'yes', 'true', 'on')
+
+
+class WorkerPool(object):
+    '''
+    Bounded pool of threads, started on first use and kept until closed, so that
+    concurrent operations do not each pay for starting and joining threads.
+
+    Calls made from one of the pool's own threads run serially in that thread: a worker
+    waiting on work queued behind it in the same pool could otherwise deadlock.
+
+    Clients use the pool shared() by every client of the same size, so that processes
+    creating many clients (e.g. one per portal request) do not keep one set of threads
+    per client.
+    '''
+
+    _sharedlock = threading.Lock()
+    _shared = {}    # size -> WorkerPool
+
+    def __init__(self, size):
+        '''
+        :param int size: Number of threads.
+        '''
+        self.size = size
+        self._lock = threading.Lock()
+        self._pool = None
+        self._local = threading.local()
+
+    @classmethod
+    def shared(cls, size):
+        '''
+        Returns the process-wide WorkerPool of size threads.
+        '''
+        with cls._sharedlock:
+            pool = cls._shared.get(size)
+            if pool is None:
+                pool = cls._shared[size] = cls(size)
+            return pool
+
+    def _initworker(self):
+        self._local.worker = True
+
+    def close(self):
+        '''
+        Stops the threads, once the calls in progress are done. The pool starts them
+        again if used after.
+        '''
+        with self._lock:
+            (pool, self._pool) = (self._pool, None)
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    def inworker(self):
+        '''
+        Returns True if called from one of the pool's threads.
+        '''
+        return getattr(self._local, 'worker', False)
+
+    def map(self, func, items, workers=None):
+        '''
+        Returns [ func(i) for i in items ], computed on at most workers threads.
+
+        :param int workers: Concurrency limit, no more than size. Defaults to size.
+        '''
+        items = list(items)
+        workers = min(workers or self.size, self.size, len(items))
+        if workers <= 1 or self.inworker():
+            return [ func(i) for i in items ]
+
+        with self._lock:
+            if self._pool is None:
+                from multiprocessing.pool import ThreadPool
+                self._pool = ThreadPool(self.size, self._initworker)
+            pool = self._pool
+        if workers == self.size:
+            return pool.map(func, items, chunksize=1)
+
+        # Fewer threads than the pool holds: hand each of them every workers-th item.
+        results = [ None ] * len(items)
+        runs = pool.map(lambda k: [ func(i) for i in items[k::workers] ], range(workers), chunksize=1)
+        for (k, run) in enumerate(runs):
+            results[k::workers] = run
+        return results
@@ -0,0 +1,180 @@
+#!/bin/env python
+__author__ = "John Hover"
+__copyright__ = "2017 John Hover"
+__credits__ = []
+__license__ = "GPL"
+__version__ = "1.0.0"
+__maintainer__ = "John Hover"
+__email__ = "jhover@bnl.gov"
+__status__ = "Production"
+
+'''
+One poller for the state of many requests.
+
+Each watched request has its own polling interval. It is reset to the minimum whenever
+the request changes state or is in a transitional state (new, initializing, pending,
+terminating, cleanup), and doubles, up to the maximum, at each poll that finds it
+unchanged in a stable state (running, terminated, failure). The poller sleeps until the
+next request is due and fetches all due requests together: concurrently by name when
+few are due, otherwise with one listing. Requests selected by owner or project are
+listed every maxinterval seconds, to find new ones, and otherwise fetched by name.
+'''
+
+import logging
+import time
+
+from entities import Request
+from vc3infoservice.core import InfoEntityMissingException
+
+# Any other state counts as transitional.
+FINAL_STATES = ('terminated', 'failure')
+STABLE_STATES = ('running',) + FINAL_STATES
+
+FIELDS = [ 'state', 'state_reason', 'owner', 'project' ]
+
+
+class RequestWatcher(object):
+    '''
+    Polls requests selected by name, owner or project and yields their state transitions.
+    Obtain one from VC3ClientAPI.watchRequests().
+    '''
+
+    def __init__(self, capi, names=None, owner=None, project=None,
+                       mininterval=2.0, maxinterval=60.0, untilfinal=False,
+                       clock=time.time, sleep=time.sleep):
+        '''
+        :param List str names: Requests to watch. If None, all requests matching owner
+                               and project are watched, including ones created later;
+                               those are found by a listing made at least every
+                               maxinterval seconds.
+        :param float mininterval: Seconds between polls of a changing request.
+        :param float maxinterval: Longest interval for a request in a stable state.
+        :param Boolean untilfinal: Stop once every watched request is terminated, failed
+                                   or deleted.
+        '''
+        self.log = logging.getLogger('vc3client')
+        self.capi = capi
+        self.names = list(names) if names is not None else None
+        self.owner = owner
+        self.project = project
+        self.mininterval = mininterval
+        self.maxinterval = maxinterval
+        self.untilfinal = untilfinal
+        self.clock = clock
+        self.sleep = sleep
+        self.polls = 0
+        self._known = {}       # name -> (state, state_reason)
+        self._interval = {}    # name -> current polling interval
+        self._due = {}         # name -> time of next poll
+        self._nextlisting = 0
+        for name in self.names or []:
+            self._due[name] = 0
+
+    def _selected(self, r):
+        if self.names is not None:
+            return r.name in self._due
+        if self.owner is not None and r.owner != self.owner:
+            return False
+        if self.project is not None and r.project != self.project:
+            return False
+        return True
+
+    def _fetch(self, due, listing):
+        '''
+        Returns (found, missing): dict name -> request of polled requests, and names of
+        watched requests that no longer exist, or no longer match owner and project.
+
+        :param Boolean listing: List all requests, rather than fetch those due by name.
+        '''
+        self.polls += 1
+        if not listing:
+            # Straight to the infoservice: cached copies would hide transitions.
+            outcomes = self.capi._parallel(lambda n: self.capi.ic.getentity(Request, n), due)
+            found = {}
+            missing = []
+            for (name, (r, e)) in zip(due, outcomes):
+                if r is not None and self._selected(r):
+                    found[name] = r
+                elif e is None or isinstance(e, InfoEntityMissingException):
+                    missing.append(name)
+                else:
+                    self.log.warning("Could not poll request %s: %s", name, e)
+            return (found, missing)
+
+        found = {}
+        for r in self.capi._iterentities(Request, FIELDS, fresh=True):
+            if self._selected(r):
+                found[r.name] = r
+        missing = [ n for n in self._due.keys() if n not in found ]
+        return (found, missing)
+
+    def _schedule(self, name, state, changed, now):
+        if changed or (state is not None and state not in STABLE_STATES):
+            interval = self.mininterval
+        else:
+            interval = min(self._interval.get(name, self.mininterval) * 2, self.maxinterval)
+        self._interval[name] = interval
+        self._due[name] = now + interval
+
+    def _event(self, name, now, state, reason, previous):
+        event = { 'time' : now,
+                  'request' : name,
+                  'state' : state,
+                  'state_reason' : reason,
+                  }
+        if previous is not None:
+            event['previous_state'] = previous[0]
+            event['previous_state_reason'] = previous[1]
+        return event
+
+    def _done(self):
+        if not self.untilfinal or not self._known:
+            return False
+        if [ n for n in self._due.keys() if n not in self._known ]:
+            return False
+        return not [ s for (s, r) in self._known.values() if s is not None and s not in FINAL_STATES ]
+
+    def events(self):
+        '''
+        Generator of state transitions, as dictionaries with time, request, state,
+        state_reason and, after the first observation of a request, previous_state and
+        previous_state_reason. A deleted request is reported once with state None.
+        '''
+        while True:
+            now = self.clock()
+            due = sorted([ n for (n, t) in self._due.items() if t <= now ])
+            # Requests created since the last listing are found by the next one.
+            listing = len(due) > self.capi.maxworkers or (self.names is None and now >= self._nextlisting)
+            if due or listing:
+                (found, missing) = self._fetch(due, listing)
+                now = self.clock()
+                if listing and self.names is None:
+                    self._nextlisting = now + self.maxinterval
+                for (name, r) in sorted(found.items()):
+                    current = (r.state, r.state_reason)
+                    previous = self._known.get(name)
+                    changed = previous != current
+                    if changed:
+                        self._known[name] = current
+                        yield self._event(name, now, r.state, r.state_reason, previous)
+                    self._schedule(name, r.state, changed, now)
+                for name in sorted(missing):
+                    previous = self._known.get(name)
+                    if previous is None or previous[0] is not None:
+                        yield self._event(name, now, None, None, previous)
+                    if self.names is None:
+                        # Left the selection: stop watching it.
+                        for d in (self._due, self._interval, self._known):
+                            d.pop(name, None)
+                    else:
+                        self._known[name] = (None, None)
+                        self._schedule(name, None, False, now)
+                if self._done():
+                    return
+
+            wakeup = min(self._due.values() or [ now + self.maxinterval ])
+            if self.names is None:
+                wakeup = min(wakeup, self._nextlisting)
+            wait = wakeup - self.clock()
+            if wait > 0:
+                self.sleep(wait)